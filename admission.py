@@ -0,0 +1,141 @@
+import functools
+import math
+import os
+import threading
+from collections import deque
+
+# Separate limits for CPU-bound tracing and for explanations, which mostly wait on the LLM,
+# so a burst of slow explanations cannot take the threads tracing needs, and the reverse.
+# Twice the cores: enough to keep the sandbox pool busy while finished traces are encoded.
+TRACE_CONCURRENCY = int(os.environ.get("TRACE_CONCURRENCY", 2 * (os.cpu_count() or 1)))
+TRACE_QUEUE = int(os.environ.get("TRACE_QUEUE", 4 * TRACE_CONCURRENCY))
+EXPLAIN_CONCURRENCY = int(os.environ.get("EXPLAIN_CONCURRENCY", 64))
+EXPLAIN_QUEUE = int(os.environ.get("EXPLAIN_QUEUE", 256))
+# Longest a request waits for a slot before it is turned away.
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 10))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, gate: str, retry_after: int):
+        super().__init__(f"too many {gate} requests")
+        self.gate = gate
+        self.retry_after = retry_after
+
+
+def _grant(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Gate:
+    # At most `concurrency` requests run; up to `queue_limit` more wait, each for at most
+    # `timeout` seconds. Anything beyond that is rejected at once, with a Retry-After
+    # estimated from the recent service time, so clients back off instead of piling up.
+    # Waiters are served in arrival order; a freed slot is handed straight to the first.
+    # WSGI handlers wait in acquire(), async handlers in acquire_async(), which holds no
+    # thread while queued.
+
+    def __init__(self, name: str, concurrency: int, queue_limit: int, timeout: float = QUEUE_TIMEOUT):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.running = 0
+        self.rejected = 0
+        # Exponentially weighted mean of how long an admitted request holds its slot.
+        self.service_time = 0.0
+        # Callables that hand a slot to a queued request.
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        # Time for the current queue to drain, as a whole number of seconds (at least 1).
+        backlog = (self.waiting + 1) / max(self.concurrency, 1)
+        return max(1, math.ceil(backlog * self.service_time))
+
+    def _enter(self, waiter) -> bool:
+        # With the lock held: True when a slot was free, False once queued.
+        if self.running < self.concurrency and not self._waiters:
+            self.running += 1
+            return True
+        if len(self._waiters) >= self.queue_limit:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+        self._waiters.append(waiter)
+        return False
+
+    def _leave(self, waiter) -> bool:
+        # With the lock held, for a waiter that stops waiting: False if it was handed a slot
+        # in the meantime.
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return False
+        return True
+
+    def _pass_on(self) -> None:
+        # With the lock held: a freed slot goes to the longest waiting request, if any.
+        if self._waiters:
+            self._waiters.popleft()()
+        else:
+            self.running -= 1
+
+    def acquire(self) -> None:
+        granted = threading.Event()
+        waiter = granted.set
+        with self._lock:
+            if self._enter(waiter):
+                return
+        if granted.wait(self.timeout):
+            return
+        with self._lock:
+            if self._leave(waiter):
+                self.rejected += 1
+                raise AdmissionRejected(self.name, self.retry_after())
+
+    async def acquire_async(self) -> None:
+        # Imported here so workers that only serve WSGI requests never load asyncio.
+        import asyncio
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        waiter = functools.partial(loop.call_soon_threadsafe, _grant, granted)
+        with self._lock:
+            if self._enter(waiter):
+                return
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if self._leave(waiter):
+                    self.rejected += 1
+                    raise AdmissionRejected(self.name, self.retry_after()) from None
+        except asyncio.CancelledError:
+            with self._lock:
+                if not self._leave(waiter):
+                    # The slot arrived as the request was cancelled; hand it on.
+                    self._pass_on()
+            raise
+
+    def release(self, held: float) -> None:
+        with self._lock:
+            self.service_time = held if not self.service_time else 0.8 * self.service_time + 0.2 * held
+            self._pass_on()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "service_time_ms": round(self.service_time * 1000, 1),
+            }
+
+
+gates = {
+    "trace": Gate("trace", TRACE_CONCURRENCY, TRACE_QUEUE),
+    "explain": Gate("explain", EXPLAIN_CONCURRENCY, EXPLAIN_QUEUE),
+}
@@ -1,13 +1,322 @@
-import json
+import hashlib
 import os
-from flask import Flask, render_template, request, jsonify
+import time
+from dotenv import load_dotenv
+from flask import Flask, Response, g, render_template, request, jsonify
 
-from sandbox import execute_sandboxed
-from explainer import explain_trace, get_example_prompt
+# Before the imports below: modules read their settings from the environment at import.
+load_dotenv()
+
+import backends
+import metrics
+from admission import AdmissionRejected, gates
+from responses import JSONProvider, compress_response, encode_event, event_stream, matching_etag
+from sandbox import TRANSIENT_ERROR_TYPES
+from sandbox_pool import BATCH_MAX_ITEMS, SandboxPoolBusy, execute_batch, execute_pooled, stream_pooled
+from explanation_cache import ExplanationCache
+from keyframes import KeyframeCache, KeyframeTrace
+from trace_cache import TraceCache, cache_key
+from trace_store import TraceStore, is_trace_id
+from tracer import RETURN_HANDLE, ExecutionTracer, expand_heap_trace
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 
 MAX_CODE_LENGTH = 5000
+MAX_WINDOW_STEPS = 500
+MAX_HANDLE_LENGTH = 64
+# Stored trace windows never change under their ID.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Admission gate per endpoint: tracing is CPU work, explaining is mostly waiting on the LLM.
+ENDPOINT_GATES = {
+    "api_trace": "trace",
+    "api_trace_stream": "trace",
+    "api_trace_window": "trace",
+    "api_trace_batch": "trace",
+    "api_trace_expand": "trace",
+    "api_explain": "explain",
+    "api_explain_stream": "explain",
+}
+
+trace_cache = TraceCache()
+explanation_cache = ExplanationCache()
+keyframe_traces = KeyframeCache()
+trace_store = TraceStore()
+
+
+def _json_response(payload: dict):
+    with metrics.phase("jsonify"):
+        response = jsonify(payload)
+    metrics.count("response_bytes", response.content_length or 0)
+    return response
+
+
+@app.before_request
+def start_metrics():
+    metrics.start()
+
+
+@app.before_request
+def admit():
+    gate = gates.get(ENDPOINT_GATES.get(request.endpoint))
+    if gate is None:
+        return
+    with metrics.phase("admission"):
+        gate.acquire()
+    g.admitted = (gate, time.perf_counter())
+
+
+@app.after_request
+def hold_admission_while_streaming(response):
+    # A streamed body is produced after the request context ends; keep its slot until then.
+    if response.is_streamed and "admitted" in g:
+        gate, started = g.pop("admitted")
+        response.call_on_close(lambda: gate.release(time.perf_counter() - started))
+    return response
+
+
+@app.teardown_request
+def release_admission(exc):
+    admitted = g.pop("admitted", None)
+    if admitted is not None:
+        gate, started = admitted
+        gate.release(time.perf_counter() - started)
+
+
+@app.after_request
+def finish_metrics(response):
+    recorder = metrics.current()
+    if recorder is None:
+        return response
+    endpoint = request.endpoint or "unknown"
+    response.headers["Server-Timing"] = recorder.server_timing()
+    if response.is_streamed:
+        # Streaming bodies are produced after this hook; record once they are sent.
+        response.call_on_close(lambda: metrics.observe(endpoint, recorder))
+    else:
+        metrics.observe(endpoint, recorder)
+    return response
+
+
+# Registered after finish_metrics so that it runs first and its time is reported.
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
+
+
+def _read_code(data) -> tuple[str | None, str | None]:
+    if not data or "code" not in data:
+        return None, "Missing 'code' field in request body"
+
+    code = data["code"].strip()
+    if not code:
+        return None, "Code cannot be empty"
+
+    if len(code) > MAX_CODE_LENGTH:
+        return None, f"Code exceeds maximum length of {MAX_CODE_LENGTH} characters"
+
+    return code, None
+
+
+def _read_tracer_options(data: dict) -> tuple[dict | None, str | None]:
+    options = {}
+    trace_format = data.get("format", "inline")
+    if trace_format not in ExecutionTracer.TRACE_FORMATS:
+        return None, "format must be 'inline' or 'heap'"
+    if trace_format != "inline":
+        options["trace_format"] = trace_format
+
+    if data.get("sampling"):
+        options["sampling"] = True
+    if data.get("profile"):
+        options["profile"] = True
+    budget = data.get("budget")
+    if budget is not None:
+        if type(budget) is not int or not 1 <= budget <= ExecutionTracer.MAX_BUDGET:
+            return None, f"budget must be an integer between 1 and {ExecutionTracer.MAX_BUDGET}"
+        options["budget"] = budget
+    return options or None, None
+
+
+def _read_explain_tracer_options(data: dict) -> tuple[dict | None, str | None]:
+    tracer_options, error = _read_tracer_options(data)
+    if tracer_options and "trace_format" in tracer_options:
+        return None, "explanations require the inline trace format"
+    if tracer_options and "profile" in tracer_options:
+        return None, "explanations need a step trace; profiles are added for the advanced depth"
+    return tracer_options, error
+
+
+def _trace_events(code: str, messages, sse: bool, writer):
+    # Steps go to the store as they are sent; a stream cut short leaves nothing behind.
+    yield encode_event("start", {"type": "start", "source_lines": code.splitlines()}, sse)
+    with writer:
+        for kind, payload in messages:
+            if kind == "step":
+                writer.add(payload)
+                yield encode_event("step", {"type": "step", "step": payload}, sse)
+            elif kind == "done":
+                summary = {k: v for k, v in payload.items() if k not in ("steps", "source", "source_lines")}
+                summary["trace_id"] = writer.finish(payload)
+                yield encode_event("end", dict(summary, type="end"), sse)
+
+
+def _read_batch(data) -> tuple[list[str] | None, str | None]:
+    codes = (data or {}).get("codes")
+    if not isinstance(codes, list) or not codes:
+        return None, "Missing 'codes' list in request body"
+    if len(codes) > BATCH_MAX_ITEMS:
+        return None, f"Batch exceeds maximum of {BATCH_MAX_ITEMS} items"
+
+    sources = []
+    for index, item in enumerate(codes):
+        code, error = _read_code({"code": item} if isinstance(item, str) else None)
+        if error:
+            return None, f"Item {index}: {error}"
+        sources.append(code)
+    return sources, None
+
+
+def _batch_events(sources: list[str], results, sse: bool):
+    yield encode_event("start", {"type": "start", "count": len(sources), "unique": len(set(sources))}, sse)
+    for index, trace in results:
+        yield encode_event("result", {"type": "result", "index": index, "trace": trace}, sse)
+    yield encode_event("end", {"type": "end"}, sse)
+
+
+def _run_trace(code: str, data: dict, tracer_options: dict | None = None) -> dict:
+    return trace_cache.get_or_run(
+        code,
+        execute_pooled,
+        tracer_options=tracer_options,
+        use_cache=data.get("cache", True) is not False,
+    )
+
+
+def _transient(trace: dict) -> bool:
+    return (trace.get("error") or {}).get("type") in TRANSIENT_ERROR_TYPES
+
+
+def _source_key(code: str, data: dict, tracer_options: dict | None, trace: dict | None = None) -> str | None:
+    # Names the stored trace of a program whose trace is the same on every run, as the
+    # trace cache assumes, so the store can skip hashing and writing it again.
+    if data.get("cache", True) is False or (trace and _transient(trace)):
+        return None
+    key = cache_key(code, tracer_options=tracer_options)
+    if key is None:
+        return None
+    return hashlib.sha256(f"{key}:{code}".encode("utf-8")).hexdigest()
+
+
+def _keyframe_trace(code: str, data: dict, tracer_options: dict | None) -> KeyframeTrace:
+    key = cache_key(code, tracer_options=tracer_options) if data.get("cache", True) is not False else None
+    trace = keyframe_traces.get(key) if key is not None else None
+    if trace is None:
+        result = _run_trace(code, data, tracer_options)
+        trace = KeyframeTrace.from_trace(expand_heap_trace(result))
+        if key is not None and not _transient(result):
+            keyframe_traces.put(key, trace)
+    return trace
+
+
+def _read_explain_trace(data: dict, depth: str) -> tuple[dict | None, str | None, int]:
+    # Explanations run on a stored trace when given its ID, otherwise on a fresh trace of "code".
+    if data and "trace_id" in data:
+        if not is_trace_id(data["trace_id"]):
+            return None, "trace_id is not a valid trace ID", 400
+        trace = trace_store.load(data["trace_id"])
+        if trace is None:
+            return None, "Trace not found", 404
+        if depth == "advanced":
+            trace = _with_profile(trace, data)
+        return trace, None, 200
+
+    code, error = _read_code(data)
+    if error:
+        return None, error, 400
+    tracer_options, error = _read_explain_tracer_options(data)
+    if error:
+        return None, error, 400
+    if depth == "advanced":
+        # Advanced explanations discuss performance, so the run is profiled as it is traced.
+        tracer_options = dict(tracer_options or {}, with_profile=True)
+    return _run_trace(code, data, tracer_options), None, 200
+
+
+def _with_profile(trace: dict, data: dict) -> dict:
+    # A stored trace has no run to profile alongside, so its program is profiled on its own.
+    if "profile" in trace or not trace["steps"]:
+        return trace
+    profiled = _run_trace(trace["source"], data, {"profile": True})
+    if "profile" not in profiled:
+        return trace
+    return dict(trace, profile=profiled["profile"])
+
+
+def _read_window(data: dict) -> tuple[int | None, int | None, str | None]:
+    start = data.get("start", 0)
+    count = data.get("count", 100)
+    if type(start) is not int or start < 0:
+        return None, None, "start must be a non-negative integer"
+    if type(count) is not int or not 1 <= count <= MAX_WINDOW_STEPS:
+        return None, None, f"count must be an integer between 1 and {MAX_WINDOW_STEPS}"
+    return start, count, None
+
+
+def _read_expand_source(data) -> tuple[str | None, str | None, int]:
+    # Values are expanded by re-running the program: its code, or the source of a stored trace.
+    if data and "trace_id" in data:
+        if not is_trace_id(data["trace_id"]):
+            return None, "trace_id is not a valid trace ID", 400
+        summary = trace_store.window(data["trace_id"], 0, 0)
+        if summary is None:
+            return None, "Trace not found", 404
+        return summary["source"], None, 200
+    code, error = _read_code(data)
+    return code, error, 400 if error else 200
+
+
+def _read_handle(data: dict) -> tuple[int | None, list | None, str | None]:
+    step = data.get("step")
+    if type(step) is not int or step < 1:
+        return None, None, "step must be a positive integer"
+    handle = data.get("handle")
+    if (
+        not isinstance(handle, list)
+        or not 1 <= len(handle) <= MAX_HANDLE_LENGTH
+        or not isinstance(handle[0], str)
+        or not all(type(key) in (str, int) for key in handle[1:])
+    ):
+        return None, None, (
+            f"handle must be a variable name (or {RETURN_HANDLE!r}) followed by up to "
+            f"{MAX_HANDLE_LENGTH - 1} indices or keys"
+        )
+    return step, handle, None
+
+
+def _explain_views():
+    # Imported on the first explanation, so the LLM client, scheduler and event loop stay
+    # out of workers that only trace code.
+    import explain_views
+    return explain_views
+
+
+def _read_explain_request(data) -> tuple[str | None, str | None]:
+    # Also sets the LLM priority for the calls made on behalf of this request.
+    depth = (data or {}).get("depth", "intermediate")
+    if depth not in ("beginner", "intermediate", "advanced"):
+        return None, "depth must be 'beginner', 'intermediate', or 'advanced'"
+
+    priority = (data or {}).get("priority", "interactive")
+    if priority not in backends.PRIORITIES:
+        return None, "priority must be 'interactive' or 'batch'"
+    backends.priority.set(backends.PRIORITIES[priority])
+    return depth, None
+
+
+def _admin_authorized() -> bool:
+    token = os.environ.get("ADMIN_TOKEN")
+    return bool(token) and request.headers.get("X-Admin-Token") == token
 
 
 @app.route("/")
@@ -18,68 +327,201 @@ def index():
 @app.route("/api/trace", methods=["POST"])
 def api_trace():
     data = request.get_json()
-    if not data or "code" not in data:
-        return jsonify({"error": "Missing 'code' field in request body"}), 400
+    code, error = _read_code(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    code = data["code"].strip()
-    if not code:
-        return jsonify({"error": "Code cannot be empty"}), 400
+    tracer_options, error = _read_tracer_options(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    if len(code) > MAX_CODE_LENGTH:
-        return jsonify({"error": f"Code exceeds maximum length of {MAX_CODE_LENGTH} characters"}), 400
+    trace = _run_trace(code, data, tracer_options)
+    trace_id = trace_store.put(trace, _source_key(code, data, tracer_options, trace))
+    return _json_response(dict(trace, trace_id=trace_id))
+
+
+@app.route("/api/trace/<trace_id>", methods=["GET"])
+def api_trace_get(trace_id):
+    if not is_trace_id(trace_id):
+        return jsonify({"error": "Not found"}), 404
+
+    try:
+        start = int(request.args.get("from", 0))
+        stop = int(request.args.get("to", start + 100))
+    except ValueError:
+        return jsonify({"error": "from and to must be integers"}), 400
+    if start < 0 or not 0 < stop - start <= MAX_WINDOW_STEPS:
+        return jsonify({"error": f"from/to must select between 1 and {MAX_WINDOW_STEPS} steps"}), 400
+
+    # A held ETag only counts while the trace is still stored.
+    if not trace_store.exists(trace_id):
+        return jsonify({"error": "Trace not found"}), 404
+    etag = f"{trace_id}.{start}.{stop}"
+    held = matching_etag(request.if_none_match, etag)
+    if held is not None:
+        response = Response(status=304)
+        response.set_etag(held)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    trace = trace_store.window(trace_id, start, stop)
+    if trace is None:
+        return jsonify({"error": "Trace not found"}), 404
+    response = _json_response(dict(trace, trace_id=trace_id, start=start))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
 
-    trace = execute_sandboxed(code)
-    return jsonify(trace)
+
+@app.route("/api/trace/stream", methods=["POST"])
+def api_trace_stream():
+    data = request.get_json()
+    code, error = _read_code(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    tracer_options, error = _read_tracer_options(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    cached = None
+    if data.get("cache", True) is not False:
+        cached = trace_cache.lookup(code, tracer_options=tracer_options)
+    if cached is not None:
+        messages = [("step", step) for step in cached["steps"]]
+        messages.append(("done", dict(cached, steps=[])))
+    else:
+        messages = stream_pooled(code, tracer_options=tracer_options)
+
+    heap = (tracer_options or {}).get("trace_format") == "heap"
+    writer = trace_store.writer(heap, _source_key(code, data, tracer_options) if cached is not None else None)
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+    return event_stream(_trace_events(code, messages, sse, writer), sse)
+
+
+@app.route("/api/trace/window", methods=["POST"])
+def api_trace_window():
+    data = request.get_json()
+    code, error = _read_code(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    tracer_options, error = _read_tracer_options(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    start, count, error = _read_window(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    trace = _keyframe_trace(code, data, tracer_options)
+    with metrics.phase("replay"):
+        steps = trace.window(start, start + count)
+    summary = {k: v for k, v in trace.summary.items() if k not in ("source", "source_lines")}
+    return _json_response(dict(summary, steps=steps, start=start, total=len(trace)))
+
+
+@app.route("/api/trace/batch", methods=["POST"])
+def api_trace_batch():
+    data = request.get_json()
+    sources, error = _read_batch(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    tracer_options, error = _read_tracer_options(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    cache = trace_cache if data.get("cache", True) is not False else None
+    results = execute_batch(sources, tracer_options=tracer_options, cache=cache)
+
+    if not data.get("stream"):
+        traces = [None] * len(sources)
+        for index, trace in results:
+            traces[index] = trace
+        return _json_response({"results": traces, "unique": len(set(sources))})
+
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+    return event_stream(_batch_events(sources, results, sse), sse)
+
+
+@app.route("/api/trace/expand", methods=["POST"])
+def api_trace_expand():
+    data = request.get_json()
+    code, error, status = _read_expand_source(data)
+    if error:
+        return jsonify({"error": error}), status
+
+    step, handle, error = _read_handle(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    with metrics.phase("expand"):
+        trace = _run_trace(code, data, {"inspect": [step, handle]})
+    if trace.get("inspected") is None:
+        return jsonify({"error": f"No value at {handle} in step {step}"}), 404
+    return _json_response({"step": step, "handle": handle, "value": trace["inspected"]})
 
 
 @app.route("/api/explain", methods=["POST"])
 def api_explain():
     data = request.get_json()
-    if not data or "code" not in data:
-        return jsonify({"error": "Missing 'code' field in request body"}), 400
+    depth, error = _read_explain_request(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    code = data["code"].strip()
-    if not code:
-        return jsonify({"error": "Code cannot be empty"}), 400
+    trace, error, status = _read_explain_trace(data, depth)
+    if error:
+        return jsonify({"error": error}), status
 
-    if len(code) > MAX_CODE_LENGTH:
-        return jsonify({"error": f"Code exceeds maximum length of {MAX_CODE_LENGTH} characters"}), 400
+    return _json_response(_explain_views().explanation(explanation_cache, trace, depth))
 
-    depth = data.get("depth", "intermediate")
-    if depth not in ("beginner", "intermediate", "advanced"):
-        return jsonify({"error": "depth must be 'beginner', 'intermediate', or 'advanced'"}), 400
-
-    trace = execute_sandboxed(code)
-
-    explanation = None
-    prompt_preview = None
-    error_msg = None
-
-    if trace["steps"]:
-        prompt_preview = get_example_prompt(trace, depth)
-        try:
-            explanation = explain_trace(trace, depth=depth)
-        except ValueError as e:
-            error_msg = str(e)
-        except RuntimeError as e:
-            error_msg = f"AI explanation failed: {e}"
-    elif trace.get("error"):
-        prompt_preview = get_example_prompt(trace, depth)
-        try:
-            explanation = explain_trace(trace, depth=depth)
-        except Exception as e:
-            error_msg = f"AI explanation failed: {e}"
-
-    response = {
-        "trace": trace,
-        "explanation": explanation,
-        "prompt_preview": prompt_preview,
-    }
-
-    if error_msg:
-        response["ai_error"] = error_msg
-
-    return jsonify(response)
+
+@app.route("/api/explain/stream", methods=["POST"])
+def api_explain_stream():
+    data = request.get_json()
+    depth, error = _read_explain_request(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    trace, error, status = _read_explain_trace(data, depth)
+    if error:
+        return jsonify({"error": error}), status
+
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+    return event_stream(_explain_views().explanation_events(explanation_cache, trace, depth, sse), sse)
+
+
+@app.route("/api/admin/explanation-cache", methods=["GET", "DELETE"])
+def api_admin_explanation_cache():
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+
+    if request.method == "DELETE":
+        expired_only = request.args.get("expired") == "1"
+        removed = explanation_cache.purge(expired_only=expired_only)
+        return jsonify({"removed": removed})
+
+    return jsonify(explanation_cache.stats())
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.errorhandler(SandboxPoolBusy)
+def sandbox_busy(e):
+    response = jsonify({"error": f"Server is busy, try again shortly ({e})"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    response = jsonify({"error": f"Server is busy, try again shortly ({e})"})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
 
 
 @app.errorhandler(500)
@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wrappers import Response
+
+import app
+import explain_views
+import metrics
+from admission import TRACE_CONCURRENCY, TRACE_QUEUE, AdmissionRejected, gates
+from responses import compress_response, dumps, event_stream
+from sandbox_pool import MAX_QUEUED, POOL_SIZE, SandboxPoolBusy
+
+# ASGI entry point, served by serve.py. The explain endpoints are handled here on the event
+# loop: queued requests and model calls hold no thread, and only the trace they need waits
+# in a thread for the sandbox pool. Every other route runs the Flask app on a2wsgi's threads;
+# tracing is CPU work bounded by its gate, so a thread per admitted or queued trace is enough.
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", TRACE_CONCURRENCY + TRACE_QUEUE + 8))
+# Waiting on the sandbox pool, which runs or queues at most this many traces at a time.
+SANDBOX_THREADS = POOL_SIZE + MAX_QUEUED
+
+_wsgi = WSGIMiddleware(app.app, workers=WSGI_THREADS)
+_sandbox_threads = ThreadPoolExecutor(SANDBOX_THREADS, thread_name_prefix="sandbox-wait")
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _json(payload: dict, status: int = 200) -> Response:
+    with metrics.phase("jsonify"):
+        response = Response(dumps(payload) + "\n", status=status, mimetype="application/json")
+    metrics.count("response_bytes", response.content_length or 0)
+    return response
+
+
+def _busy(e: Exception, retry_after: int) -> Response:
+    response = _json({"error": f"Server is busy, try again shortly ({e})"}, 503)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def _in_sandbox_thread(fn, *args):
+    # Like asyncio.to_thread, but on the threads reserved for sandbox waits, so a full pool
+    # queue cannot hold up the cache lookups of other requests.
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return asyncio.get_running_loop().run_in_executor(_sandbox_threads, call)
+
+
+async def _read_json(receive, headers: Headers):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    if headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+        raise _BadRequest(415, "Request body must be JSON")
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise _BadRequest(400, "Request body is not valid JSON") from None
+
+
+async def api_explain(trace: dict, depth: str, headers: Headers) -> Response:
+    return _json(await explain_views.explanation_async(app.explanation_cache, trace, depth))
+
+
+async def api_explain_stream(trace: dict, depth: str, headers: Headers) -> Response:
+    sse = "text/event-stream" in headers.get("Accept", "")
+    return event_stream(explain_views.explanation_events_async(app.explanation_cache, trace, depth, sse), sse)
+
+
+ROUTES = {
+    "/api/explain": api_explain,
+    "/api/explain/stream": api_explain_stream,
+}
+
+
+async def _handle(view, receive, headers: Headers) -> Response:
+    data = await _read_json(receive, headers)
+    depth, error = app._read_explain_request(data)
+    if error:
+        return _json({"error": error}, 400)
+
+    trace, error, status = await _in_sandbox_thread(app._read_explain_trace, data, depth)
+    if error:
+        return _json({"error": error}, status)
+    return await view(trace, depth, headers)
+
+
+async def _send_body(send, body, receive) -> None:
+    # Streams the body until it ends or the client goes away, whichever comes first.
+    async def pump():
+        async for chunk in body:
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    sending = asyncio.ensure_future(pump())
+    watching = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait((sending, watching), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watching.cancel()
+        sending.cancel()
+        await asyncio.gather(sending, watching, return_exceptions=True)
+        await body.aclose()
+    if not sending.cancelled() and sending.exception() is not None:
+        raise sending.exception()
+
+
+async def _respond(send, receive, response: Response, recorder, endpoint: str) -> None:
+    if recorder is not None:
+        response.headers["Server-Timing"] = recorder.server_timing()
+    head = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": head})
+    if response.is_streamed:
+        await _send_body(send, response.response, receive)
+    else:
+        await send({"type": "http.response.body", "body": response.get_data()})
+    if recorder is not None:
+        metrics.observe(endpoint, recorder)
+
+
+async def _explain_endpoint(scope, receive, send, view) -> None:
+    recorder = metrics.start()
+    headers = Headers([(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]])
+    gate = gates["explain"]
+    admitted = None
+    try:
+        try:
+            with metrics.phase("admission"):
+                await gate.acquire_async()
+            admitted = time.perf_counter()
+            response = await _handle(view, receive, headers)
+        except ConnectionError:
+            return
+        except _BadRequest as e:
+            response = _json({"error": str(e)}, e.status)
+        except AdmissionRejected as e:
+            response = _busy(e, e.retry_after)
+        except SandboxPoolBusy as e:
+            response = _busy(e, 1)
+        except Exception:
+            app.app.logger.exception("Exception on %s [POST]", scope["path"])
+            response = _json({"error": "Internal server error"}, 500)
+
+        response = compress_response(response, parse_accept_header(headers.get("Accept-Encoding")))
+        # Streamed responses keep their slot until the stream ends, as under WSGI.
+        await _respond(send, receive, response, recorder, view.__name__)
+    finally:
+        if admitted is not None:
+            gate.release(time.perf_counter() - admitted)
+
+
+async def application(scope, receive, send) -> None:
+    view = ROUTES.get(scope.get("path")) if scope["type"] == "http" else None
+    if view is None or scope["method"] != "POST":
+        await _wsgi(scope, receive, send)
+        return
+    await _explain_endpoint(scope, receive, send, view)
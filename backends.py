@@ -0,0 +1,44 @@
+import contextvars
+import importlib
+import os
+
+# Explanation backends by name: the factory that returns one, as "module:attribute", and the
+# model it answers as. Provider modules are imported on first use, so a worker that only
+# traces code never loads an LLM client. Factories are called on every use and keep their
+# own per-process instances.
+BACKENDS: dict[str, tuple[str, str]] = {
+    "gemini": ("llm_client:gemini_backend", "gemini-2.0-flash"),
+    # Deterministic, offline answers built from the prompt; for tests and benchmarks.
+    "local": ("local_backend:local_backend", "local-deterministic"),
+}
+DEFAULT_BACKEND = "gemini"
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+# Set by the request handler; LLM calls made on its behalf inherit it.
+priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def register_backend(name: str, factory: str, model: str) -> None:
+    BACKENDS[name] = (factory, model)
+
+
+def backend_name() -> str:
+    name = os.getenv("EXPLAIN_BACKEND", DEFAULT_BACKEND)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown EXPLAIN_BACKEND {name!r}; choose one of: {', '.join(sorted(BACKENDS))}")
+    return name
+
+
+def model_name() -> str:
+    # The configured backend's model, without loading it (explanation cache keys need it).
+    return BACKENDS[backend_name()][1]
+
+
+def get_backend():
+    # Returns an llm_runtime.LLMBackend; this is the only place a provider module is loaded.
+    factory, model = BACKENDS[backend_name()]
+    module, _, attribute = factory.partition(":")
+    return getattr(importlib.import_module(module), attribute)(model)
@@ -0,0 +1,72 @@
+import argparse
+import os
+import time
+
+from sandbox_pool import SandboxPool, execute_batch
+
+# Stand-ins for autograded submissions: the same exercise solved with small variations,
+# so most sources are distinct but a share are exact duplicates.
+TEMPLATE = """def fizzbuzz(n):
+    out = []
+    for i in range(1, n + 1):
+        if i % 15 == 0:
+            out.append("FizzBuzz")
+        elif i % 3 == 0:
+            out.append("Fizz")
+        elif i % {mod} == 0:
+            out.append("Buzz")
+        else:
+            out.append(i)
+    return out
+
+result = fizzbuzz({n})
+"""
+
+
+def _submissions(count: int, duplicate_every: int) -> list[str]:
+    sources = []
+    for i in range(count):
+        variant = 0 if duplicate_every and i % duplicate_every == 0 else i
+        sources.append(TEMPLATE.format(mod=5, n=10 + variant))
+    return sources
+
+
+def _worker_counts(limit: int) -> list[int]:
+    counts = [1]
+    while counts[-1] * 2 <= limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Batch trace throughput by sandbox worker count")
+    parser.add_argument("--submissions", type=int, default=200)
+    parser.add_argument("--duplicate-every", type=int, default=4, help="every Nth submission repeats the first (0 disables)")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    sources = _submissions(args.submissions, args.duplicate_every)
+    print(f"{len(sources)} submissions, {len(set(sources))} unique")
+    print(f"{'workers':>7} {'seconds':>8} {'subs/s':>8} {'speedup':>8}")
+
+    baseline = None
+    for workers in _worker_counts(args.max_workers):
+        pool = SandboxPool(size=workers, max_queued=0)
+        try:
+            # Warm every worker so process start-up is not part of the measurement.
+            list(execute_batch([f"x = {i}" for i in range(workers)], pool=pool))
+            start = time.perf_counter()
+            results = list(execute_batch(sources, pool=pool))
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.shutdown()
+        assert len(results) == len(sources)
+        rate = len(sources) / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>7} {elapsed:>8.2f} {rate:>8.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
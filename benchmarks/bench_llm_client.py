@@ -0,0 +1,57 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_llm_server import start_in_thread
+
+
+def _trace(i: int) -> dict:
+    return {
+        "source": f"x = {i}",
+        "source_lines": [f"x = {i}"],
+        "steps": [{
+            "step": 1, "event": "line", "line_number": 1, "source_line": f"x = {i}",
+            "variables": {}, "changes": {"created": {}, "updated": {}, "deleted": {}},
+        }],
+        "step_count": 1,
+        "completed": True,
+        "error": None,
+        "truncated": False,
+    }
+
+
+def _run(explain_trace, traces: list[dict], concurrency: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(explain_trace, traces))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Explainer throughput against a local fake LLM")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server = start_in_thread(latency=args.latency)
+    os.environ["GEMINI_API_BASE"] = server.base_url
+    os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+    from explainer import explain_trace
+
+    scenarios = {
+        "identical": [_trace(0)] * args.requests,
+        "distinct": [_trace(i + 1) for i in range(args.requests)],
+    }
+    print(f"{args.requests} requests, concurrency {args.concurrency}, upstream latency {args.latency}s")
+    print(f"{'scenario':<10} {'seconds':>8} {'req/s':>8} {'upstream calls':>15}")
+    for name, traces in scenarios.items():
+        before = server.requests
+        elapsed = _run(explain_trace, traces, args.concurrency)
+        print(f"{name:<10} {elapsed:>8.2f} {args.requests / elapsed:>8.1f} {server.requests - before:>15}")
+
+
+if __name__ == "__main__":
+    main()
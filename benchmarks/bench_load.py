@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_llm_server import start_in_thread
+
+TRACE_PROGRAM = "total = 0\nfor i in range(200):\n    total += i * i\n"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/metrics"):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("serve.py did not start")
+
+
+def _post(url: str, payload: dict) -> tuple[float, int]:
+    request = urllib.request.Request(url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        exc.read()
+        status = exc.code
+    return time.perf_counter() - start, status
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mixed trace/explain load against serve.py")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--explain-share", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--trace-concurrency", type=int)
+    parser.add_argument("--explain-concurrency", type=int)
+    args = parser.parse_args()
+
+    llm = start_in_thread(latency=args.llm_latency)
+    port = _free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(
+        os.environ,
+        GEMINI_API_BASE=llm.base_url,
+        GEMINI_API_KEY="offline",
+        EXPLAIN_BACKEND="gemini",
+        EXPLANATION_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "explanations.sqlite3"),
+        TRACE_STORE_DIR=tempfile.mkdtemp(),
+        # Explanations trace their code first; let the admission gates, not the sandbox queue, shed load.
+        SANDBOX_MAX_QUEUED=str(args.concurrency),
+        PYTHONWARNINGS="ignore",
+    )
+    if args.trace_concurrency:
+        env["TRACE_CONCURRENCY"] = str(args.trace_concurrency)
+    if args.explain_concurrency:
+        env["EXPLAIN_CONCURRENCY"] = str(args.explain_concurrency)
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+
+    # Every request carries a distinct program so neither cache can answer it.
+    rng = random.Random(0)
+    kinds = ["explain" if rng.random() < args.explain_share else "trace" for _ in range(args.requests)]
+
+    def one(i: int) -> tuple[str, float, int]:
+        code = TRACE_PROGRAM + f"_load_request = {i}\n"
+        if kinds[i] == "explain":
+            return kinds[i], *_post(base + "/api/explain", {"code": code, "cache": False})
+        return kinds[i], *_post(base + "/api/trace", {"code": code, "cache": False})
+
+    try:
+        _wait_until_up(base)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+        llm.shutdown()
+
+    print(f"{args.requests} requests ({args.explain_share:.0%} explain), concurrency {args.concurrency}, "
+          f"LLM latency {args.llm_latency}s: {args.requests / elapsed:.1f} req/s overall")
+    print(f"{'endpoint':<8} {'ok':>5} {'503':>5} {'other':>6} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind in ("trace", "explain"):
+        mine = [(latency, status) for k, latency, status in results if k == kind]
+        ok = [latency * 1000 for latency, status in mine if status == 200]
+        busy = sum(status == 503 for _, status in mine)
+        print(
+            f"{kind:<8} {len(ok):>5} {busy:>5} {len(mine) - len(ok) - busy:>6} {len(ok) / elapsed:>7.1f} "
+            f"{_percentile(ok, 0.5) if ok else 0:>8.0f} {_percentile(ok, 0.99) if ok else 0:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
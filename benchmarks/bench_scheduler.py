@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fake_llm_server import start_in_thread
+
+PROMPT = "--- Step 1 [line] Line 1 ---\nx = 1\n"
+
+
+async def _call(scheduler, client, prompt: str) -> tuple[bool, float]:
+    started = time.perf_counter()
+    try:
+        await scheduler.generate(client, prompt, max_output_tokens=256)
+    except Exception:
+        return False, time.perf_counter() - started
+    return True, time.perf_counter() - started
+
+
+async def _run(scheduler, client, requests: int) -> list[tuple[bool, float]]:
+    return await asyncio.gather(*(_call(scheduler, client, f"{PROMPT}# {i}") for i in range(requests)))
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LLM scheduler under injected 429s and latency spikes")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--spike-rate", type=float, default=0.05)
+    parser.add_argument("--spike-latency", type=float, default=2.0)
+    parser.add_argument("--hedge-after", type=float, default=0.3)
+    args = parser.parse_args()
+
+    server = start_in_thread(
+        latency=args.latency, error_rate=args.error_rate, retry_after=args.retry_after,
+        spike_rate=args.spike_rate, spike_latency=args.spike_latency,
+    )
+
+    # Imported after the fake server is up so GEMINI_API_BASE need not be set globally.
+    from llm_client import GeminiClient
+    from llm_runtime import get_loop, run_sync
+    from llm_scheduler import LLMScheduler
+
+    get_loop()
+    scenarios = {
+        "no retries": dict(max_retries=0, hedge_after=0),
+        "retries": dict(max_retries=4, hedge_after=0),
+        "retries+hedge": dict(max_retries=4, hedge_after=args.hedge_after),
+    }
+    print(f"{args.requests} requests, concurrency {args.concurrency}, latency {args.latency}s, "
+          f"{args.error_rate:.0%} 429s, {args.spike_rate:.0%} spikes of {args.spike_latency}s")
+    print(f"{'scenario':<14} {'success':>8} {'p50 ms':>8} {'p99 ms':>8} {'upstream':>9} {'retries':>8} {'hedges':>7}")
+    for name, options in scenarios.items():
+        client = GeminiClient("offline", "fake", server.base_url, pool_size=args.concurrency * 2)
+        scheduler = LLMScheduler(concurrency=args.concurrency, queue_limit=args.requests, **options)
+        before = server.requests
+        results = run_sync(_run(scheduler, client, args.requests))
+        latencies = [elapsed * 1000 for ok, elapsed in results if ok]
+        stats = scheduler.stats()
+        print(
+            f"{name:<14} {len(latencies) / len(results):>8.1%} {_percentile(latencies, 50):>8.0f} "
+            f"{_percentile(latencies, 99):>8.0f} {server.requests - before:>9} {stats['retries']:>8} {stats['hedges']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
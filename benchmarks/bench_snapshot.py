@@ -0,0 +1,76 @@
+import argparse
+import copy
+import time
+
+from tracer import ExecutionTracer, _snapshot_locals
+
+WORKLOADS = {
+    "bubblesort_5": """def bubble_sort(arr):
+    n = len(arr)
+    for i in range(n):
+        for j in range(0, n - i - 1):
+            if arr[j] > arr[j + 1]:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+data = [64, 34, 25, 12, 22]
+sorted_data = bubble_sort(data)
+""",
+    "bubblesort_40": """def bubble_sort(arr):
+    n = len(arr)
+    for i in range(n):
+        for j in range(0, n - i - 1):
+            if arr[j] > arr[j + 1]:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+data = [(i * 37) % 41 for i in range(40)]
+sorted_data = bubble_sort(data)
+""",
+    "nested_containers": """grid = [[0] * 20 for _ in range(20)]
+index = {}
+for i in range(20):
+    for j in range(20):
+        grid[i][j] = i * j
+        index[(i, j)] = grid[i][j]
+""",
+}
+
+
+class _LegacyRenderer:
+    # Reproduces the old per-step cost: full re-serialization followed by a deepcopy.
+    def snapshot(self, local_vars: dict) -> dict:
+        return copy.deepcopy(_snapshot_locals(local_vars))
+
+    def render(self, value):
+        return _snapshot_locals({"v": value}).get("v")
+
+
+def _run(source: str, legacy: bool) -> tuple[float, int]:
+    tracer = ExecutionTracer(source)
+    if legacy:
+        tracer.renderer = _LegacyRenderer()
+    start = time.perf_counter()
+    result = tracer.run()
+    return time.perf_counter() - start, result["step_count"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-step tracer overhead, legacy vs incremental snapshots")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'workload':<20} {'steps':>6} {'legacy us/step':>15} {'incremental us/step':>20} {'speedup':>8}")
+    for name, source in WORKLOADS.items():
+        timings = {}
+        for legacy in (True, False):
+            best = float("inf")
+            for _ in range(args.repeat):
+                elapsed, steps = _run(source, legacy)
+                best = min(best, elapsed)
+            timings[legacy] = best / max(steps, 1) * 1e6
+        print(f"{name:<20} {steps:>6} {timings[True]:>15.1f} {timings[False]:>20.1f} {timings[True] / timings[False]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
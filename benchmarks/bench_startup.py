@@ -0,0 +1,52 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter per sample: imports the app the way a web worker does, serves
+# one /api/trace request, and reports import time, RSS and whether the LLM stack was loaded.
+_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+rss_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+client = app.app.test_client()
+client.post("/api/trace", json={"code": "x = 1", "cache": False})
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "rss_import_kb": rss_import,
+    "rss_trace_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "llm_loaded": "llm_client" in sys.modules,
+    "asyncio_loaded": "asyncio" in sys.modules,
+}))
+"""
+
+
+def _sample(root: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=root, PYTHONWARNINGS="ignore")
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=root, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Web worker cold start: import time and RSS")
+    parser.add_argument("--samples", type=int, default=10)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = [_sample(root) for _ in range(args.samples)]
+    print(f"{args.samples} fresh interpreters, median of each")
+    print(f"  import app           {statistics.median(s['import_ms'] for s in samples):8.1f} ms")
+    print(f"  RSS after import     {statistics.median(s['rss_import_kb'] for s in samples) / 1024:8.1f} MB")
+    print(f"  RSS after /api/trace {statistics.median(s['rss_trace_kb'] for s in samples) / 1024:8.1f} MB")
+    print(f"  LLM client loaded    {any(s['llm_loaded'] for s in samples)!s:>8}")
+    print(f"  asyncio loaded       {any(s['asyncio_loaded'] for s in samples)!s:>8}")
+
+
+if __name__ == "__main__":
+    main()
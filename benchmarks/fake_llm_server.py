@@ -0,0 +1,154 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from local_backend import explanation_for
+
+# Stands in for the Gemini REST API (generateContent and streamGenerateContent?alt=sse)
+# so the explainer can be exercised offline, over real HTTP. Responses are the local
+# backend's deterministic explanation JSON, returned after a configurable latency. A share
+# of requests can be answered with 429 (quota exceeded), delayed by a latency spike, or cut
+# off part-way as if the output token limit had been reached.
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with server.lock:
+            server.requests += 1
+
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            time.sleep(server.latency / 10)
+            body = json.dumps({"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                         "status": "RESOURCE_EXHAUSTED"}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if server.retry_after is not None:
+                self.send_header("Retry-After", str(server.retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        latency = server.latency + random.uniform(0, server.jitter)
+        if random.random() < server.spike_rate:
+            latency += server.spike_latency
+        time.sleep(latency)
+
+        prompt = request["contents"][0]["parts"][0]["text"]
+        text = explanation_for(prompt)
+        finish_reason = "STOP"
+        if random.random() < server.truncate_rate:
+            with server.lock:
+                server.truncated += 1
+            text = text[:random.randint(len(text) // 4, len(text) - 1)]
+            finish_reason = "MAX_TOKENS"
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4}
+
+        if ":streamGenerateContent" not in self.path:
+            self._send_json(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": finish_reason}],
+                "usageMetadata": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [text[i:i + server.stream_chunk] for i in range(0, len(text), server.stream_chunk)]
+        for i, piece in enumerate(pieces):
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if i == len(pieces) - 1:
+                event["candidates"][0]["finishReason"] = finish_reason
+                event["usageMetadata"] = usage
+            data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(server.stream_interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.5, jitter: float = 0.0,
+                 stream_chunk: int = 64, stream_interval: float = 0.01,
+                 error_rate: float = 0.0, retry_after: float | None = None,
+                 spike_rate: float = 0.0, spike_latency: float = 0.0, truncate_rate: float = 0.0):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_chunk = stream_chunk
+        self.stream_interval = stream_interval
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.truncate_rate = truncate_rate
+        self.requests = 0
+        self.errors = 0
+        self.truncated = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on hedged or cancelled requests; that is not a server fault.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_in_thread(**options) -> FakeLLMServer:
+    server = FakeLLMServer(("127.0.0.1", 0), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini REST API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--spike-rate", type=float, default=0.0, help="share of requests delayed by --spike-latency")
+    parser.add_argument("--spike-latency", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="share of replies cut off part-way")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        ("127.0.0.1", args.port), latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, retry_after=args.retry_after,
+        spike_rate=args.spike_rate, spike_latency=args.spike_latency, truncate_rate=args.truncate_rate,
+    )
+    print(f"Fake LLM listening on {server.base_url}; set GEMINI_API_BASE to this URL")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Synthetic programs that stress one dimension of the tracer each.
+STRESS_PROGRAMS = {
+    "deep_recursion": """def depth(n):
+    if n == 0:
+        return 0
+    return 1 + depth(n - 1)
+
+result = depth(150)
+""",
+    "large_containers": """values = list(range(2000))
+index = {i: str(i) for i in range(500)}
+for i in range(50):
+    values[i] = values[i] * 2
+    index[i] = index[i] + "!"
+""",
+    "long_loop": """total = 0
+for i in range(20000):
+    if i % 3 == 0:
+        total += i
+    else:
+        total -= 1
+""",
+    "many_locals": "def wide():\n" + "".join(f"    v{i} = {i}\n" for i in range(150)) + "    return v0 + v149\n\nresult = wide()\n",
+}
+
+MODES = {"default": {}, "sampling": {"sampling": True}}
+
+
+def load_examples() -> dict[str, str]:
+    # The bundled examples live in the frontend; read them from there so they stay in sync.
+    script = (ROOT / "static" / "js" / "app.js").read_text()
+    block = script[script.index("const EXAMPLES"):script.index("};")]
+    return {name: body for name, body in re.findall(r"(\w+): `(.*?)`", block, re.S)}
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _median_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_tracer(programs: dict[str, str], repeat: int) -> list[dict]:
+    from sandbox import _build_restricted_globals, compile_source
+    from tracer import ExecutionTracer
+
+    rows = []
+    for name, source in programs.items():
+        compiled, error, line_index = compile_source(source)
+        if error:
+            raise SystemExit(f"{name}: {error['message']}")
+
+        untraced = _median_time(lambda: exec(compiled, _build_restricted_globals()), repeat)
+        for mode, options in MODES.items():
+            def run():
+                tracer = ExecutionTracer(source, line_index=line_index, **options)
+                return tracer.run(exec_globals=_build_restricted_globals(), compiled_code=compiled)
+
+            traced = _median_time(run, repeat)
+            tracemalloc.start()
+            result = run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rows.append({
+                "program": name,
+                "mode": mode,
+                "untraced_ms": round(untraced * 1000, 3),
+                "traced_ms": round(traced * 1000, 3),
+                "overhead": round(traced / untraced, 1) if untraced else None,
+                "steps_executed": result["step_count"],
+                "steps_recorded": len(result["steps"]),
+                "us_per_step": round(traced / max(result["step_count"], 1) * 1e6, 2),
+                "peak_memory_kb": round(peak / 1024, 1),
+                "trace_json_bytes": len(json.dumps(result, separators=(",", ":"))),
+                "completed": result["completed"] and not result["truncated"],
+            })
+    return rows
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def bench_explain(programs: dict[str, str], requests: int, concurrency: int, llm_latency: float) -> dict:
+    # Runs the real Flask app and sandbox pool against the local fake LLM. Every request
+    # carries a distinct program so neither cache can answer it. The sandbox queue is sized
+    # to the client concurrency so latency is measured rather than load shedding; requests
+    # that are still rejected are reported separately.
+    from benchmarks.fake_llm_server import start_in_thread
+
+    llm = start_in_thread(latency=llm_latency)
+    os.environ["GEMINI_API_BASE"] = llm.base_url
+    os.environ.setdefault("GEMINI_API_KEY", "offline")
+    os.environ["EXPLANATION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "explanations.sqlite3")
+    os.environ.setdefault("SANDBOX_MAX_QUEUED", str(concurrency))
+
+    import logging
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from app import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/explain"
+
+    sources = list(programs.values())
+
+    def one(i: int) -> tuple[float, int]:
+        code = sources[i % len(sources)] + f"\n_bench_request = {i}\n"
+        body = json.dumps({"code": code, "depth": "intermediate", "cache": False}).encode()
+        request = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            status = exc.code
+        return time.perf_counter() - start, status
+
+    try:
+        one(-1)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        llm.shutdown()
+
+    latencies = [latency for latency, status in results if status == 200]
+    if not latencies:
+        raise SystemExit(f"no /api/explain request succeeded: {sorted({status for _, status in results})}")
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "llm_latency_ms": llm_latency * 1000,
+        "succeeded": len(latencies),
+        "rejected": sum(status == 503 for _, status in results),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    old, new = json.loads(Path(old_path).read_text()), json.loads(Path(new_path).read_text())
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+    old_rows = {(r["program"], r["mode"]): r for r in old["tracer"]}
+    print(f"{'program':<18} {'mode':<9} {'us/step':>16} {'peak KB':>18} {'JSON bytes':>20}")
+    for row in new["tracer"]:
+        before = old_rows.get((row["program"], row["mode"]))
+        if before is None:
+            continue
+        cells = [
+            f"{before[key]}->{row[key]}" + (f" ({(row[key] / before[key] - 1) * 100:+.0f}%)" if before[key] else "")
+            for key in ("us_per_step", "peak_memory_kb", "trace_json_bytes")
+        ]
+        print(f"{row['program']:<18} {row['mode']:<9} " + " ".join(f"{cell:>18}" for cell in cells))
+    if old.get("explain") and new.get("explain"):
+        for key in ("p50_ms", "p99_ms", "throughput_rps"):
+            print(f"explain {key}: {old['explain'][key]} -> {new['explain'][key]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tracer, snapshot and API benchmarks (no network needed)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<revision>.json)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--skip-explain", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="print the difference between two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    programs = {**load_examples(), **STRESS_PROGRAMS}
+    revision = _git_revision()
+    results = {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "tracer": bench_tracer(programs, args.repeat),
+        "explain": None,
+    }
+    for row in results["tracer"]:
+        print(
+            f"{row['program']:<18} {row['mode']:<9} {row['traced_ms']:>9.2f} ms {row['overhead']:>7}x "
+            f"{row['us_per_step']:>8.2f} us/step {row['peak_memory_kb']:>9.1f} KB {row['trace_json_bytes']:>8} B"
+        )
+
+    if not args.skip_explain:
+        results["explain"] = bench_explain(programs, args.requests, args.concurrency, args.llm_latency)
+        print("explain:", results["explain"])
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{revision or 'working'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+from typing import Any, Callable
+
+# Longest loop body (in steps) the run detector looks for, and how many back-to-back
+# repetitions make a run worth folding at each level.
+MAX_PERIOD = 40
+MIN_REPEATS = {1: 3, 2: 2, 3: 2}
+MAX_LEVEL = 3
+VALUE_LIMIT = 60
+LINE_LIMIT = 160
+
+
+def find_runs(keys: list, min_repeats: int, max_period: int = MAX_PERIOD) -> list[tuple[int, int, int]]:
+    runs = []
+    i = 0
+    n = len(keys)
+    while i < n:
+        best = None
+        for period in range(1, min(max_period, (n - i) // min_repeats) + 1):
+            pattern = keys[i:i + period]
+            repeats = 1
+            while keys[i + repeats * period:i + (repeats + 1) * period] == pattern:
+                repeats += 1
+            if repeats >= min_repeats and (best is None or repeats * period > best[1] * best[2]):
+                best = (i, period, repeats)
+        if best is None:
+            i += 1
+        else:
+            runs.append(best)
+            i += best[1] * best[2]
+    return runs
+
+
+def _value_text(value: Any, limit: int | None = None) -> str:
+    if isinstance(value, dict) and "type" in value and "value" in value:
+        inner = value["value"]
+        if value["type"] == "str":
+            text = repr(inner)
+        elif isinstance(inner, list):
+            items = ", ".join(_value_text(item) for item in inner)
+            text = f"({items})" if value["type"] == "tuple" else f"[{items}]"
+        elif isinstance(inner, dict):
+            text = "{" + ", ".join(f"{k}: {_value_text(v)}" for k, v in inner.items()) + "}"
+        else:
+            text = str(inner)
+    else:
+        text = str(value)
+    if limit is not None and len(text) > limit:
+        text = text[:limit - 3] + "..."
+    return text
+
+
+def _progressions(iterations: list[list[dict]]) -> list[str]:
+    names: dict[str, None] = {}
+    for steps in iterations:
+        for step in steps:
+            changes = step.get("changes", {})
+            names.update(dict.fromkeys(changes.get("created", {})))
+            names.update(dict.fromkeys(changes.get("updated", {})))
+
+    parts = []
+    for name in names:
+        values = [steps[-1].get("variables", {}).get(name) for steps in iterations]
+        values = [v for v in values if v is not None]
+        if not values:
+            continue
+        first, last = values[0], values[-1]
+        text = f"{name} goes {_value_text(first, VALUE_LIMIT)} -> {_value_text(last, VALUE_LIMIT)}"
+        raw = [v.get("value") for v in values]
+        if len(raw) > 1 and all(type(v) is int for v in raw):
+            deltas = {b - a for a, b in zip(raw, raw[1:])}
+            if len(deltas) == 1:
+                delta = deltas.pop()
+                text += f" ({'+' if delta >= 0 else ''}{delta} per iteration)"
+        parts.append(text)
+    return parts
+
+
+def compact_steps(steps: list[dict], level: int, format_step: Callable[[dict], list[str]]) -> list[str]:
+    def render(step: dict) -> list[str]:
+        lines = format_step(step)
+        if level >= 3:
+            lines = [line if len(line) <= LINE_LIMIT else line[:LINE_LIMIT - 3] + "..." for line in lines]
+        return lines
+
+    if level <= 0:
+        return [line for step in steps for line in format_step(step)]
+
+    keys = [(step["line_number"], step["event"]) for step in steps]
+    runs = {start: (period, repeats) for start, period, repeats in find_runs(keys, MIN_REPEATS[level])}
+
+    lines = []
+    i = 0
+    while i < len(steps):
+        if i not in runs:
+            lines.extend(render(steps[i]))
+            i += 1
+            continue
+
+        period, repeats = runs[i]
+        iterations = [steps[i + k * period:i + (k + 1) * period] for k in range(repeats)]
+        first_step, last_step = steps[i]["step"], steps[i + period * repeats - 1]["step"]
+        body_lines = ", ".join(str(key[0]) for key in dict.fromkeys(keys[i:i + period]))
+        lines.append(
+            f"\n=== Steps {first_step}-{last_step}: lines {body_lines} repeat {repeats} times "
+            f"({period} steps per iteration) ==="
+        )
+
+        # Level 1 keeps the first and last iteration verbatim; higher levels only the first.
+        shown_tail = 1 if level == 1 else 0
+        folded = iterations[1:repeats - shown_tail]
+        for step in iterations[0]:
+            lines.extend(render(step))
+        if folded:
+            start_step, end_step = folded[0][0]["step"], folded[-1][-1]["step"]
+            summary = "; ".join(_progressions(folded)) or "no variable changes"
+            lines.append(
+                f"\n  ... iterations 2..{1 + len(folded)} folded (steps {start_step}-{end_step}): {summary}"
+            )
+        if shown_tail:
+            for step in iterations[-1]:
+                lines.extend(render(step))
+        i += period * repeats
+    return lines
+
+
+def compression_stats(level: int, original_chars: int, compacted_chars: int) -> dict:
+    return {
+        "level": level,
+        "original_chars": original_chars,
+        "compacted_chars": compacted_chars,
+        "compression_ratio": round(original_chars / compacted_chars, 2) if compacted_chars else 1.0,
+    }
@@ -0,0 +1,98 @@
+import asyncio
+
+import backends
+import explainer
+from explanation_cache import explanation_key
+from llm_runtime import iterate_async, iterate_sync, run_async, run_sync
+from responses import encode_event
+
+# The bodies of /api/explain and /api/explain/stream, written once for both servers:
+# asgi.py awaits the async versions on uvicorn's loop, and the Flask views call the sync
+# ones, which run them on the LLM loop. Cache lookups and prompt rendering block, so they
+# run in threads.
+
+
+def _cached(cache, trace: dict, depth: str) -> tuple[str, dict | None]:
+    key = explanation_key(trace, depth, backends.model_name(), explainer.PROMPT_VERSION)
+    return key, cache.get(key)
+
+
+async def _prompt_preview(trace: dict, depth: str) -> str | None:
+    if not trace["steps"] and not trace.get("error"):
+        return None
+    return await asyncio.to_thread(explainer.get_example_prompt, trace, depth)
+
+
+async def _explain(cache, trace: dict, depth: str) -> dict:
+    key, explanation = await asyncio.to_thread(_cached, cache, trace, depth)
+    if explanation is None:
+        explanation = await run_async(explainer.explain_trace_async(trace, depth))
+        await asyncio.to_thread(cache.put, key, explanation)
+    return explanation
+
+
+async def explanation_async(cache, trace: dict, depth: str) -> dict:
+    explanation = None
+    error_msg = None
+
+    prompt_preview = await _prompt_preview(trace, depth)
+    if trace["steps"]:
+        try:
+            explanation = await _explain(cache, trace, depth)
+        except ValueError as e:
+            error_msg = str(e)
+        except RuntimeError as e:
+            error_msg = f"AI explanation failed: {e}"
+    elif prompt_preview is not None:
+        try:
+            explanation = await _explain(cache, trace, depth)
+        except Exception as e:
+            error_msg = f"AI explanation failed: {e}"
+
+    response = {
+        "trace": trace,
+        "explanation": explanation,
+        "prompt_preview": prompt_preview,
+    }
+
+    if error_msg:
+        response["ai_error"] = error_msg
+
+    return response
+
+
+def explanation(cache, trace: dict, depth: str) -> dict:
+    return run_sync(explanation_async(cache, trace, depth))
+
+
+async def explanation_events_async(cache, trace: dict, depth: str, sse: bool):
+    prompt_preview = await _prompt_preview(trace, depth)
+    yield encode_event("trace", {"type": "trace", "trace": trace, "prompt_preview": prompt_preview}, sse)
+
+    if prompt_preview is None:
+        yield encode_event("done", {"type": "done", "explanation": None}, sse)
+        return
+
+    try:
+        key, explanation = await asyncio.to_thread(_cached, cache, trace, depth)
+        if explanation is None:
+            async for name, value in iterate_async(explainer.explain_trace_stream_async(trace, depth)):
+                if name == "done":
+                    explanation = value
+                    await asyncio.to_thread(cache.put, key, explanation)
+                elif name == "step_explanations":
+                    yield encode_event("step_explanation", {"type": "step_explanation", "step_explanation": value}, sse)
+                else:
+                    yield encode_event(name, {"type": name, name: value}, sse)
+    except ValueError as e:
+        yield encode_event("error", {"type": "error", "ai_error": str(e)}, sse)
+        return
+    except RuntimeError as e:
+        yield encode_event("error", {"type": "error", "ai_error": f"AI explanation failed: {e}"}, sse)
+        return
+
+    yield encode_event("done", {"type": "done", "explanation": explanation}, sse)
+
+
+def explanation_events(cache, trace: dict, depth: str, sse: bool):
+    yield from iterate_sync(explanation_events_async(cache, trace, depth, sse))
@@ -1,11 +1,57 @@
-import json
+import asyncio
+import copy
 import os
 from typing import Literal
 
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
+import backends
+import metrics
+from compaction import MAX_LEVEL, compact_steps, compression_stats
+from explanation_cache import trace_hash
+from llm_runtime import LLMBackend, LLMError, iterate_sync, run_sync
+from llm_scheduler import get_scheduler
+from partial_json import ExplanationStreamParser
+
+# Bump whenever DEPTH_PROMPTS or _build_prompt change so cached explanations are not reused.
+PROMPT_VERSION = 7
+
+# Rough prompt-size estimate; good enough to decide where to split long traces.
+CHARS_PER_TOKEN = 4
+CHUNK_TOKEN_BUDGET = int(os.getenv("EXPLAIN_CHUNK_TOKENS", 6000))
+MAX_PARALLEL_CHUNKS = int(os.getenv("EXPLAIN_MAX_PARALLEL", 8))
+# Lines listed in the profile hotspot summary.
+PROFILE_HOTSPOTS = 5
+# Follow-up calls for the steps a cut-off reply did not reach, per prompt.
+MAX_CONTINUATIONS = int(os.getenv("EXPLAIN_MAX_CONTINUATIONS", 2))
+
+# Gemini response schemas (an OpenAPI subset). Fields are generated in propertyOrdering,
+# so a reply cut off at the token limit still has its summary and leading steps.
+EXPLANATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "step_explanations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "step": {"type": "INTEGER"},
+                    "line": {"type": "INTEGER"},
+                    "explanation": {"type": "STRING"},
+                },
+                "required": ["step", "line", "explanation"],
+                "propertyOrdering": ["step", "line", "explanation"],
+            },
+        },
+        "key_concepts": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["summary", "step_explanations", "key_concepts"],
+    "propertyOrdering": ["summary", "step_explanations", "key_concepts"],
+}
+SUMMARY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"summary": {"type": "STRING"}},
+    "required": ["summary"],
+}
 
 DEPTH_PROMPTS = {
     "beginner": """You are a patient computer science tutor explaining Python code execution 
@@ -42,7 +88,8 @@ Rules:
 - Use precise PL theory and systems terminology (binding semantics, evaluation order,
   reference semantics, stack discipline, name resolution via LEGB rule)
 - Discuss memory model implications (object identity vs equality, reference counting)
-- Note performance characteristics (amortized complexity, cache behavior)
+- Note performance characteristics (amortized complexity, cache behavior); when a PROFILE
+  section is given, ground them in its measured hot lines rather than guessing
 - For function calls, discuss activation records and closure semantics if relevant
 - For data structures, reference implementation details (e.g., dict as hash table, list as dynamic array)
 - Point out subtle Python semantics (late binding, descriptor protocol, MRO)
@@ -51,7 +98,90 @@ Rules:
 }
 
 
-def _format_trace_for_prompt(trace: dict) -> str:
+def _format_step(step: dict) -> list[str]:
+    lines = []
+    step_num = step["step"]
+    event = step["event"]
+    lineno = step["line_number"]
+    source = step["source_line"]
+
+    elided = step.get("elided")
+    if elided:
+        loops = ", ".join(
+            f"{loop['iterations']} iterations of the loop at line {loop['line']}" for loop in elided["loops"]
+        )
+        lines.append(
+            f"\n  ... steps {elided['from_step']}-{elided['to_step']} not recorded"
+            f" ({elided['steps']} steps{': ' + loops if loops else ''})"
+        )
+
+    lines.append(f"\n--- Step {step_num} [{event}] Line {lineno}: {source} ---")
+
+    changes = step.get("changes", {})
+    created = changes.get("created", {})
+    updated = changes.get("updated", {})
+    deleted = changes.get("deleted", {})
+
+    if created:
+        for var, val in created.items():
+            lines.append(f"  NEW: {var} = {val['value']} (type: {val['type']})")
+    if updated:
+        for var, info in updated.items():
+            lines.append(f"  CHANGED: {var}: {info['from']['value']} -> {info['to']['value']}")
+    if deleted:
+        for var, val in deleted.items():
+            lines.append(f"  DELETED: {var} (was {val['value']})")
+
+    cf = step.get("control_flow")
+    if cf:
+        cf_type = cf["type"]
+        if cf_type == "function_call":
+            lines.append(f"  CONTROL: Calling function '{cf['function']}' (depth: {cf['call_depth']})")
+        elif cf_type == "function_return":
+            lines.append(f"  CONTROL: Returning from '{cf['function']}' with {cf['return_value']}")
+        elif cf_type == "conditional":
+            lines.append(f"  CONTROL: Evaluating conditional: {cf['expression']}")
+        elif cf_type == "loop":
+            lines.append(f"  CONTROL: Loop iteration: {cf['expression']}")
+        elif cf_type == "context_manager":
+            lines.append(f"  CONTROL: Entering context manager: {cf['expression']}")
+        elif cf_type == "try_block":
+            lines.append("  CONTROL: Entering try block")
+        elif cf_type == "exception":
+            lines.append(f"  CONTROL: Exception {cf['exception_type']}: {cf['exception_message']}")
+
+    return lines
+
+
+def _format_size(size: int) -> str:
+    sign = "-" if size < 0 else "+"
+    size = abs(size)
+    if size >= 1024 * 1024:
+        return f"{sign}{size / (1024 * 1024):.1f} MB"
+    if size >= 1024:
+        return f"{sign}{size / 1024:.1f} KB"
+    return f"{sign}{size} B"
+
+
+def _format_profile(profile: dict, source_lines: list[str]) -> list[str]:
+    rows = sorted(profile["lines"], key=lambda row: row["wall_ms"], reverse=True)[:PROFILE_HOTSPOTS]
+    total = profile["wall_ms"] or 1
+    lines = [
+        f"\n=== PROFILE (tracing overhead excluded: {profile['wall_ms']:.2f} ms wall, "
+        f"{profile['cpu_ms']:.2f} ms CPU, peak traced memory {_format_size(profile['peak_alloc_bytes'])[1:]}) ===",
+        "  Hottest lines by cumulative time (includes time in functions called from the line):",
+    ]
+    for row in rows:
+        lineno = row["line"]
+        source = source_lines[lineno - 1].strip() if 1 <= lineno <= len(source_lines) else ""
+        lines.append(
+            f"  line {lineno:3d} in {row['function']}: {row['hits']} hits, {row['wall_ms']:.3f} ms"
+            f" ({row['wall_ms'] / total:.0%}), {_format_size(row['alloc_bytes'])} allocated | {source}"
+        )
+    return lines
+
+
+def _format_trace_for_prompt(trace: dict, level: int = 0) -> str:
     lines = []
     lines.append("=== SOURCE CODE ===")
     for i, src_line in enumerate(trace["source_lines"], 1):
@@ -59,42 +189,10 @@ def _format_trace_for_prompt(trace: dict) -> str:
     lines.append("")
     lines.append("=== EXECUTION TRACE ===")
 
-    for step in trace["steps"]:
-        step_num = step["step"]
-        event = step["event"]
-        lineno = step["line_number"]
-        source = step["source_line"]
-
-        lines.append(f"\n--- Step {step_num} [{event}] Line {lineno}: {source} ---")
-
-        changes = step.get("changes", {})
-        created = changes.get("created", {})
-        updated = changes.get("updated", {})
-        deleted = changes.get("deleted", {})
-
-        if created:
-            for var, val in created.items():
-                lines.append(f"  NEW: {var} = {val['value']} (type: {val['type']})")
-        if updated:
-            for var, info in updated.items():
-                lines.append(f"  CHANGED: {var}: {info['from']['value']} -> {info['to']['value']}")
-        if deleted:
-            for var, val in deleted.items():
-                lines.append(f"  DELETED: {var} (was {val['value']})")
-
-        cf = step.get("control_flow")
-        if cf:
-            cf_type = cf["type"]
-            if cf_type == "function_call":
-                lines.append(f"  CONTROL: Calling function '{cf['function']}' (depth: {cf['call_depth']})")
-            elif cf_type == "function_return":
-                lines.append(f"  CONTROL: Returning from '{cf['function']}' with {cf['return_value']}")
-            elif cf_type == "conditional":
-                lines.append(f"  CONTROL: Evaluating conditional: {cf['expression']}")
-            elif cf_type == "loop":
-                lines.append(f"  CONTROL: Loop iteration: {cf['expression']}")
-            elif cf_type == "exception":
-                lines.append(f"  CONTROL: Exception {cf['exception_type']}: {cf['exception_message']}")
+    lines.extend(compact_steps(trace["steps"], level, _format_step))
+
+    if trace.get("profile"):
+        lines.extend(_format_profile(trace["profile"], trace["source_lines"]))
 
     if trace.get("error"):
         lines.append(f"\n=== EXECUTION ERROR ===")
@@ -102,24 +200,70 @@ def _format_trace_for_prompt(trace: dict) -> str:
 
     if trace.get("truncated"):
         lines.append(f"\n[Trace truncated at {trace['step_count']} steps]")
+    elif trace.get("elided_steps"):
+        lines.append(
+            f"\n[Sampled trace: {trace['elided_steps']} of {trace['step_count']} steps were not recorded;"
+            " the program ran to completion. Mention where steps were skipped.]"
+        )
 
     return "\n".join(lines)
 
 
-def _build_prompt(trace: dict, depth: str) -> str:
+def compact_trace_for_prompt(trace: dict, token_budget: int | None = None) -> tuple[str, dict]:
+    # Picks the lowest compaction level whose output fits the token budget,
+    # falling back to the most compact level when none does.
+    original = _format_trace_for_prompt(trace)
+    text, level = original, 0
+    if token_budget is not None:
+        while _estimate_tokens(text) > token_budget and level < MAX_LEVEL:
+            level += 1
+            text = _format_trace_for_prompt(trace, level)
+    return text, compression_stats(level, len(original), len(text))
+
+
+def _build_prompt(
+    trace: dict,
+    depth: str,
+    window: tuple[int, int, int] | None = None,
+    level: int = 0,
+    continued: bool = False,
+) -> str:
+    with metrics.phase("build_prompt"):
+        return _render_prompt(trace, depth, window, level, continued)
+
+
+def _render_prompt(
+    trace: dict, depth: str, window: tuple[int, int, int] | None, level: int, continued: bool = False
+) -> str:
     system = DEPTH_PROMPTS.get(depth, DEPTH_PROMPTS["intermediate"])
-    trace_text = _format_trace_for_prompt(trace)
+    trace_text = _format_trace_for_prompt(trace, level)
+
+    scope = "its complete execution trace"
+    if continued:
+        first, last = trace["steps"][0]["step"], trace["steps"][-1]["step"]
+        scope = (
+            f"the remaining steps {first}-{last} of its execution trace. The earlier steps have already "
+            "been explained; explain only these steps, and let the summary describe what happens in them"
+        )
+    elif window is not None:
+        index, count, total = window
+        first, last = trace["steps"][0]["step"], trace["steps"][-1]["step"]
+        scope = (
+            f"part {index + 1} of {count} of its execution trace (steps {first}-{last} of {total}). "
+            "Explain only the steps in this part; the summary should describe what happens in it"
+        )
 
     prompt = f"""{system}
 
-You are given a Python program's source code and its complete execution trace.
+You are given a Python program's source code and {scope}.
 Your task is to generate a natural-language explanation for each execution step.
 
 IMPORTANT RULES:
 1. Do NOT restate the source code verbatim. Explain what is happening and WHY.
 2. Explain why values change — trace the cause back to the operation.
 3. Explain why branches are taken — what condition evaluated to what.
-4. Group related steps (e.g., loop iterations) when it aids clarity.
+4. Group related steps (e.g., loop iterations) when it aids clarity. Folded iterations
+   are summarized in the trace; explain them as a group.
 5. If there's an error, explain why it occurred and what would fix it.
 
 {trace_text}
@@ -142,52 +286,355 @@ Return ONLY valid JSON, no markdown formatting or code fences."""
     return prompt
 
 
-def explain_trace(
+def _get_client() -> LLMBackend:
+    return backends.get_backend()
+
+
+def _finalize(result: dict, depth: str, compaction: dict | None = None) -> dict:
+    if "summary" not in result or "step_explanations" not in result:
+        raise RuntimeError("LLM response missing required fields")
+
+    result["depth"] = depth
+    result["model"] = backends.model_name()
+    if compaction is not None:
+        result["compaction"] = compaction
+    return result
+
+
+def _count_usage(prompt: str, usage: dict) -> None:
+    metrics.count("prompt_chars", len(prompt))
+    metrics.count("llm_prompt_tokens", usage.get("promptTokenCount", 0))
+    metrics.count("llm_output_tokens", usage.get("candidatesTokenCount", 0))
+
+
+def _parse_reply(text: str) -> ExplanationStreamParser:
+    # The streaming parser keeps every field and step entry that was complete before the
+    # reply was cut off or went wrong, where json.loads would discard the whole reply.
+    parser = ExplanationStreamParser()
+    with metrics.phase("parse"):
+        try:
+            parser.feed(text)
+        except ValueError:
+            pass
+    return parser
+
+
+def _count_salvage(result: dict, text: str, usage: dict) -> None:
+    # Output tokens kept from an incomplete reply instead of being paid for again.
+    metrics.count("llm_incomplete_responses")
+    if result:
+        metrics.count("llm_salvaged_responses")
+        metrics.count("llm_salvaged_steps", len(result.get("step_explanations") or []))
+        metrics.count("llm_salvaged_tokens", usage.get("candidatesTokenCount") or _estimate_tokens(text))
+
+
+async def _generate_json(
+    client: LLMBackend, prompt: str, schema: dict, max_output_tokens: int = 4096
+) -> tuple[dict, bool]:
+    # Returns the parsed reply and whether it was complete; a partial reply is returned
+    # as far as it goes, and only a reply with nothing usable raises.
+    try:
+        with metrics.phase("llm"):
+            response = await get_scheduler(client).generate(
+                client, prompt, temperature=0.3, max_output_tokens=max_output_tokens, response_schema=schema
+            )
+    except LLMError as e:
+        raise RuntimeError(f"Gemini API error: {e}") from e
+    _count_usage(prompt, response["usage"])
+
+    parser = _parse_reply(response["text"])
+    if parser.finished:
+        return parser.result, True
+    _count_salvage(parser.result, response["text"], response["usage"])
+    if not parser.result:
+        raise RuntimeError(
+            f"Failed to parse LLM response as JSON (finish reason: {response['finish_reason']})"
+        )
+    return parser.result, False
+
+
+def _unexplained_steps(steps: list[dict], result: dict) -> list[dict]:
+    # Entries are generated in step order, so a cut-off reply covers a prefix of the steps.
+    explained = [
+        entry.get("step") for entry in result.get("step_explanations") or []
+        if isinstance(entry, dict) and isinstance(entry.get("step"), int)
+    ]
+    last = max(explained, default=0)
+    return [step for step in steps if step["step"] > last]
+
+
+async def _continue(
+    client: LLMBackend,
     trace: dict,
-    depth: Literal["beginner", "intermediate", "advanced"] = "intermediate",
+    depth: str,
+    result: dict,
+    window: tuple[int, int, int] | None = None,
+    level: int = 0,
 ) -> dict:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError(
-            "GEMINI_API_KEY not set. Add it to your .env file or environment."
-        )
+    # Asks only for the steps an incomplete reply did not reach, and folds the answers in.
+    result = dict(result, step_explanations=list(result.get("step_explanations") or []))
+    complete = False
+    for _ in range(MAX_CONTINUATIONS):
+        remaining = _unexplained_steps(trace["steps"], result)
+        if not remaining:
+            complete = True
+            break
+        metrics.count("llm_continuations")
+        prompt = _build_prompt(dict(trace, steps=remaining), depth, window, level, continued=True)
+        try:
+            more, complete = await _generate_json(client, prompt, EXPLANATION_SCHEMA)
+        except RuntimeError:
+            break
+        if "summary" not in result and "summary" in more:
+            result["summary"] = more["summary"]
+        result["step_explanations"].extend(more.get("step_explanations") or [])
+        result["key_concepts"] = list(dict.fromkeys(
+            (result.get("key_concepts") or []) + (more.get("key_concepts") or [])
+        ))
+        if complete:
+            break
+
+    remaining = [] if complete else _unexplained_steps(trace["steps"], result)
+    if remaining:
+        result["missing_steps"] = [[remaining[0]["step"], remaining[-1]["step"]]]
+    result.setdefault("key_concepts", [])
+    return result
+
+
+async def _explain_steps(
+    client: LLMBackend,
+    trace: dict,
+    depth: str,
+    window: tuple[int, int, int] | None = None,
+    level: int = 0,
+) -> dict:
+    prompt = _build_prompt(trace, depth, window, level)
+    result, complete = await _generate_json(client, prompt, EXPLANATION_SCHEMA)
+    if complete:
+        return result
+    return await _continue(client, trace, depth, result, window, level)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _is_window_boundary(step: dict) -> bool:
+    cf = step.get("control_flow")
+    return cf is not None and cf["type"] in ("function_call", "loop")
+
+
+def _split_trace(steps: list[dict], token_budget: int) -> list[list[dict]]:
+    windows: list[list[dict]] = []
+    current: list[dict] = []
+    used = 0
+    for step in steps:
+        cost = _estimate_tokens("\n".join(_format_step(step)))
+        # Prefer to cut at a call or loop iteration once the window is mostly full.
+        soft_cut = used > token_budget * 0.75 and _is_window_boundary(step)
+        if current and (used + cost > token_budget or soft_cut):
+            windows.append(current)
+            current, used = [], 0
+        current.append(step)
+        used += cost
+    if current:
+        windows.append(current)
+    return windows
+
+
+def _window_trace(trace: dict, windows: list[list[dict]], index: int) -> dict:
+    last = index == len(windows) - 1
+    return dict(
+        trace,
+        steps=windows[index],
+        error=trace.get("error") if last else None,
+        truncated=trace.get("truncated", False) if last else False,
+    )
+
+
+async def _explain_windows(client: LLMBackend, trace: dict, depth: str, windows: list[list[dict]]):
+    count = len(windows)
+    total = trace.get("step_count", len(trace["steps"]))
+    limit = asyncio.Semaphore(MAX_PARALLEL_CHUNKS)
+
+    async def explain_window(index: int) -> tuple[int, dict | None]:
+        window_trace = _window_trace(trace, windows, index)
+        async with limit:
+            try:
+                return index, await _explain_steps(client, window_trace, depth, (index, count, total), level=1)
+            except RuntimeError:
+                return index, None
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    for next_done in asyncio.as_completed([explain_window(i) for i in range(count)]):
+        yield await next_done
 
-    prompt = _build_prompt(trace, depth)
 
+async def _reduce_summaries(client: LLMBackend, depth: str, summaries: list[str]) -> str:
+    if len(summaries) == 1:
+        return summaries[0]
+
+    parts = "\n".join(f"{i}. {summary}" for i, summary in enumerate(summaries, 1))
+    prompt = f"""{DEPTH_PROMPTS.get(depth, DEPTH_PROMPTS["intermediate"])}
+
+These are summaries of consecutive parts of one program's execution:
+{parts}
+
+Combine them into a single 1-3 sentence overview of what the whole program does and its key algorithmic idea.
+Respond with a JSON object {{"summary": "..."}} and nothing else."""
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.3,
-                max_output_tokens=4096,
-            ),
-        )
+        return (await _generate_json(client, prompt, SUMMARY_SCHEMA, max_output_tokens=512))[0]["summary"]
+    except (RuntimeError, KeyError, TypeError):
+        return " ".join(summaries)
+
+
+def _merge_windows(windows: list[list[dict]], results: list[dict | None], summary: str) -> dict:
+    completed = [result for result in results if result is not None]
+
+    step_explanations = sorted(
+        (entry for result in completed for entry in result.get("step_explanations", [])),
+        key=lambda entry: entry.get("step", 0),
+    )
+    key_concepts = list(dict.fromkeys(
+        concept for result in completed for concept in result.get("key_concepts", [])
+    ))
+    merged = {
+        "summary": summary,
+        "step_explanations": step_explanations,
+        "key_concepts": key_concepts,
+        "chunks": len(windows),
+    }
+    missing = sorted(
+        span
+        for window, result in zip(windows, results)
+        for span in ([[window[0]["step"], window[-1]["step"]]] if result is None else result.get("missing_steps", []))
+    )
+    if missing:
+        merged["missing_steps"] = missing
+    return merged
+
+
+async def _summarize_windows(client: LLMBackend, depth: str, results: list[dict | None]) -> str:
+    completed = [result for result in results if result is not None]
+    if not completed:
+        raise RuntimeError("Every part of the chunked explanation failed")
+    return await _reduce_summaries(client, depth, [result.get("summary", "") for result in completed])
+
+
+def _plan(trace: dict) -> tuple[dict, list[list[dict]] | None]:
+    # Compaction first; only traces that still do not fit are split into windows.
+    with metrics.phase("compaction"):
+        text, stats = compact_trace_for_prompt(trace, CHUNK_TOKEN_BUDGET)
+        if _estimate_tokens(text) <= CHUNK_TOKEN_BUDGET:
+            return stats, None
+        windows = _split_trace(trace["steps"], CHUNK_TOKEN_BUDGET)
+    return stats, (windows if len(windows) > 1 else None)
+
+
+async def _explain(client: LLMBackend, trace: dict, depth: str) -> dict:
+    compaction, windows = _plan(trace)
+    if windows is None:
+        return _finalize(await _explain_steps(client, trace, depth, level=compaction["level"]), depth, compaction)
+
+    results: list[dict | None] = [None] * len(windows)
+    async for index, result in _explain_windows(client, trace, depth, windows):
+        results[index] = result
+    summary = await _summarize_windows(client, depth, results)
+    return _finalize(_merge_windows(windows, results, summary), depth, compaction)
+
+
+async def explain_trace_async(
+    trace: dict,
+    depth: Literal["beginner", "intermediate", "advanced"] = "intermediate",
+) -> dict:
+    client = _get_client()
+    # Identical concurrent requests (same trace and depth) share one upstream call.
+    key = (trace_hash(trace), depth)
+    result = await client.coalesce(key, lambda: _explain(client, trace, depth))
+    with metrics.phase("deepcopy"):
+        return copy.deepcopy(result)
 
-        response_text = response.text.strip()
 
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            response_text = "\n".join(lines[1:-1])
+def explain_trace(
+    trace: dict,
+    depth: Literal["beginner", "intermediate", "advanced"] = "intermediate",
+) -> dict:
+    _get_client()
+    return run_sync(explain_trace_async(trace, depth))
 
-        result = json.loads(response_text)
 
-        if "summary" not in result or "step_explanations" not in result:
-            raise RuntimeError("LLM response missing required fields")
+def explain_trace_stream(
+    trace: dict,
+    depth: Literal["beginner", "intermediate", "advanced"] = "intermediate",
+):
+    _get_client()
+    yield from iterate_sync(explain_trace_stream_async(trace, depth))
 
-        result["depth"] = depth
-        result["model"] = "gemini-2.0-flash"
-        return result
 
-    except json.JSONDecodeError as e:
-        raise RuntimeError(f"Failed to parse LLM response as JSON: {e}")
-    except Exception as e:
-        if "json" in str(type(e).__name__).lower():
-            raise
-        raise RuntimeError(f"Gemini API error: {e}")
+async def explain_trace_stream_async(
+    trace: dict,
+    depth: Literal["beginner", "intermediate", "advanced"] = "intermediate",
+):
+    # Runs on the client loop: from threads via explain_trace_stream, from async handlers
+    # via llm_runtime.iterate_async.
+    client = _get_client()
+
+    compaction, windows = _plan(trace)
+    if windows is not None:
+        # Long traces: forward each part's step explanations as soon as that part completes.
+        results: list[dict | None] = [None] * len(windows)
+        async for index, result in _explain_windows(client, trace, depth, windows):
+            results[index] = result
+            for entry in (result or {}).get("step_explanations", []):
+                yield "step_explanations", entry
+        summary = await _summarize_windows(client, depth, results)
+        merged = _finalize(_merge_windows(windows, results, summary), depth, compaction)
+        yield "summary", merged["summary"]
+        yield "key_concepts", merged["key_concepts"]
+        yield "done", merged
+        return
+
+    prompt = _build_prompt(trace, depth, level=compaction["level"])
+    parser = ExplanationStreamParser()
+
+    usage: dict = {}
+    chunks = get_scheduler(client).stream(
+        client, prompt, temperature=0.3, max_output_tokens=4096, response_schema=EXPLANATION_SCHEMA
+    )
+    failure = None
+    try:
+        while True:
+            with metrics.phase("llm"):
+                chunk = await anext(chunks, None)
+            if chunk is None:
+                break
+            usage = chunk["usage"] or usage
+            with metrics.phase("parse"):
+                events = parser.feed(chunk["text"])
+            for event in events:
+                yield event
+    except LLMError as e:
+        failure = RuntimeError(f"Gemini API error: {e}")
+    except ValueError as e:
+        failure = RuntimeError(f"Failed to parse LLM response as JSON: {e}")
+    finally:
+        await chunks.aclose()
+
+    _count_usage(prompt, usage)
+    result = parser.result
+    if not parser.finished:
+        # Keep what was already forwarded and ask only for the steps the reply did not reach.
+        _count_salvage(result, parser.buffer, usage)
+        if not result:
+            raise failure or RuntimeError("LLM response ended before the JSON object was complete")
+        sent = len(result.get("step_explanations") or [])
+        result = await _continue(client, trace, depth, result, level=compaction["level"])
+        for entry in result["step_explanations"][sent:]:
+            yield "step_explanations", entry
+        for key in ("summary", "key_concepts"):
+            if key not in parser.result and result.get(key) is not None:
+                yield key, result[key]
+    yield "done", _finalize(result, depth, compaction)
 
 
 def get_example_prompt(trace: dict, depth: str = "intermediate") -> str:
-    return _build_prompt(trace, depth)
+    return _build_prompt(trace, depth, level=_plan(trace)[0]["level"])
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DEFAULT_PATH = os.environ.get("EXPLANATION_CACHE_PATH", "explanation_cache.sqlite3")
+DEFAULT_TTL = int(os.environ.get("EXPLANATION_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get("EXPLANATION_CACHE_BYTES", 256 * 1024 * 1024))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS explanations (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    depth TEXT NOT NULL,
+    model TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS explanations_accessed ON explanations (accessed);
+"""
+
+
+def trace_hash(trace: dict) -> str:
+    # Profiles hold timings that differ on every run, so an explanation of the same steps
+    # is reused (and concurrent requests for it coalesced) whatever the timings were.
+    if "profile" in trace:
+        trace = {k: v for k, v in trace.items() if k != "profile"}
+    canonical = json.dumps(trace, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def explanation_key(trace: dict, depth: str, model: str, prompt_version: int) -> str:
+    parts = f"{trace_hash(trace)}:{depth}:{model}:{prompt_version}"
+    return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    def __init__(self, path: str = DEFAULT_PATH, ttl: int = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # WAL lets every worker process read while one of them writes.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, created FROM explanations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                conn.execute("DELETE FROM explanations WHERE key = ?", (key,))
+            self.misses += 1
+            metrics.count("explanation_cache_miss")
+            return None
+        conn.execute("UPDATE explanations SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        metrics.count("explanation_cache_hit")
+        return json.loads(row[0])
+
+    def put(self, key: str, explanation: dict) -> None:
+        value = json.dumps(explanation, separators=(",", ":"))
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO explanations (key, value, depth, model, size, created, accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, value, explanation.get("depth", ""), explanation.get("model", ""), len(value), now, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM explanations WHERE created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM explanations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until the table fits the budget again.
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM explanations ORDER BY accessed"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM explanations WHERE key = ?", victims)
+
+    def purge(self, expired_only: bool = False) -> int:
+        conn = self._connect()
+        if expired_only:
+            cursor = conn.execute("DELETE FROM explanations WHERE created < ?", (time.time() - self.ttl,))
+        else:
+            cursor = conn.execute("DELETE FROM explanations")
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM explanations"
+        ).fetchone()
+        by_depth = dict(conn.execute("SELECT depth, COUNT(*) FROM explanations GROUP BY depth"))
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "by_depth": by_depth,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,153 @@
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+KEYFRAME_INTERVAL = int(os.environ.get("TRACE_KEYFRAME_INTERVAL", 50))
+KEYFRAME_CACHE_ENTRIES = int(os.environ.get("KEYFRAME_CACHE_ENTRIES", 64))
+
+
+def _apply_changes(variables: dict, changes: dict) -> dict:
+    state = dict(variables)
+    state.update(changes["created"])
+    for name, info in changes["updated"].items():
+        state[name] = info["to"]
+    for name in changes["deleted"]:
+        state.pop(name, None)
+    return state
+
+
+class _FrameReplay:
+    # Mirrors ExecutionTracer.snapshot_stack: each step's "changes" are diffed against the
+    # previous snapshot of the same frame, pushed on call and popped on return.
+
+    def __init__(self, frames: list[dict]):
+        self.frames = list(frames)
+
+    def step(self, step: dict) -> dict:
+        if step["event"] == "call":
+            self.frames.append({})
+        variables = _apply_changes(self.frames[-1] if self.frames else {}, step["changes"])
+        self.finish(step, variables)
+        return variables
+
+    def finish(self, step: dict, variables: dict) -> None:
+        if step["event"] == "return":
+            if self.frames:
+                self.frames.pop()
+        elif self.frames:
+            self.frames[-1] = variables
+
+
+class KeyframeBuilder:
+    # Splits steps into deltas and keyframes one at a time, so a trace can be written out
+    # while it is still running.
+
+    def __init__(self, interval: int = KEYFRAME_INTERVAL):
+        self.interval = interval
+        self.position = 0
+        self.replay = _FrameReplay([])
+
+    def add(self, step: dict) -> tuple[dict, dict | None]:
+        replay = self.replay
+        variables = step["variables"]
+        drifted = replay.step(step) != variables
+        if drifted and step["event"] != "return":
+            # Resynchronise the current frame; the keyframe makes this step exact.
+            if replay.frames:
+                replay.frames[-1] = variables
+            else:
+                replay.frames.append(variables)
+        keyframe = None
+        if self.position % self.interval == 0 or drifted:
+            keyframe = {"variables": variables, "frames": list(replay.frames)}
+        self.position += 1
+        return {k: v for k, v in step.items() if k != "variables"}, keyframe
+
+
+class KeyframeTrace:
+    # An inline trace stored as per-step deltas only: steps keep their "changes" but not
+    # their "variables". Every `interval` steps a keyframe records that step's variables
+    # and the frame stack after it, so the variables of any step are rebuilt by replaying
+    # at most `interval` deltas. Steps whose deltas do not reproduce the recorded snapshot
+    # (a sampled trace that skipped calls or returns) get a keyframe of their own.
+
+    def __init__(self, summary: dict, steps: list[dict], keyframes: dict[int, dict]):
+        self.summary = summary
+        self.steps = steps
+        self.keyframes = keyframes
+        self._positions = sorted(keyframes)
+
+    @classmethod
+    def from_trace(cls, trace: dict, interval: int = KEYFRAME_INTERVAL) -> "KeyframeTrace":
+        if trace.get("format", "inline") != "inline":
+            raise ValueError("keyframe traces are built from inline traces")
+
+        builder = KeyframeBuilder(interval)
+        steps = []
+        keyframes = {}
+        for position, step in enumerate(trace["steps"]):
+            stripped, keyframe = builder.add(step)
+            if keyframe is not None:
+                keyframes[position] = keyframe
+            steps.append(stripped)
+        summary = {k: v for k, v in trace.items() if k != "steps"}
+        return cls(summary, steps, keyframes)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def _keyframe_before(self, position: int) -> int:
+        return self._positions[bisect_right(self._positions, position) - 1]
+
+    def window(self, start: int, stop: int) -> list[dict]:
+        # Full steps, with "variables", for positions start..stop-1.
+        start = max(start, 0)
+        stop = min(stop, len(self.steps))
+        if start >= stop:
+            return []
+
+        steps = []
+        replay = None
+        for position in range(self._keyframe_before(start), stop):
+            keyframe = self.keyframes.get(position)
+            if keyframe is not None:
+                variables = keyframe["variables"]
+                replay = _FrameReplay(keyframe["frames"])
+            else:
+                variables = replay.step(self.steps[position])
+            if position >= start:
+                steps.append(dict(self.steps[position], variables=variables))
+        return steps
+
+    def state_at(self, position: int) -> dict:
+        if not 0 <= position < len(self.steps):
+            raise IndexError(position)
+        return self.window(position, position + 1)[0]["variables"]
+
+    def to_trace(self) -> dict:
+        return dict(self.summary, steps=self.window(0, len(self.steps)))
+
+
+class KeyframeCache:
+    # Recently paged traces, so scrubbing through one costs a replay of at most one
+    # keyframe interval per window instead of a re-trace.
+
+    def __init__(self, max_entries: int = KEYFRAME_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, KeyframeTrace] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> KeyframeTrace | None:
+        with self._lock:
+            trace = self._entries.get(key)
+            if trace is not None:
+                self._entries.move_to_end(key)
+            return trace
+
+    def put(self, key: str, trace: KeyframeTrace) -> None:
+        with self._lock:
+            self._entries[key] = trace
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,76 @@
+import ast
+
+# Statement kinds reported as line-level control flow, keyed by AST node type.
+_KINDS = {
+    ast.If: "conditional",
+    ast.For: "loop",
+    ast.AsyncFor: "loop",
+    ast.While: "loop",
+    ast.Return: "return_statement",
+    ast.With: "context_manager",
+    ast.AsyncWith: "context_manager",
+    ast.Try: "try_block",
+}
+if hasattr(ast, "TryStar"):
+    _KINDS[ast.TryStar] = "try_block"
+
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+
+
+def _header_end(node: ast.stmt) -> int:
+    # Last line of the statement's header, i.e. where the colon is for compound statements.
+    if isinstance(node, (ast.If, ast.While)):
+        return node.test.end_lineno
+    if isinstance(node, (ast.For, ast.AsyncFor)):
+        return node.iter.end_lineno
+    if isinstance(node, (ast.With, ast.AsyncWith)):
+        return max((item.optional_vars or item.context_expr).end_lineno for item in node.items)
+    if isinstance(node, ast.Return):
+        return node.end_lineno
+    return node.lineno
+
+
+def build_line_index(source: str) -> dict[int, dict]:
+    # Line number -> {"kind", "expression", "function", "start", "end"} for every line of a
+    # classified statement's header. "expression" is the whole header joined onto one line,
+    # "function" the enclosing function (None at module level), and start/end the span of
+    # the full statement. The outermost statement wins when several share a line.
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return {}
+
+    source_lines = source.splitlines()
+    index: dict[int, dict] = {}
+
+    def visit(node: ast.AST, function: str | None) -> None:
+        kind = _KINDS.get(type(node))
+        if kind is not None and node.lineno not in index:
+            header_end = _header_end(node)
+            expression = " ".join(line.strip() for line in source_lines[node.lineno - 1:header_end])
+            info = {
+                "kind": kind,
+                "expression": expression,
+                "function": function,
+                "start": node.lineno,
+                "end": node.end_lineno,
+            }
+            for lineno in range(node.lineno, header_end + 1):
+                index.setdefault(lineno, info)
+
+        if isinstance(node, _FUNCTION_NODES):
+            function = getattr(node, "name", "<lambda>")
+        for child in ast.iter_child_nodes(node):
+            visit(child, function)
+
+    visit(tree, None)
+    return index
+
+
+def loop_spans(index: dict[int, dict]) -> dict[int, int]:
+    # Header line -> last line of every loop.
+    return {
+        lineno: info["end"]
+        for lineno, info in index.items()
+        if info["kind"] == "loop" and info["start"] == lineno
+    }
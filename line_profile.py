@@ -0,0 +1,109 @@
+import time
+import tracemalloc
+
+
+class LineProfiler:
+    # Per-line hit counts, wall/CPU time and net allocations for one traced run. A line is
+    # charged from its "line" event until the next event in the same frame, so calls made
+    # from a line count towards it (cumulative time). Clocks are read again after the
+    # bookkeeping so the profiler's own work is not charged to the next line. Work between
+    # pause() and resume(), such as the tracer recording a step, is left out entirely: it is
+    # added to `excluded` and subtracted from every clock and memory reading.
+
+    def __init__(self):
+        # line -> [hits, wall seconds, cpu seconds, allocated bytes, function]
+        self.lines: dict[int, list] = {}
+        # frame -> (line, wall, cpu, traced memory) for the line currently running in it
+        self.open: dict = {}
+        self.started_memory = False
+        self.running = False
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        # wall seconds, cpu seconds, traced memory left out so far
+        self.excluded = [0.0, 0.0, 0]
+        self.paused: tuple | None = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_memory = True
+        tracemalloc.reset_peak()
+        self.running = True
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        excluded = self.excluded
+        wall, cpu = time.perf_counter() - excluded[0], time.thread_time() - excluded[1]
+        memory, peak = tracemalloc.get_traced_memory()
+        memory -= excluded[2]
+        for pending in self.open.values():
+            self._charge(pending, wall, cpu, memory)
+        self.open.clear()
+        self.wall = wall - self.wall
+        self.cpu = cpu - self.cpu
+        self.peak = max(self.peak, peak - excluded[2])
+        if self.started_memory:
+            tracemalloc.stop()
+
+    def pause(self) -> None:
+        memory, peak = tracemalloc.get_traced_memory()
+        # The peak is taken per stretch between pauses, less what was left out before it.
+        self.peak = max(self.peak, peak - self.excluded[2])
+        self.paused = (time.perf_counter(), time.thread_time(), memory)
+
+    def resume(self) -> None:
+        wall, cpu, memory = self.paused
+        excluded = self.excluded
+        excluded[0] += time.perf_counter() - wall
+        excluded[1] += time.thread_time() - cpu
+        excluded[2] += tracemalloc.get_traced_memory()[0] - memory
+        tracemalloc.reset_peak()
+
+    def _charge(self, pending: tuple, wall: float, cpu: float, memory: int) -> None:
+        stats = self.lines[pending[0]]
+        stats[1] += wall - pending[1]
+        stats[2] += cpu - pending[2]
+        stats[3] += memory - pending[3]
+
+    def event(self, frame, event: str) -> None:
+        # Memory is read first and last so that, as far as possible, only the user code's
+        # allocations fall between two readings.
+        excluded = self.excluded
+        memory = tracemalloc.get_traced_memory()[0] - excluded[2]
+        wall, cpu = time.perf_counter() - excluded[0], time.thread_time() - excluded[1]
+        pending = self.open.pop(frame, None)
+        if pending is not None:
+            self._charge(pending, wall, cpu, memory)
+
+        lineno = frame.f_lineno
+        if lineno > 0 and (event == "line" or (event == "exception" and pending is not None)):
+            stats = self.lines.get(lineno)
+            if stats is None:
+                stats = self.lines[lineno] = [0, 0.0, 0.0, 0, frame.f_code.co_name]
+            if event == "line":
+                stats[0] += 1
+            pending = self.open[frame] = [lineno, time.perf_counter() - excluded[0], time.thread_time() - excluded[1], 0]
+            pending[3] = tracemalloc.get_traced_memory()[0] - excluded[2]
+
+    def table(self) -> dict:
+        return {
+            "lines": [
+                {
+                    "line": lineno,
+                    "function": function,
+                    "hits": hits,
+                    "wall_ms": round(wall * 1000, 3),
+                    "cpu_ms": round(cpu * 1000, 3),
+                    "alloc_bytes": alloc,
+                }
+                for lineno, (hits, wall, cpu, alloc, function) in sorted(self.lines.items())
+            ],
+            "wall_ms": round(self.wall * 1000, 3),
+            "cpu_ms": round(self.cpu * 1000, 3),
+            "peak_alloc_bytes": self.peak,
+        }
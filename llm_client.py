@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+
+from llm_runtime import LLMBackend, LLMError
+
+API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 16))
+REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+# Longest a stream may go without receiving anything, including the wait for its first byte.
+STREAM_READ_TIMEOUT = float(os.getenv("LLM_STREAM_READ_TIMEOUT", 30))
+
+
+class GeminiClient(LLMBackend):
+    def __init__(self, api_key: str, model: str, base_url: str = API_BASE, pool_size: int = POOL_SIZE):
+        super().__init__(model)
+        self.api_key = api_key
+        # Waiting for a free connection is not timed: the scheduler already bounds how many
+        # calls run at once, and a call's own timeout covers the whole exchange.
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, pool=None),
+        )
+
+    def _path(self, method: str, query: str = "") -> str:
+        return f"/v1beta/models/{self.model}:{method}" + (f"?{query}" if query else "")
+
+    def _headers(self, **extra: str) -> dict:
+        # The key goes in a header, not the URL, so it stays out of proxy and access logs.
+        return {"Content-Type": "application/json", "x-goog-api-key": self.api_key, **extra}
+
+    @staticmethod
+    def _payload(prompt: str, temperature: float, max_output_tokens: int, response_schema: dict | None) -> bytes:
+        config = {"temperature": temperature, "maxOutputTokens": max_output_tokens}
+        if response_schema is not None:
+            # Constrained decoding: the reply is JSON matching the schema, without fences or prose.
+            config["responseMimeType"] = "application/json"
+            config["responseSchema"] = response_schema
+        return json.dumps({
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": config,
+        }).encode("utf-8")
+
+    @staticmethod
+    def _parse(payload: dict) -> dict:
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            raise LLMError(f"Response contained no candidates: {payload.get('promptFeedback', payload)}")
+        candidate = candidates[0]
+        parts = candidate.get("content", {}).get("parts", [])
+        return {
+            "text": "".join(part.get("text", "") for part in parts),
+            "finish_reason": candidate.get("finishReason"),
+            "usage": payload.get("usageMetadata", {}),
+        }
+
+    async def _error(self, response: httpx.Response) -> LLMError:
+        body = (await response.aread()).decode("utf-8", "replace")
+        try:
+            message = json.loads(body)["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = body[:200]
+        try:
+            retry_after = float(response.headers["retry-after"])
+        except (KeyError, ValueError):
+            retry_after = None
+        return LLMError(f"HTTP {response.status_code}: {message}", status=response.status_code, retry_after=retry_after)
+
+    async def _generate(self, body: bytes) -> dict:
+        response = await self.http.post(self._path("generateContent"), content=body, headers=self._headers())
+        if response.status_code != 200:
+            raise await self._error(response)
+        return self._parse(response.json())
+
+    async def generate(
+        self, prompt: str, temperature: float = 0.3, max_output_tokens: int = 4096, response_schema: dict | None = None
+    ) -> dict:
+        body = self._payload(prompt, temperature, max_output_tokens, response_schema)
+        try:
+            return await asyncio.wait_for(self._generate(body), REQUEST_TIMEOUT)
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Connection failed: {e!r}") from e
+
+    async def stream(
+        self, prompt: str, temperature: float = 0.3, max_output_tokens: int = 4096, response_schema: dict | None = None
+    ):
+        body = self._payload(prompt, temperature, max_output_tokens, response_schema)
+        headers = self._headers(Accept="text/event-stream")
+        path = self._path("streamGenerateContent", "alt=sse")
+        # Connecting, the wait for the response head and each read of the body are each
+        # bounded by STREAM_READ_TIMEOUT.
+        timeout = httpx.Timeout(STREAM_READ_TIMEOUT, pool=None)
+        try:
+            async with self.http.stream("POST", path, content=body, headers=headers, timeout=timeout) as response:
+                if response.status_code != 200:
+                    raise await self._error(response)
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if line.startswith("data:"):
+                        yield self._parse(json.loads(line[5:]))
+        except httpx.HTTPError as e:
+            raise LLMError(f"Connection failed: {e!r}") from e
+
+
+_lock = threading.Lock()
+_clients: dict[tuple, GeminiClient] = {}
+
+
+def get_client(api_key: str, model: str) -> GeminiClient:
+    # Per process: a forked child must not share its parent's connections.
+    key = (os.getpid(), api_key, model)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = GeminiClient(api_key, model, API_BASE)
+        return client
+
+
+def gemini_backend(model: str) -> GeminiClient:
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "GEMINI_API_KEY not set. Add it to your .env file or environment."
+        )
+    return get_client(api_key, model)
@@ -0,0 +1,156 @@
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+
+# What explanation code needs from the LLM side without loading a provider: the error type,
+# the shared event loop with its bridges from request threads, and the backend base class.
+# Provider modules (llm_client, local_backend) are only imported through backends.get_backend().
+
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMError(RuntimeError):
+    def __init__(self, message: str, status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        # Seconds the server asked us to wait (Retry-After), if it said.
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # No status means the connection failed or timed out before a response.
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+class LLMBackend:
+    # Explanation backends have a `model` and async generate() and stream() returning
+    # {"text", "finish_reason", "usage"} dicts. coalesce() is a singleflight: concurrent
+    # callers with the same key share one call.
+
+    def __init__(self, model: str):
+        self.model = model
+        self._inflight: dict = {}
+        self.coalesced = 0
+
+    async def generate(
+        self, prompt: str, temperature: float = 0.3, max_output_tokens: int = 4096, response_schema: dict | None = None
+    ) -> dict:
+        raise NotImplementedError
+
+    def stream(
+        self, prompt: str, temperature: float = 0.3, max_output_tokens: int = 4096, response_schema: dict | None = None
+    ):
+        raise NotImplementedError
+
+    async def coalesce(self, key, factory):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+
+_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_pid: int | None = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_pid
+    with _lock:
+        # A forked child inherits the loop object but not the thread running it.
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="llm-client", daemon=True).start()
+        return _loop
+
+
+async def _in_context(coro, context: contextvars.Context):
+    # Tasks on the client loop start from the loop thread's context; carry over the caller's
+    # context variables (e.g. per-request metrics) instead.
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def run_sync(coro, timeout: float | None = None):
+    return submit(coro).result(timeout)
+
+
+def submit(coro):
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), get_loop())
+
+
+def iterate_sync(agen):
+    # Drives an async generator on the client loop and yields its items in the calling thread.
+    items: queue.Queue = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((done, e))
+        else:
+            items.put((done, None))
+        finally:
+            # Run the generator's cleanup now, even when the consumer stopped early.
+            await agen.aclose()
+
+    future = submit(pump())
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        future.cancel()
+
+
+async def run_async(coro):
+    # For handlers on another event loop (the ASGI server's): awaits a coroutine run on the
+    # client loop without tying up a thread. Cancelling the caller cancels the coroutine.
+    return await asyncio.wrap_future(submit(coro))
+
+
+async def iterate_async(agen):
+    # iterate_sync for consumers on another event loop.
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def put(item) -> None:
+        loop.call_soon_threadsafe(items.put_nowait, item)
+
+    async def pump():
+        try:
+            async for item in agen:
+                put((item, None))
+        except BaseException as e:
+            put((done, e))
+        else:
+            put((done, None))
+        finally:
+            await agen.aclose()
+
+    future = submit(pump())
+    try:
+        while True:
+            item, error = await items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        future.cancel()
@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import weakref
+
+import metrics
+from backends import priority
+from llm_runtime import LLMBackend, LLMError
+
+# Provider quota for the API key. Requests wait for capacity instead of drawing 429s.
+RPM_LIMIT = int(os.getenv("LLM_RPM", 2000))
+TPM_LIMIT = int(os.getenv("LLM_TPM", 4_000_000))
+MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", 16))
+QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", 256))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 20))
+# Seconds after which a second copy of a slow request is sent (0 disables hedging).
+HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", 0))
+
+CHARS_PER_TOKEN = 4
+
+
+class LLMQueueFull(LLMError):
+    def __init__(self):
+        super().__init__("Too many explanations are waiting for the model; try again shortly", status=503)
+
+
+class TokenBucket:
+    # `rate` units per minute, with a burst of up to one minute's worth.
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float) -> bool:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level < amount:
+            return False
+        self.level -= amount
+        return True
+
+    async def take(self, amount: float) -> None:
+        # Callers share the event loop, so check-then-take is not interleaved.
+        amount = min(amount, self.capacity)
+        while not self.try_take(amount):
+            await asyncio.sleep((amount - self.level) / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        # Settles an estimate once the actual usage is known; may go negative (debt).
+        self.level = min(self.capacity, self.level - amount)
+
+
+def _backoff(attempt: int, error: LLMError) -> float:
+    # Full jitter, but never sooner than the server's Retry-After.
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, error.retry_after or 0)
+
+
+class LLMScheduler:
+    # Admission, rate limiting and retries for one API key. At most `concurrency` calls run
+    # at once; the rest wait in a bounded queue ordered by priority, then arrival. Every
+    # attempt takes one request and its estimated tokens from the buckets first.
+
+    def __init__(
+        self,
+        rpm: int = RPM_LIMIT,
+        tpm: int = TPM_LIMIT,
+        concurrency: int = MAX_CONCURRENT,
+        queue_limit: int = QUEUE_LIMIT,
+        max_retries: int = MAX_RETRIES,
+        hedge_after: float = HEDGE_AFTER,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.running = 0
+        self._waiting: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self.retries = 0
+        self.hedges = 0
+        self.rejected = 0
+
+    async def _admit(self) -> None:
+        if self.running < self.concurrency and not self._waiting:
+            self.running += 1
+            return
+        if len(self._waiting) >= self.queue_limit:
+            self.rejected += 1
+            raise LLMQueueFull()
+        slot = asyncio.get_running_loop().create_future()
+        entry = (priority.get(), next(self._order), slot)
+        heapq.heappush(self._waiting, entry)
+        started = time.perf_counter()
+        try:
+            await slot
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on.
+                self._release()
+            else:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            raise
+        finally:
+            metrics.add_time("llm_queue", time.perf_counter() - started)
+
+    def _release(self) -> None:
+        while self._waiting:
+            _, _, slot = heapq.heappop(self._waiting)
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.running -= 1
+
+    async def _attempt_budget(self, tokens: int) -> None:
+        await self.requests.take(1)
+        await self.tokens.take(tokens)
+
+    def _try_attempt_budget(self, tokens: int) -> bool:
+        # Takes from both buckets or from neither: the request taken for an attempt whose
+        # tokens are not available is given back.
+        if not self.requests.try_take(1):
+            return False
+        if self.tokens.try_take(tokens):
+            return True
+        self.requests.adjust(-1)
+        return False
+
+    def _settle(self, estimate: int, response: dict) -> None:
+        usage = response.get("usage") or {}
+        actual = usage.get("totalTokenCount") or (
+            usage.get("promptTokenCount", 0) + usage.get("candidatesTokenCount", 0)
+        )
+        if actual:
+            self.tokens.adjust(actual - estimate)
+
+    async def _hedged(self, call, tokens: int) -> dict:
+        first = asyncio.ensure_future(call())
+        if self.hedge_after <= 0:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done or not self._try_attempt_budget(tokens):
+            return await first
+
+        self.hedges += 1
+        metrics.count("llm_hedges")
+        tasks = {first, asyncio.ensure_future(call())}
+        try:
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not tasks:
+                    # Both copies failed; surface one of the errors.
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate(self, client: LLMBackend, prompt: str, **options) -> dict:
+        estimate = len(prompt) // CHARS_PER_TOKEN + options.get("max_output_tokens", 4096) // 4
+        await self._admit()
+        try:
+            for attempt in itertools.count():
+                await self._attempt_budget(estimate)
+                try:
+                    response = await self._hedged(lambda: client.generate(prompt, **options), estimate)
+                except LLMError as e:
+                    if not e.retryable or attempt >= self.max_retries:
+                        raise
+                    self.retries += 1
+                    metrics.count("llm_retries")
+                    await asyncio.sleep(_backoff(attempt, e))
+                    continue
+                self._settle(estimate, response)
+                return response
+        finally:
+            self._release()
+
+    async def stream(self, client: LLMBackend, prompt: str, **options):
+        # Retries only until the first chunk arrives; after that the caller has seen output.
+        estimate = len(prompt) // CHARS_PER_TOKEN + options.get("max_output_tokens", 4096) // 4
+        await self._admit()
+        try:
+            for attempt in itertools.count():
+                await self._attempt_budget(estimate)
+                started = False
+                last = None
+                try:
+                    async for chunk in client.stream(prompt, **options):
+                        started = True
+                        last = chunk
+                        yield chunk
+                except LLMError as e:
+                    if started or not e.retryable or attempt >= self.max_retries:
+                        raise
+                    self.retries += 1
+                    metrics.count("llm_retries")
+                    await asyncio.sleep(_backoff(attempt, e))
+                    continue
+                if last is not None:
+                    self._settle(estimate, last)
+                return
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": len(self._waiting),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "rejected": self.rejected,
+        }
+
+
+_lock = threading.Lock()
+_schedulers: "weakref.WeakKeyDictionary[LLMBackend, LLMScheduler]" = weakref.WeakKeyDictionary()
+
+
+def get_scheduler(client: LLMBackend) -> LLMScheduler:
+    # One scheduler per backend instance, i.e. per API key and model. Its methods run on the
+    # llm_runtime loop.
+    with _lock:
+        scheduler = _schedulers.get(client)
+        if scheduler is None:
+            scheduler = _schedulers[client] = LLMScheduler()
+        return scheduler
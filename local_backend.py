@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import re
+
+from llm_runtime import LLMBackend
+
+# A deterministic explanation backend that needs no network or API key. Answers are
+# built from the step headers and value changes in the prompt, so the same prompt always
+# gets the same explanation; tests and offline benchmarks use it in place of a model.
+
+STREAM_CHUNK = 64
+
+_STEP_BLOCK = re.compile(r"^--- Step (\d+) \[(\w+)\] Line (\d+): (.*?) ---$((?:\n  .*)*)", re.MULTILINE)
+_CHANGE = re.compile(r"^  (NEW|CHANGED|DELETED): (.*)$", re.MULTILINE)
+_VERBS = {"NEW": "creates", "CHANGED": "changes", "DELETED": "deletes"}
+
+
+def _explain_step(step: str, event: str, line: str, source: str, details: str) -> str:
+    text = f"Step {step} executes line {line}"
+    if source:
+        text += f" ({source.strip()})"
+    if event != "line":
+        text += f" on a {event} event"
+    changes = [f"{_VERBS[kind]} {change}" for kind, change in _CHANGE.findall(details)]
+    if changes:
+        text += "; it " + ", ".join(changes)
+    return text + "."
+
+
+def explanation_for(prompt: str) -> str:
+    if '{"summary": "..."}' in prompt:
+        return json.dumps({"summary": "Combined summary of the program's execution."})
+    steps = [
+        {"step": int(step), "line": int(line), "explanation": _explain_step(step, event, line, source, details)}
+        for step, event, line, source, details in _STEP_BLOCK.findall(prompt)
+    ]
+    return json.dumps({
+        "summary": f"The program runs for {len(steps)} explained steps and produces its result.",
+        "step_explanations": steps,
+        "key_concepts": ["variables", "control flow"],
+    })
+
+
+def _usage(prompt: str, text: str) -> dict:
+    return {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4}
+
+
+class LocalBackend(LLMBackend):
+    async def generate(
+        self, prompt: str, temperature: float = 0.3, max_output_tokens: int = 4096, response_schema: dict | None = None
+    ) -> dict:
+        text = explanation_for(prompt)
+        return {"text": text, "finish_reason": "STOP", "usage": _usage(prompt, text)}
+
+    async def stream(
+        self, prompt: str, temperature: float = 0.3, max_output_tokens: int = 4096, response_schema: dict | None = None
+    ):
+        text = explanation_for(prompt)
+        for start in range(0, len(text), STREAM_CHUNK):
+            last = start + STREAM_CHUNK >= len(text)
+            yield {
+                "text": text[start:start + STREAM_CHUNK],
+                "finish_reason": "STOP" if last else None,
+                "usage": _usage(prompt, text) if last else {},
+            }
+            await asyncio.sleep(0)
+
+
+_instances: dict[tuple, LocalBackend] = {}
+
+
+def local_backend(model: str) -> LocalBackend:
+    # Per process: in-flight tasks belong to the event loop of the process that made them.
+    key = (os.getpid(), model)
+    backend = _instances.get(key)
+    if backend is None:
+        backend = _instances.setdefault(key, LocalBackend(model))
+    return backend
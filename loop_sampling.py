@@ -0,0 +1,97 @@
+from collections import deque
+
+
+class Elision:
+    # Accumulates steps left out of a sampled trace. It is attached to the next step that
+    # is kept as step["elided"]; heap-table deltas of the dropped steps are carried over
+    # to that step so the heap can still be rebuilt.
+
+    def __init__(self):
+        self.from_step: int | None = None
+        self.to_step: int | None = None
+        self.steps = 0
+        self.loops: dict[int, int] = {}
+        self.heap: dict[str, dict] = {}
+
+    def count(self, step_number: int) -> None:
+        if self.from_step is None or step_number < self.from_step:
+            self.from_step = step_number
+        if self.to_step is None or step_number > self.to_step:
+            self.to_step = step_number
+        self.steps += 1
+
+    def add_step(self, step: dict) -> None:
+        record = step.get("elided")
+        if record is not None:
+            self.add_record(record)
+        if "heap" in step:
+            self.heap.update(step["heap"])
+        self.count(step["step"])
+
+    def add_record(self, record: dict) -> None:
+        self.from_step = record["from_step"] if self.from_step is None else min(self.from_step, record["from_step"])
+        self.to_step = record["to_step"] if self.to_step is None else max(self.to_step, record["to_step"])
+        self.steps += record["steps"]
+        for loop in record["loops"]:
+            self.loops[loop["line"]] = self.loops.get(loop["line"], 0) + loop["iterations"]
+
+    def add_iteration(self, line: int) -> None:
+        self.loops[line] = self.loops.get(line, 0) + 1
+
+    def attach(self, step: dict) -> None:
+        if self.heap:
+            step["heap"] = {**self.heap, **step.get("heap", {})}
+        if "elided" in step:
+            self.add_record(step["elided"])
+        step["elided"] = {
+            "from_step": self.from_step,
+            "to_step": self.to_step,
+            "steps": self.steps,
+            "loops": [{"line": line, "iterations": n} for line, n in sorted(self.loops.items())],
+        }
+
+
+class LoopSampler:
+    # Decides which iterations of one running loop are traced. The first `keep` iterations
+    # are. After that an iteration is only counted, without rendering its steps, until it
+    # reaches a line the iteration before it did not run (a branch went the other way); the
+    # rest of that iteration is traced. The state a skipped stretch leaves behind shows up in
+    # the next traced step, diffed against the last one traced.
+
+    def __init__(self, frame, header: int, end: int, keep: int):
+        self.frame = frame
+        self.header = header
+        self.end = end
+        self.keep = keep
+        self.iteration = 0
+        self.lines: set[int] = set()
+        self.last_lines: frozenset | None = None
+        self.diverged = False
+        # Whether any step of the current iteration was traced.
+        self.traced = False
+
+    @property
+    def tracing(self) -> bool:
+        return self.iteration <= self.keep or self.diverged
+
+    def contains(self, lineno: int) -> bool:
+        return self.header <= lineno <= self.end
+
+    def add_line(self, lineno: int) -> None:
+        if lineno not in self.lines:
+            if self.last_lines is not None and lineno not in self.last_lines:
+                self.diverged = True
+            self.lines.add(lineno)
+
+    def next_iteration(self) -> bool:
+        # Starts the next iteration; True if the one that ended was skipped entirely.
+        skipped = self.finish()
+        self.last_lines = frozenset(self.lines) if self.iteration else None
+        self.lines = set()
+        self.diverged = False
+        self.traced = False
+        self.iteration += 1
+        return skipped
+
+    def finish(self) -> bool:
+        return self.iteration > 0 and not self.traced
@@ -0,0 +1,178 @@
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# Upper bounds for phase timings (seconds) and per-request counters (steps, bytes, tokens...).
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+VALUE_BUCKETS = tuple(4 ** n for n in range(13))
+
+_current: ContextVar["RequestMetrics | None"] = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    # Phase timings and counters for one request. Phases may be recorded from several
+    # threads (batch runs, the LLM loop), so updates take a lock.
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, data: dict) -> None:
+        for name, seconds in data.get("phases", {}).items():
+            self.add_time(name, seconds)
+        for name, value in data.get("counters", {}).items():
+            self.count(name, value)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"phases": dict(self.phases), "counters": dict(self.counters)}
+
+    def server_timing(self) -> str:
+        data = self.as_dict()
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in data["phases"].items()]
+        entries += [f'{name};desc="{value:g}"' for name, value in data["counters"].items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+class _Phase:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder: RequestMetrics, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def start() -> RequestMetrics | None:
+    if not ENABLED:
+        return None
+    recorder = RequestMetrics()
+    _current.set(recorder)
+    return recorder
+
+
+def current() -> RequestMetrics | None:
+    return _current.get()
+
+
+def phase(name: str):
+    recorder = _current.get()
+    if recorder is None:
+        return _NULL_PHASE
+    return _Phase(recorder, name)
+
+
+def add_time(name: str, seconds: float) -> None:
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add_time(name, seconds)
+
+
+def count(name: str, value: float = 1) -> None:
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.count(name, value)
+
+
+def merge(data: dict) -> None:
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.merge(data)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> (per-bucket counts with a final +Inf slot, sum, count)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+        for labels, (counts, total, n) in sorted(series.items()):
+            label_text = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {n}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "code_explainer_request_seconds", "Request latency.", ("endpoint",), TIME_BUCKETS
+)
+PHASE_SECONDS = Histogram(
+    "code_explainer_phase_seconds", "Time spent per request phase.", ("endpoint", "phase"), TIME_BUCKETS
+)
+REQUEST_VALUES = Histogram(
+    "code_explainer_request_value", "Per-request counters such as steps, bytes and tokens.",
+    ("endpoint", "name"), VALUE_BUCKETS,
+)
+
+
+def observe(endpoint: str, recorder: RequestMetrics) -> None:
+    data = recorder.as_dict()
+    REQUEST_SECONDS.observe((endpoint,), time.perf_counter() - recorder.started)
+    for name, seconds in data["phases"].items():
+        PHASE_SECONDS.observe((endpoint, name), seconds)
+    for name, value in data["counters"].items():
+        REQUEST_VALUES.observe((endpoint, name), value)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for histogram in (REQUEST_SECONDS, PHASE_SECONDS, REQUEST_VALUES):
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
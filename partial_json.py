@@ -0,0 +1,116 @@
+import json
+from typing import Any
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",]}"
+
+
+class ExplanationStreamParser:
+    # Incrementally parses the explanation object as text arrives. Top-level fields are
+    # reported once their value is complete, and entries of array fields listed in
+    # STREAMED_ARRAYS are reported one by one, so callers can forward them before the
+    # model has finished the whole response. Leading code fences or prose are skipped.
+
+    STREAMED_ARRAYS = ("step_explanations",)
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.state = "start"
+        self.key: str | None = None
+        self.result: dict[str, Any] = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.state == "end"
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        self.buffer += chunk
+        events: list[tuple[str, Any]] = []
+        while self._advance(events):
+            pass
+        return events
+
+    def _decode(self) -> tuple[Any, int] | None:
+        try:
+            value, end = _decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            return None
+        # A number is only complete once a delimiter follows it: "12" may become "123",
+        # and "1" in "1." or "1e" is just the start of a float. Other values end in a
+        # closing quote, bracket or keyword and are complete as soon as they decode.
+        if type(value) in (int, float) and (end >= len(self.buffer) or self.buffer[end] not in _DELIMITERS):
+            return None
+        return value, end
+
+    def _advance(self, events: list) -> bool:
+        while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+            self.pos += 1
+        if self.pos >= len(self.buffer) or self.state == "end":
+            return False
+
+        ch = self.buffer[self.pos]
+
+        if self.state == "start":
+            self.pos += 1
+            if ch == "{":
+                self.state = "key"
+            return True
+
+        if self.state == "key":
+            if ch == "}":
+                self.pos += 1
+                self.state = "end"
+                return True
+            if ch == ",":
+                self.pos += 1
+                return True
+            decoded = self._decode()
+            if decoded is None:
+                return False
+            self.key, self.pos = decoded
+            self.state = "colon"
+            return True
+
+        if self.state == "colon":
+            if ch != ":":
+                raise ValueError(f"Expected ':' at offset {self.pos}")
+            self.pos += 1
+            self.state = "array_open" if self.key in self.STREAMED_ARRAYS else "value"
+            return True
+
+        if self.state == "array_open":
+            if ch != "[":
+                self.state = "value"
+                return True
+            self.pos += 1
+            self.result[self.key] = []
+            self.state = "array_item"
+            return True
+
+        if self.state == "array_item":
+            if ch == "]":
+                self.pos += 1
+                self.state = "key"
+                return True
+            if ch == ",":
+                self.pos += 1
+                return True
+            decoded = self._decode()
+            if decoded is None:
+                return False
+            item, self.pos = decoded
+            self.result[self.key].append(item)
+            events.append((self.key, item))
+            return True
+
+        # state == "value"
+        decoded = self._decode()
+        if decoded is None:
+            return False
+        value, self.pos = decoded
+        self.result[self.key] = value
+        events.append((self.key, value))
+        self.state = "key"
+        return True
@@ -0,0 +1,98 @@
+import gzip
+import os
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+from json_codec import dumps, orjson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
+# Preferred first when the client accepts several.
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain")
+
+
+class JSONProvider(DefaultJSONProvider):
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is not None and "indent" not in kwargs:
+            try:
+                return orjson.dumps(obj, default=self.default).decode("utf-8")
+            except (TypeError, orjson.JSONEncodeError):
+                pass
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        return super().dumps(obj, **kwargs)
+
+
+def encode_event(kind: str, payload: dict, sse: bool) -> str:
+    body = dumps(payload)
+    if sse:
+        return f"event: {kind}\ndata: {body}\n\n"
+    return body + "\n"
+
+
+def event_stream(events, sse: bool) -> Response:
+    # `events` may be a sync or an async iterable of encoded events.
+    response = Response(events, mimetype="text/event-stream" if sse else "application/x-ndjson")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _encode(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def negotiate_encoding(accept_encodings) -> str | None:
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress_response(response, accept_encodings):
+    # Compresses buffered JSON/text bodies above COMPRESS_MIN_BYTES. Strong ETags name one
+    # representation, so the encoding is appended to them.
+    response.vary.add("Accept-Encoding")
+    if (
+        response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in _COMPRESSIBLE_TYPES
+        or (response.content_length or 0) < COMPRESS_MIN_BYTES
+    ):
+        return response
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    with metrics.phase("compress"):
+        body = _encode(response.get_data(), encoding)
+    metrics.count("compressed_bytes", len(body))
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def matching_etag(if_none_match, etag: str) -> str | None:
+    # The tag the client already holds for `etag`, in whichever encoding it was sent.
+    for tag in (etag, *(f"{etag}-{encoding}" for encoding in ENCODINGS)):
+        if if_none_match.contains(tag):
+            return tag
+    return None
@@ -1,4 +1,9 @@
+import hashlib
+import os
 import signal
+import threading
+from collections import OrderedDict
+
 from RestrictedPython import compile_restricted, safe_globals
 from RestrictedPython.Eval import (
     default_guarded_getattr,
@@ -11,19 +16,34 @@ from RestrictedPython.Guards import (
 )
 from RestrictedPython import PrintCollector
 
+import metrics
+from line_index import build_line_index
 from tracer import ExecutionTracer
 
 
+DEFAULT_TIMEOUT = 5
+
+# Error types reported for runs cut short by the time limit, in-process or by the worker pool.
+TIMEOUT_ERROR_TYPES = frozenset({"ExecutionTimeout", "TimeoutError"})
+# Runs cut short by something other than the program: the time limit, or a pool worker that
+# was killed, ran out of memory, sent garbage or was not available. Never cached.
+TRANSIENT_ERROR_TYPES = TIMEOUT_ERROR_TYPES | {"ResourceLimitExceeded", "MemoryError", "SandboxError", "SandboxPoolBusy"}
+
+# Restricted compiles (and their line index) kept per process, keyed by source hash.
+COMPILE_CACHE_SIZE = int(os.environ.get("COMPILE_CACHE_SIZE", 256))
+
+ALLOWED_MODULES = frozenset({"math", "string", "itertools", "functools", "collections", "decimal", "fractions", "statistics", "random"})
+
+
 class ExecutionTimeout(Exception):
     pass
 
 
 def _timeout_handler(signum, frame):
-    raise ExecutionTimeout("Code execution exceeded the time limit (5 seconds)")
+    raise ExecutionTimeout(f"Code execution exceeded the time limit ({DEFAULT_TIMEOUT} seconds)")
 
 
 def _restricted_import(name, *args, **kwargs):
-    ALLOWED_MODULES = {"math", "string", "itertools", "functools", "collections", "decimal", "fractions", "statistics", "random"}
     if name in ALLOWED_MODULES:
         return __import__(name, *args, **kwargs)
     raise ImportError(f"Import of '{name}' is not allowed in the sandbox")
@@ -113,7 +133,11 @@ def _build_restricted_globals() -> dict:
     return restricted
 
 
-def validate_code(source: str) -> tuple[object | None, dict | None]:
+_compile_cache: OrderedDict[str, tuple[object | None, dict | None, dict[int, dict]]] = OrderedDict()
+_compile_lock = threading.Lock()
+
+
+def _compile_restricted(source: str) -> tuple[object | None, dict | None]:
     try:
         compiled = compile_restricted(source, "<user_code>", "exec")
         return compiled, None
@@ -124,18 +148,52 @@ def validate_code(source: str) -> tuple[object | None, dict | None]:
         }
 
 
-def execute_sandboxed(source: str, timeout: int = 5) -> dict:
-    compiled, validation_error = validate_code(source)
+def compile_source(source: str) -> tuple[object | None, dict | None, dict[int, dict]]:
+    key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    with _compile_lock:
+        entry = _compile_cache.get(key)
+        if entry is not None:
+            _compile_cache.move_to_end(key)
+    if entry is not None:
+        metrics.count("compile_cache_hit")
+        return entry
+
+    compiled, error = _compile_restricted(source)
+    entry = (compiled, error, build_line_index(source) if compiled is not None else {})
+    with _compile_lock:
+        _compile_cache[key] = entry
+        while len(_compile_cache) > COMPILE_CACHE_SIZE:
+            _compile_cache.popitem(last=False)
+    return entry
+
+
+def validate_code(source: str) -> tuple[object | None, dict | None]:
+    compiled, error, _ = compile_source(source)
+    return compiled, error
+
+
+def error_result(source: str, error: dict) -> dict:
+    return {
+        "source": source,
+        "source_lines": source.splitlines(),
+        "steps": [],
+        "step_count": 0,
+        "completed": False,
+        "error": error,
+        "truncated": False,
+    }
+
+
+def execute_sandboxed(
+    source: str,
+    timeout: int = DEFAULT_TIMEOUT,
+    tracer_options: dict | None = None,
+    on_step=None,
+) -> dict:
+    with metrics.phase("compile"):
+        compiled, validation_error, line_index = compile_source(source)
     if validation_error:
-        return {
-            "source": source,
-            "source_lines": source.splitlines(),
-            "steps": [],
-            "step_count": 0,
-            "completed": False,
-            "error": validation_error,
-            "truncated": False,
-        }
+        return error_result(source, validation_error)
 
     old_handler = None
     try:
@@ -146,27 +204,16 @@ def execute_sandboxed(source: str, timeout: int = 5) -> dict:
 
     try:
         exec_globals = _build_restricted_globals()
-        tracer = ExecutionTracer(source)
-        result = tracer.run(exec_globals=exec_globals, compiled_code=compiled)
+        tracer = ExecutionTracer(
+            source, on_step=on_step, keep_steps=on_step is None, line_index=line_index, **(tracer_options or {})
+        )
+        with metrics.phase("trace"):
+            result = tracer.run(exec_globals=exec_globals, compiled_code=compiled)
         return result
     except ExecutionTimeout as e:
-        return {
-            "source": source,
-            "steps": [],
-            "step_count": 0,
-            "completed": False,
-            "error": {"type": "TimeoutError", "message": str(e)},
-            "truncated": False,
-        }
+        return error_result(source, {"type": "TimeoutError", "message": str(e)})
     except Exception as e:
-        return {
-            "source": source,
-            "steps": [],
-            "step_count": 0,
-            "completed": False,
-            "error": {"type": type(e).__name__, "message": str(e)},
-            "truncated": False,
-        }
+        return error_result(source, {"type": type(e).__name__, "message": str(e)})
     finally:
         try:
             signal.alarm(0)
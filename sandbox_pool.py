@@ -0,0 +1,434 @@
+import atexit
+import contextvars
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from json_codec import dumps, loads
+from sandbox import DEFAULT_TIMEOUT, error_result, execute_sandboxed
+
+POOL_SIZE = int(os.environ.get("SANDBOX_WORKERS", os.cpu_count() or 1))
+MAX_TASKS_PER_WORKER = int(os.environ.get("SANDBOX_MAX_TASKS", 200))
+MAX_QUEUED = int(os.environ.get("SANDBOX_MAX_QUEUED", 4 * POOL_SIZE))
+QUEUE_WAIT = float(os.environ.get("SANDBOX_QUEUE_WAIT", 10))
+MEMORY_LIMIT = int(os.environ.get("SANDBOX_MEMORY_BYTES", 512 * 1024 * 1024))
+BATCH_MAX_ITEMS = int(os.environ.get("SANDBOX_BATCH_MAX", 500))
+
+# Steps buffered between the tracer thread and the response in the in-process fallback.
+STREAM_BUFFER = 64
+# Seconds a fallback tracer thread waits on a stalled consumer before giving up.
+STREAM_STALL = 30
+
+# Extra time the parent grants past the in-worker SIGALRM before killing the worker outright.
+KILL_GRACE = 1.0
+# How often a stream's reader checks whether the client went away while the program runs.
+ABANDON_CHECK = 0.1
+
+
+class SandboxPoolBusy(Exception):
+    pass
+
+
+# Worker messages: (kind, payload). They are JSON, never pickles: a program that escaped the
+# sandbox must not be able to run code in the server by what it writes to the pipe.
+_MESSAGE_KINDS = frozenset({"step", "metrics", "done"})
+
+
+def _send(conn, kind: str, payload: dict) -> None:
+    conn.send_bytes(dumps([kind, payload]).encode("utf-8"))
+
+
+def _read_message(data: bytes) -> tuple[str, dict]:
+    message = loads(data)
+    if not (isinstance(message, list) and len(message) == 2 and message[0] in _MESSAGE_KINDS):
+        raise ValueError("malformed worker message")
+    kind, payload = message
+    if not isinstance(payload, dict):
+        raise ValueError(f"malformed {kind} message")
+    if kind == "metrics":
+        for section in ("phases", "counters"):
+            values = payload.get(section, {})
+            if not isinstance(values, dict) or not all(
+                isinstance(name, str) and type(value) in (int, float) for name, value in values.items()
+            ):
+                raise ValueError("malformed metrics message")
+    elif kind == "done" and not isinstance(payload.get("steps"), list):
+        raise ValueError("malformed done message")
+    return kind, payload
+
+
+def _address_space_in_use() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _set_cpu_limit(seconds: int) -> None:
+    import resource
+
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    spent = int(used.ru_utime + used.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = spent + seconds + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, memory_limit: int) -> None:
+    try:
+        import resource
+
+        limit = _address_space_in_use() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        resource = None
+
+    # Warm the compiler and globals so the first real request pays no import cost.
+    from sandbox import _build_restricted_globals, validate_code
+
+    _build_restricted_globals()
+    validate_code("pass")
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        kind, source, timeout, tracer_options = message
+        on_step = None
+        if kind == "stream":
+            def on_step(step):
+                _send(conn, "step", step)
+
+        if resource is not None:
+            _set_cpu_limit(timeout)
+        recorder = metrics.start()
+        try:
+            result = execute_sandboxed(source, timeout, tracer_options, on_step)
+        except MemoryError:
+            result = error_result(source, {"type": "MemoryError", "message": "Code exceeded the sandbox memory limit"})
+        if recorder is not None:
+            _send(conn, "metrics", recorder.as_dict())
+        _send(conn, "done", result)
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["sandbox", "sandbox_pool"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class _Worker:
+    def __init__(self, ctx, memory_limit: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        max_tasks: int = MAX_TASKS_PER_WORKER,
+        max_queued: int = MAX_QUEUED,
+        queue_wait: float = QUEUE_WAIT,
+        memory_limit: int = MEMORY_LIMIT,
+    ):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.queue_wait = queue_wait
+        self.memory_limit = memory_limit
+        self._ctx = _context()
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        # Running plus waiting requests; anything beyond this is rejected immediately.
+        self._admission = threading.BoundedSemaphore(size + max_queued)
+        self._closed = False
+        self.respawns = 0
+        self.recycled = 0
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.memory_limit)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        self.respawns += 1
+        return self._spawn()
+
+    def _checkout(self, wait: bool = False) -> _Worker:
+        if self._closed:
+            raise SandboxPoolBusy("Sandbox pool is shut down")
+        admitted = self._admission.acquire(timeout=self.queue_wait) if wait else self._admission.acquire(blocking=False)
+        if not admitted:
+            raise SandboxPoolBusy("Too many queued executions")
+        try:
+            return self._idle.get(timeout=self.queue_wait)
+        except queue.Empty:
+            self._admission.release()
+            raise SandboxPoolBusy("No sandbox worker became available")
+
+    def _checkin(self, worker: _Worker) -> None:
+        try:
+            self._release(worker)
+        finally:
+            self._admission.release()
+
+    def run(
+        self, source: str, timeout: int = DEFAULT_TIMEOUT, tracer_options: dict | None = None, wait: bool = False
+    ) -> dict:
+        worker = self._checkout(wait)
+        result = None
+        for kind, payload in self._exchange(worker, "run", source, timeout, tracer_options):
+            if kind == "done":
+                result = payload
+        return result
+
+    def stream(self, source: str, timeout: int = DEFAULT_TIMEOUT, tracer_options: dict | None = None):
+        worker = self._checkout()
+        abandoned = threading.Event()
+        messages = self._exchange(worker, "stream", source, timeout, tracer_options, abandoned)
+        # Prime the generator so closing it early always hands the worker back.
+        next(messages)
+        # The worker's output is read as it comes, not as the client takes it: a slow client
+        # would otherwise block the program on a full pipe, run it into its time limit, and
+        # hold the worker meanwhile. Steps are bounded by the budget, so the buffer is too.
+        buffered: queue.Queue = queue.Queue()
+
+        def drain():
+            try:
+                for message in messages:
+                    if abandoned.is_set():
+                        break
+                    buffered.put(message)
+            except Exception:
+                buffered.put(("done", error_result(source, {"type": "SandboxError", "message": "The sandbox stream failed"})))
+                raise
+            finally:
+                messages.close()
+
+        context = contextvars.copy_context()
+        reader = threading.Thread(target=context.run, args=(drain,), name="sandbox-stream", daemon=True)
+        reader.start()
+        stream = _buffered(buffered, abandoned, reader)
+        # Primed as well, so closing it before the first step still stops the run.
+        next(stream)
+        return stream
+
+    def _exchange(
+        self,
+        worker: _Worker,
+        kind: str,
+        source: str,
+        timeout: int,
+        tracer_options: dict | None,
+        abandoned: threading.Event | None = None,
+    ):
+        done = None
+        error = None
+        try:
+            yield ("started", None)
+            worker.conn.send((kind, source, timeout, tracer_options))
+            deadline = time.monotonic() + timeout + KILL_GRACE
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error = {"type": "TimeoutError", "message": f"Code execution exceeded the time limit ({timeout} seconds)"}
+                    break
+                if abandoned is None:
+                    if not worker.conn.poll(remaining):
+                        continue
+                elif not worker.conn.poll(min(remaining, ABANDON_CHECK)):
+                    if abandoned.is_set():
+                        error = {"type": "SandboxError", "message": "The stream was closed before the run finished"}
+                        break
+                    continue
+                data = worker.conn.recv_bytes()
+                message = _read_message(data)
+                if message[0] == "metrics":
+                    metrics.merge(message[1])
+                    continue
+                metrics.count("trace_bytes", len(data))
+                if message[0] == "done":
+                    worker.tasks += 1
+                    done = message
+                    break
+                yield message
+        except (EOFError, OSError):
+            # The worker died mid-run, most likely from RLIMIT_CPU or RLIMIT_AS.
+            error = {"type": "ResourceLimitExceeded", "message": "Code exceeded the sandbox CPU or memory limit"}
+        except (ValueError, RecursionError):
+            error = {"type": "SandboxError", "message": "The sandbox worker sent a malformed result"}
+        finally:
+            # A worker that did not finish cleanly (timeout, crash, abandoned stream) is out of sync.
+            if done is None:
+                worker = self._replace(worker)
+            self._checkin(worker)
+        yield done if done is not None else ("done", error_result(source, error))
+
+    def _release(self, worker: _Worker) -> None:
+        if self._closed:
+            worker.stop()
+            return
+        if worker.tasks >= self.max_tasks:
+            worker.stop()
+            worker = self._spawn()
+            self.recycled += 1
+        self._idle.put(worker)
+
+    def shutdown(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "respawns": self.respawns,
+            "recycled": self.recycled,
+        }
+
+
+def _buffered(messages: queue.Queue, abandoned: threading.Event, reader: threading.Thread):
+    try:
+        yield ("started", None)
+        while True:
+            message = messages.get()
+            yield message
+            if message[0] == "done":
+                return
+    finally:
+        # Closed early: stop the run instead of finishing it for nobody, and hand the worker
+        # back before returning.
+        abandoned.set()
+        reader.join()
+
+
+_pool: SandboxPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def _stream_in_thread(source: str, timeout: int, tracer_options: dict | None):
+    # In-process fallback: SIGALRM is unavailable off the main thread, so the time limit
+    # is not enforced here; the bounded queue still keeps memory per stream constant.
+    messages: queue.Queue = queue.Queue(maxsize=STREAM_BUFFER)
+
+    def target():
+        result = execute_sandboxed(
+            source, timeout, tracer_options, lambda step: messages.put(("step", step), timeout=STREAM_STALL)
+        )
+        try:
+            messages.put(("done", result), timeout=STREAM_STALL)
+        except queue.Full:
+            pass
+
+    threading.Thread(target=target, daemon=True).start()
+    while True:
+        message = messages.get()
+        yield message
+        if message[0] == "done":
+            return
+
+
+def stream_pooled(source: str, timeout: int = DEFAULT_TIMEOUT, tracer_options: dict | None = None):
+    if POOL_SIZE <= 0:
+        return _stream_in_thread(source, timeout, tracer_options)
+    return get_pool().stream(source, timeout, tracer_options)
+
+
+def execute_pooled(source: str, timeout: int = DEFAULT_TIMEOUT, tracer_options: dict | None = None) -> dict:
+    if POOL_SIZE <= 0:
+        return execute_sandboxed(source, timeout, tracer_options)
+    return get_pool().run(source, timeout, tracer_options)
+
+
+def execute_batch(
+    sources: list[str],
+    timeout: int = DEFAULT_TIMEOUT,
+    tracer_options: dict | None = None,
+    cache=None,
+    pool: SandboxPool | None = None,
+):
+    # Yields (index, result) as each trace completes. Identical sources run once and share
+    # a result; `cache` is an optional TraceCache consulted per unique source.
+    positions: dict[str, list[int]] = {}
+    for index, source in enumerate(sources):
+        positions.setdefault(source, []).append(index)
+
+    if pool is None and POOL_SIZE > 0:
+        pool = get_pool()
+
+    def run(source: str, timeout: int, tracer_options: dict | None) -> dict:
+        if pool is None:
+            return execute_sandboxed(source, timeout, tracer_options)
+        # Batch threads are bounded by the pool size, so they wait for admission instead
+        # of being turned away like a burst of single requests.
+        return pool.run(source, timeout, tracer_options, wait=True)
+
+    def run_one(source: str) -> dict:
+        try:
+            if cache is not None:
+                return cache.get_or_run(source, run, timeout, tracer_options)
+            return run(source, timeout, tracer_options)
+        except SandboxPoolBusy as e:
+            return error_result(source, {"type": "SandboxPoolBusy", "message": str(e)})
+
+    if pool is None:
+        for source, indexes in positions.items():
+            result = run_one(source)
+            for index in indexes:
+                yield index, result
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(pool.size, len(positions))), thread_name_prefix="batch")
+    try:
+        # Each thread runs in a copy of the caller's context so per-request metrics follow it.
+        futures = {executor.submit(contextvars.copy_context().run, run_one, source): source for source in positions}
+        for future in as_completed(futures):
+            result = future.result()
+            for index in positions[futures[future]]:
+                yield index, result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,43 @@
+import argparse
+import logging
+import os
+
+import uvicorn
+
+from admission import gates
+from asgi import WSGI_THREADS
+
+# Production entry point: `python serve.py` runs asgi.application on uvicorn. The explain
+# endpoints are async, so a request waiting for its slot or on the model holds no thread;
+# model calls run on the shared LLM event loop. The other routes run the Flask app on a
+# bounded pool of WSGI_THREADS threads. Concurrency is bounded by the admission gates, so
+# requests beyond the limits are answered with 503 at once rather than queueing in the listen
+# backlog. `python app.py` starts Werkzeug's development server, which is not for production.
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5000))
+LISTEN_BACKLOG = int(os.environ.get("LISTEN_BACKLOG", 1024))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the explainer for production traffic")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    limits = ", ".join(f"{name} {gate.concurrency} running / {gate.queue_limit} queued" for name, gate in gates.items())
+    logging.getLogger("serve").info("Serving on http://%s:%d (%s, %d WSGI threads)", args.host, args.port, limits, WSGI_THREADS)
+    # One process: the gates, caches and sandbox pool are per process.
+    uvicorn.run(
+        "asgi:application",
+        host=args.host,
+        port=args.port,
+        backlog=LISTEN_BACKLOG,
+        lifespan="off",
+        access_log=False,
+        log_config=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,11 @@ index = binary_search(data, 23)
 print(index)`,
 };
 
+// The last streamed trace, so "Trace + Explain" on unchanged code reuses it instead of re-running.
+let lastTrace = null;
+// Source of the trace on screen; truncated values in it are expanded by re-running it.
+let shownSource = null;
+
 function loadExample(name) {
     document.getElementById('code-input').value = EXAMPLES[name];
 }
@@ -65,25 +70,45 @@ async function runTrace() {
 
     setLoading(true, 'Executing and tracing code...');
     try {
-        const resp = await fetch('/api/trace', {
+        const resp = await fetch('/api/trace/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ code }),
+            body: JSON.stringify({ code, sampling: true }),
         });
-        const data = await resp.json();
 
-        if (data.error && typeof data.error === 'string') {
-            alert(data.error);
+        if (!resp.ok) {
+            const data = await resp.json();
+            alert(data.error || `Request failed (${resp.status})`);
             return;
         }
 
-        renderTrace(data);
+        const trace = { steps: [] };
+        shownSource = code;
+        const panel = document.getElementById('trace-panel');
+        panel.innerHTML = '';
+        document.getElementById('trace-status').innerHTML = '<span class="status-badge">Running...</span>';
         document.getElementById('explanation-panel').innerHTML =
             '<div style="color: var(--text-muted); font-size: 0.85rem;">Click "Trace + Explain" to generate AI-powered explanations.</div>';
         document.getElementById('explanation-depth').textContent = '';
-        document.getElementById('raw-json').textContent = JSON.stringify(data, null, 2);
         document.getElementById('prompt-preview').textContent = '';
         document.getElementById('results').style.display = 'grid';
+
+        await readNdjson(resp, (event) => {
+            if (event.type === 'start') {
+                trace.source_lines = event.source_lines;
+            } else if (event.type === 'step') {
+                trace.steps.push(event.step);
+                panel.insertAdjacentHTML('beforeend', renderStep(event.step));
+            } else if (event.type === 'end') {
+                Object.assign(trace, event);
+                delete trace.type;
+            }
+        });
+
+        lastTrace = trace.trace_id ? { code, trace_id: trace.trace_id } : null;
+        renderTraceStatus(trace);
+        panel.insertAdjacentHTML('beforeend', renderTraceFooter(trace));
+        document.getElementById('raw-json').textContent = JSON.stringify(trace, null, 2);
         document.getElementById('debug-section').classList.remove('hidden');
     } catch (e) {
         alert('Request failed: ' + e.message);
@@ -92,6 +117,24 @@ async function runTrace() {
     }
 }
 
+async function readNdjson(resp, onEvent) {
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) onEvent(JSON.parse(line));
+        }
+    }
+    if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
+
 async function runExplain() {
     const code = document.getElementById('code-input').value;
     const depth = document.getElementById('depth').value;
@@ -99,24 +142,52 @@ async function runExplain() {
 
     setLoading(true, 'Executing code and generating AI explanation...');
     try {
-        const resp = await fetch('/api/explain', {
+        const resp = await fetch('/api/explain/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ code, depth }),
+            body: JSON.stringify(lastTrace && lastTrace.code === code
+                ? { trace_id: lastTrace.trace_id, depth }
+                : { code, depth, sampling: true }),
         });
-        const data = await resp.json();
 
-        if (data.error && typeof data.error === 'string') {
-            alert(data.error);
+        if (!resp.ok) {
+            const data = await resp.json();
+            alert(data.error || `Request failed (${resp.status})`);
             return;
         }
 
-        renderTrace(data.trace);
-        renderExplanation(data);
-        document.getElementById('raw-json').textContent = JSON.stringify(data.trace, null, 2);
-        document.getElementById('prompt-preview').textContent = data.prompt_preview || '';
-        document.getElementById('results').style.display = 'grid';
-        document.getElementById('debug-section').classList.remove('hidden');
+        const expl = { depth, step_explanations: [] };
+        await readNdjson(resp, (event) => {
+            switch (event.type) {
+                case 'trace':
+                    shownSource = event.trace.source || code;
+                    renderTrace(event.trace);
+                    document.getElementById('raw-json').textContent = JSON.stringify(event.trace, null, 2);
+                    document.getElementById('prompt-preview').textContent = event.prompt_preview || '';
+                    document.getElementById('results').style.display = 'grid';
+                    document.getElementById('debug-section').classList.remove('hidden');
+                    setLoading(true, 'Generating AI explanation...');
+                    break;
+                case 'summary':
+                    expl.summary = event.summary;
+                    renderExplanation({ explanation: expl });
+                    break;
+                case 'step_explanation':
+                    expl.step_explanations.push(event.step_explanation);
+                    renderExplanation({ explanation: expl });
+                    break;
+                case 'key_concepts':
+                    expl.key_concepts = event.key_concepts;
+                    renderExplanation({ explanation: expl });
+                    break;
+                case 'done':
+                    renderExplanation({ explanation: event.explanation });
+                    break;
+                case 'error':
+                    renderExplanation({ ai_error: event.ai_error });
+                    break;
+            }
+        });
     } catch (e) {
         alert('Request failed: ' + e.message);
     } finally {
@@ -125,90 +196,110 @@ async function runExplain() {
 }
 
 function renderTrace(trace) {
-    const panel = document.getElementById('trace-panel');
+    renderTraceStatus(trace);
+
+    const html = trace.steps.map(renderStep).join('') + renderTraceFooter(trace);
+    document.getElementById('trace-panel').innerHTML = html;
+}
+
+function renderTraceStatus(trace) {
     const status = document.getElementById('trace-status');
 
     if (trace.error) {
         status.innerHTML = `<span class="status-badge error">${trace.error.type}</span>`;
     } else if (trace.truncated) {
         status.innerHTML = `<span class="status-badge truncated">Truncated (${trace.step_count} steps)</span>`;
+    } else if (trace.elided_steps) {
+        status.innerHTML = `<span class="status-badge success">${trace.step_count} steps (${trace.steps.length} shown)</span>`;
     } else {
         status.innerHTML = `<span class="status-badge success">${trace.step_count} steps</span>`;
     }
+}
 
-    let html = '';
-
-    for (const step of trace.steps) {
-        const hasChanges = step.changes &&
-            (Object.keys(step.changes.created || {}).length > 0 ||
-             Object.keys(step.changes.updated || {}).length > 0 ||
-             Object.keys(step.changes.deleted || {}).length > 0);
-        const hasControl = !!step.control_flow;
-
-        let classes = 'trace-step';
-        if (hasChanges) classes += ' has-changes';
-        if (hasControl) classes += ' has-control-flow';
-
-        html += `<div class="${classes}">`;
-        html += `<div class="step-header">`;
-        html += `<span class="step-number">Step ${step.step}</span>`;
-        html += `<span class="step-event">${step.event}</span>`;
-        html += `</div>`;
-        html += `<div class="step-source"><span class="line-num">${step.line_number}</span>${escapeHtml(step.source_line)}</div>`;
+function renderTraceFooter(trace) {
+    if (trace.error) {
+        return `<div class="error-box">${escapeHtml(trace.error.type)}: ${escapeHtml(trace.error.message)}</div>`;
+    }
+    if (trace.steps.length === 0) {
+        return '<div style="color: var(--text-muted);">No execution steps captured.</div>';
+    }
+    return '';
+}
 
-        if (step.changes) {
-            const c = step.changes;
-            for (const [name, val] of Object.entries(c.created || {})) {
-                html += `<div class="var-change var-created">+ ${name} = ${formatValue(val)}</div>`;
-            }
-            for (const [name, info] of Object.entries(c.updated || {})) {
-                html += `<div class="var-change var-updated">~ ${name}: ${formatValue(info.from)} → ${formatValue(info.to)}</div>`;
-            }
-            for (const [name, val] of Object.entries(c.deleted || {})) {
-                html += `<div class="var-change var-deleted">- ${name} (was ${formatValue(val)})</div>`;
-            }
-        }
+function renderStep(step) {
+    const hasChanges = step.changes &&
+        (Object.keys(step.changes.created || {}).length > 0 ||
+         Object.keys(step.changes.updated || {}).length > 0 ||
+         Object.keys(step.changes.deleted || {}).length > 0);
+    const hasControl = !!step.control_flow;
 
-        if (step.control_flow) {
-            const cf = step.control_flow;
-            let cfText = '';
-            switch (cf.type) {
-                case 'function_call':
-                    cfText = `→ call ${cf.function}() [depth: ${cf.call_depth}]`;
-                    break;
-                case 'function_return':
-                    cfText = `← return from ${cf.function}(): ${formatValue(cf.return_value)}`;
-                    break;
-                case 'conditional':
-                    cfText = `? ${cf.expression}`;
-                    break;
-                case 'loop':
-                    cfText = `↻ ${cf.expression}`;
-                    break;
-                case 'exception':
-                    cfText = `✗ ${cf.exception_type}: ${cf.exception_message}`;
-                    break;
-                case 'return_statement':
-                    cfText = `↩ ${cf.expression}`;
-                    break;
-            }
-            if (cfText) {
-                html += `<div class="control-flow-info">${escapeHtml(cfText)}</div>`;
-            }
-        }
+    let classes = 'trace-step';
+    if (hasChanges) classes += ' has-changes';
+    if (hasControl) classes += ' has-control-flow';
 
-        html += `</div>`;
+    let html = '';
+    if (step.elided) {
+        const loops = step.elided.loops.map(l => `${l.iterations} iterations of line ${l.line}`).join(', ');
+        html += `<div class="trace-elided">… steps ${step.elided.from_step}–${step.elided.to_step} skipped${loops ? ` (${loops})` : ''}</div>`;
     }
-
-    if (trace.error) {
-        html += `<div class="error-box">${escapeHtml(trace.error.type)}: ${escapeHtml(trace.error.message)}</div>`;
+    html += `<div class="${classes}">`;
+    html += `<div class="step-header">`;
+    html += `<span class="step-number">Step ${step.step}</span>`;
+    html += `<span class="step-event">${step.event}</span>`;
+    html += `</div>`;
+    html += `<div class="step-source"><span class="line-num">${step.line_number}</span>${escapeHtml(step.source_line)}</div>`;
+
+    if (step.changes) {
+        const c = step.changes;
+        for (const [name, val] of Object.entries(c.created || {})) {
+            html += `<div class="var-change var-created">+ ${name} = ${formatValue(val, step.step)}</div>`;
+        }
+        for (const [name, info] of Object.entries(c.updated || {})) {
+            html += `<div class="var-change var-updated">~ ${name}: ${formatValue(info.from)} → ${formatValue(info.to, step.step)}</div>`;
+        }
+        for (const [name, val] of Object.entries(c.deleted || {})) {
+            html += `<div class="var-change var-deleted">- ${name} (was ${formatValue(val)})</div>`;
+        }
     }
 
-    if (trace.steps.length === 0 && !trace.error) {
-        html = '<div style="color: var(--text-muted);">No execution steps captured.</div>';
+    if (step.control_flow) {
+        const cf = step.control_flow;
+        let cfText = '';
+        let cfValue = '';
+        switch (cf.type) {
+            case 'function_call':
+                cfText = `→ call ${cf.function}() [depth: ${cf.call_depth}]`;
+                break;
+            case 'function_return':
+                cfText = `← return from ${cf.function}(): `;
+                cfValue = formatValue(cf.return_value, step.step);
+                break;
+            case 'conditional':
+                cfText = `? ${cf.expression}`;
+                break;
+            case 'loop':
+                cfText = `↻ ${cf.expression}`;
+                break;
+            case 'exception':
+                cfText = `✗ ${cf.exception_type}: ${cf.exception_message}`;
+                break;
+            case 'return_statement':
+                cfText = `↩ ${cf.expression}`;
+                break;
+            case 'context_manager':
+                cfText = `⊏ ${cf.expression}`;
+                break;
+            case 'try_block':
+                cfText = `⚑ ${cf.expression}`;
+                break;
+        }
+        if (cfText) {
+            html += `<div class="control-flow-info">${escapeHtml(cfText)}${cfValue}</div>`;
+        }
     }
 
-    panel.innerHTML = html;
+    html += `</div>`;
+    return html;
 }
 
 function renderExplanation(data) {
@@ -256,22 +347,57 @@ function renderExplanation(data) {
     panel.innerHTML = html;
 }
 
-function formatValue(val) {
+// `step` is the step the value belongs to; values the tracer cut off are then expandable.
+function formatValue(val, step) {
     if (val === null || val === undefined) return 'None';
     if (typeof val === 'object' && 'type' in val && 'value' in val) {
-        const v = val.value;
-        if (val.type === 'str') return `"${v}"`;
-        if (Array.isArray(v)) {
-            const inner = v.map(formatValue).join(', ');
-            return val.type === 'tuple' ? `(${inner})` : `[${inner}]`;
-        }
-        if (typeof v === 'object' && v !== null && !Array.isArray(v)) {
-            const entries = Object.entries(v).map(([k, vv]) => `${k}: ${formatValue(vv)}`);
-            return `{${entries.join(', ')}}`;
+        const shown = formatContents(val, step);
+        if (!val.handle || !step) return shown;
+        const handle = encodeURIComponent(JSON.stringify(val.handle));
+        const label = val.length !== undefined ? `expand (${val.length})` : 'expand';
+        return `<span class="value-truncated">${shown} <span class="value-handle" data-step="${step}" ` +
+            `data-handle="${handle}" title="Show the full value at this step">${label}</span></span>`;
+    }
+    return escapeHtml(String(val));
+}
+
+function formatContents(val, step) {
+    const v = val.value;
+    if (val.type === 'str') return `"${escapeHtml(v)}${val.handle ? '…' : ''}"`;
+    if (Array.isArray(v)) {
+        const inner = v.map(item => formatValue(item, step)).join(', ');
+        return val.type === 'tuple' ? `(${inner})` : `[${inner}]`;
+    }
+    if (typeof v === 'object' && v !== null) {
+        const entries = Object.entries(v).map(([k, vv]) => `${escapeHtml(k)}: ${formatValue(vv, step)}`);
+        return `{${entries.join(', ')}}`;
+    }
+    return escapeHtml(String(v));
+}
+
+async function expandValue(link) {
+    const step = Number(link.dataset.step);
+    const handle = JSON.parse(decodeURIComponent(link.dataset.handle));
+    const source = lastTrace && lastTrace.code === shownSource
+        ? { trace_id: lastTrace.trace_id }
+        : { code: shownSource };
+    link.textContent = 'expanding…';
+    try {
+        const resp = await fetch('/api/trace/expand', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...source, step, handle }),
+        });
+        const data = await resp.json();
+        if (!resp.ok) {
+            link.textContent = data.error || `unavailable (${resp.status})`;
+            link.classList.add('failed');
+            return;
         }
-        return String(v);
+        link.closest('.value-truncated').outerHTML = formatValue(data.value, step);
+    } catch (e) {
+        link.textContent = 'expand failed';
     }
-    return String(val);
 }
 
 function escapeHtml(text) {
@@ -280,6 +406,11 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
+document.getElementById('trace-panel').addEventListener('click', function(e) {
+    const link = e.target.closest('.value-handle');
+    if (link && !link.classList.contains('failed')) expandValue(link);
+});
+
 document.getElementById('code-input').addEventListener('keydown', function(e) {
     if (e.key === 'Tab') {
         e.preventDefault();
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionRejected, Gate
+
+
+def test_acquire_async_admits_while_slots_are_free():
+    gate = Gate("test", concurrency=2, queue_limit=0)
+
+    async def main():
+        await gate.acquire_async()
+        await gate.acquire_async()
+        with pytest.raises(AdmissionRejected):
+            await gate.acquire_async()
+
+    asyncio.run(main())
+    assert gate.running == 2 and gate.rejected == 1
+
+
+def test_release_hands_the_slot_to_the_first_waiter():
+    gate = Gate("test", concurrency=1, queue_limit=2)
+    order = []
+
+    async def wait(name):
+        await gate.acquire_async()
+        order.append(name)
+
+    async def main():
+        await gate.acquire_async()
+        waiters = [asyncio.ensure_future(wait(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        assert gate.waiting == 2
+        gate.release(0.1)
+        await asyncio.sleep(0.01)
+        assert order == ["first"] and gate.running == 1
+        gate.release(0.1)
+        await asyncio.gather(*waiters)
+
+    asyncio.run(main())
+    assert order == ["first", "second"] and gate.waiting == 0
+
+
+def test_release_from_another_thread_wakes_an_async_waiter():
+    gate = Gate("test", concurrency=1, queue_limit=1)
+    gate.acquire()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, threading.Thread(target=gate.release, args=(0.1,)).start)
+        await gate.acquire_async()
+
+    asyncio.run(main())
+    assert gate.running == 1
+
+
+def test_acquire_async_times_out_with_retry_after():
+    gate = Gate("test", concurrency=1, queue_limit=1, timeout=0.01)
+    gate.acquire()
+
+    async def main():
+        with pytest.raises(AdmissionRejected) as rejected:
+            await gate.acquire_async()
+        assert rejected.value.retry_after >= 1
+
+    asyncio.run(main())
+    assert gate.waiting == 0 and gate.running == 1 and gate.rejected == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    gate = Gate("test", concurrency=1, queue_limit=1)
+
+    async def main():
+        await gate.acquire_async()
+        waiter = asyncio.ensure_future(gate.acquire_async())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert gate.waiting == 0
+        gate.release(0.1)
+
+    asyncio.run(main())
+    assert gate.running == 0
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    gate = Gate("test", concurrency=1, queue_limit=2)
+
+    async def main():
+        await gate.acquire_async()
+        first = asyncio.ensure_future(gate.acquire_async())
+        second = asyncio.ensure_future(gate.acquire_async())
+        await asyncio.sleep(0)
+        # The slot is handed to `first` before it sees its cancellation.
+        gate.release(0.1)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, 1)
+
+    asyncio.run(main())
+    assert gate.running == 1 and gate.waiting == 0
@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app as app_module
+from sandbox import TIMEOUT_ERROR_TYPES
+from sandbox_pool import execute_batch
+from trace_store import TraceStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "trace_store", TraceStore(str(tmp_path)))
+    return app_module.app.test_client()
+
+
+def test_trace_post_has_no_etag(client):
+    response = client.post("/api/trace", json={"code": "x = 1"})
+    assert response.status_code == 200 and response.json["trace_id"]
+    assert "ETag" not in response.headers
+
+
+def test_stored_trace_window_honours_if_none_match(client):
+    trace_id = client.post("/api/trace", json={"code": "x = 1\ny = 2"}).json["trace_id"]
+    first = client.get(f"/api/trace/{trace_id}?from=0&to=2")
+    assert first.status_code == 200 and len(first.json["steps"]) == 2
+    again = client.get(f"/api/trace/{trace_id}?from=0&to=2", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize("query", ["from=abc", "to=x", "from=1.5"])
+def test_stored_trace_window_rejects_non_integer_bounds(client, query):
+    trace_id = client.post("/api/trace", json={"code": "x = 1"}).json["trace_id"]
+    response = client.get(f"/api/trace/{trace_id}?{query}")
+    assert response.status_code == 400 and "integers" in response.json["error"]
+
+
+def test_tracing_loads_neither_the_llm_client_nor_asyncio():
+    probe = (
+        "import sys, app\n"
+        "app.app.test_client().post('/api/trace', json={'code': 'x = 1', 'cache': False})\n"
+        "print(sorted(m for m in ('asyncio', 'llm_client', 'llm_runtime') if m in sys.modules))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", probe], cwd=root, env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.strip().splitlines()[-1] == "[]"
+
+
+DEEP = "deep = [[[[[[[[1]]]]]]]]\nn = 0\n"
+
+
+def _cut_off(value: dict) -> dict:
+    while "handle" not in value:
+        value = value["value"][0]
+    return value
+
+
+def test_expand_renders_a_cut_off_value_by_code(client):
+    trace = client.post("/api/trace", json={"code": DEEP}).json
+    step = trace["steps"][-1]
+    handle = _cut_off(step["variables"]["deep"])["handle"]
+
+    response = client.post("/api/trace/expand", json={"code": DEEP, "step": step["step"], "handle": handle})
+    assert response.status_code == 200
+    assert response.json["value"] == {
+        "type": "list", "value": [{"type": "list", "value": [{"type": "int", "value": 1}]}],
+    }
+
+
+def test_expand_by_trace_id_reruns_the_stored_source(client):
+    trace = client.post("/api/trace", json={"code": DEEP}).json
+    step = trace["steps"][-1]
+    handle = _cut_off(step["variables"]["deep"])["handle"]
+
+    response = client.post("/api/trace/expand", json={"trace_id": trace["trace_id"], "step": step["step"], "handle": handle})
+    assert response.status_code == 200 and response.json["handle"] == handle
+    assert response.json["value"]["value"] == [{"type": "list", "value": [{"type": "int", "value": 1}]}]
+
+
+@pytest.mark.parametrize("request_body, status", [
+    ({"code": DEEP, "step": 3, "handle": ["missing"]}, 404),
+    ({"code": DEEP, "step": 3, "handle": ["deep", 5]}, 404),
+    ({"code": DEEP, "step": 999, "handle": ["deep"]}, 404),
+    ({"code": DEEP, "step": 0, "handle": ["deep"]}, 400),
+    ({"code": DEEP, "step": "3", "handle": ["deep"]}, 400),
+    ({"code": DEEP, "step": 3, "handle": "deep"}, 400),
+    ({"code": DEEP, "step": 3, "handle": ["deep", 1.5]}, 400),
+    ({"trace_id": "not-an-id", "step": 3, "handle": ["deep"]}, 400),
+    ({"trace_id": "0" * 32, "step": 3, "handle": ["deep"]}, 404),
+])
+def test_expand_rejects_bad_handles_and_steps(client, request_body, status):
+    response = client.post("/api/trace/expand", json=request_body)
+    assert response.status_code == status and response.json["error"]
+
+
+BATCH = ["x = 1", "x = 1 / 0", "while True:\n    pass", "y = 2"]
+
+
+@pytest.fixture
+def quick_batches(monkeypatch):
+    monkeypatch.setattr(app_module, "execute_batch", functools.partial(execute_batch, timeout=1))
+
+
+def test_batch_results_come_back_in_request_order(client, quick_batches):
+    response = client.post("/api/trace/batch", json={"codes": BATCH, "cache": False})
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert [r["source"] for r in results] == BATCH
+    assert results[0]["completed"] and results[3]["completed"]
+    assert results[1]["error"]["type"] == "ZeroDivisionError"
+    assert results[2]["error"]["type"] in TIMEOUT_ERROR_TYPES
+
+
+def test_streamed_batch_tags_each_result_with_its_index(client, quick_batches):
+    response = client.post("/api/trace/batch", json={"codes": BATCH, "stream": True, "cache": False})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    response.close()
+    assert events[0] == {"type": "start", "count": 4, "unique": 4} and events[-1] == {"type": "end"}
+    results = {event["index"]: event["trace"] for event in events[1:-1]}
+    assert sorted(results) == [0, 1, 2, 3]
+    assert all(results[index]["source"] == source for index, source in enumerate(BATCH))
+
+
+def test_batch_size_and_items_are_checked(client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_MAX_ITEMS", 2)
+    response = client.post("/api/trace/batch", json={"codes": ["a = 1"] * 3})
+    assert response.status_code == 400 and response.json["error"] == "Batch exceeds maximum of 2 items"
+
+    response = client.post("/api/trace/batch", json={"codes": ["a = 1", ""]})
+    assert response.status_code == 400 and response.json["error"].startswith("Item 1: ")
+    assert client.post("/api/trace/batch", json={"codes": []}).status_code == 400
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+import app
+import asgi
+from admission import gates
+from explanation_cache import ExplanationCache
+
+
+def _call(path: str, body: bytes, content_type: bytes = b"application/json") -> list[dict]:
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "scheme": "http",
+        "http_version": "1.1",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 12345),
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    }
+    incoming = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    return sent
+
+
+def _status_and_body(sent: list[dict]) -> tuple[int, dict]:
+    return sent[0]["status"], json.loads(b"".join(m.get("body", b"") for m in sent[1:]))
+
+
+def test_explain_rejects_bad_requests_and_releases_the_slot():
+    status, body = _status_and_body(_call("/api/explain", json.dumps({"code": "x = 1", "depth": "x"}).encode()))
+    assert status == 400 and "depth" in body["error"]
+
+    status, body = _status_and_body(_call("/api/explain", b"x = 1", b"text/plain"))
+    assert status == 415
+    assert gates["explain"].running == 0
+
+
+def test_explain_answers_503_when_the_gate_is_full():
+    gate = gates["explain"]
+    concurrency, queue_limit = gate.concurrency, gate.queue_limit
+    gate.concurrency, gate.queue_limit = 0, 0
+    try:
+        sent = _call("/api/explain/stream", json.dumps({"code": "x = 1"}).encode())
+    finally:
+        gate.concurrency, gate.queue_limit = concurrency, queue_limit
+    status, body = _status_and_body(sent)
+    assert status == 503 and "too many explain requests" in body["error"]
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"1"
+
+
+def test_other_routes_are_served_by_the_flask_app():
+    sent = _call("/api/trace/window", b"{}")
+    status, body = _status_and_body(sent)
+    assert status == 400 and body["error"] == "Missing 'code' field in request body"
+
+
+@pytest.mark.parametrize("path", ["/api/explain", "/api/explain/stream"])
+def test_explain_sends_the_same_body_as_the_flask_app(path, tmp_path, monkeypatch):
+    monkeypatch.setenv("EXPLAIN_BACKEND", "local")
+    request = {"code": "total = 0\nfor i in range(3):\n    total += i", "depth": "beginner"}
+
+    monkeypatch.setattr(app, "explanation_cache", ExplanationCache(str(tmp_path / "asgi.sqlite3")))
+    sent = _call(path, json.dumps(request).encode())
+    assert sent[0]["status"] == 200
+    streamed = b"".join(m.get("body", b"") for m in sent[1:])
+
+    monkeypatch.setattr(app, "explanation_cache", ExplanationCache(str(tmp_path / "wsgi.sqlite3")))
+    response = app.app.test_client().post(path, json=request)
+    assert response.get_data() == streamed and b"step_explanation" in streamed
+    response.close()
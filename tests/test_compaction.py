@@ -0,0 +1,102 @@
+import pytest
+
+from compaction import LINE_LIMIT, compact_steps, find_runs
+from tracer import ExecutionTracer
+
+LOOP = """total = 0
+for i in range(10):
+    total += i
+done = total
+"""
+
+NESTED = """grid = 0
+for i in range(3):
+    for j in range(4):
+        grid += j
+"""
+
+BRANCH = """t = 0
+for i in range(10):
+    if i == 5:
+        t -= 1
+    else:
+        t += i
+"""
+
+STRAIGHT = """a = 1
+b = a + 1
+c = b * 2
+"""
+
+
+def _steps(source: str) -> list[dict]:
+    return ExecutionTracer(source).run()["steps"]
+
+
+def _keys(steps: list[dict]) -> list[tuple]:
+    return [(step["line_number"], step["event"]) for step in steps]
+
+
+def _format(step: dict) -> list[str]:
+    return [f"step {step['step']} line {step['line_number']}"]
+
+
+def test_find_runs_takes_the_longest_repetition():
+    assert find_runs(list("xababababy"), 3) == [(1, 2, 4)]
+    assert find_runs(list("xabababy"), 4) == []
+
+
+def test_loop_is_found_as_one_run():
+    steps = _steps(LOOP)
+    start, period, repeats = find_runs(_keys(steps), 3)[0]
+    assert (period, repeats) == (2, 10)
+    assert [step["line_number"] for step in steps[start:start + period]] == [2, 3]
+
+
+def test_compacted_loop_keeps_the_first_and_last_iteration_at_level_1():
+    lines = compact_steps(_steps(LOOP), 1, _format)
+    text = "\n".join(lines)
+    assert "=== Steps 3-22: lines 2, 3 repeat 10 times (2 steps per iteration) ===" in text
+    assert "iterations 2..9 folded (steps 5-20): i goes 1 -> 8 (+1 per iteration); total goes 0 -> 28" in text
+    assert "step 4 line 3" in lines and "step 22 line 3" in lines
+    assert "step 12 line 3" not in lines
+
+
+def test_level_2_folds_the_last_iteration_too():
+    lines = compact_steps(_steps(LOOP), 2, _format)
+    assert "iterations 2..10 folded (steps 5-22)" in "\n".join(lines)
+    assert "step 22 line 3" not in lines and "step 23 line 2" in lines
+
+
+def test_nested_loops_fold_whole_outer_iterations():
+    steps = _steps(NESTED)
+    assert [(period, repeats) for _, period, repeats in find_runs(_keys(steps), 3)] == [(10, 3)]
+    text = "\n".join(compact_steps(steps, 1, _format))
+    assert "lines 2, 3, 4 repeat 3 times (10 steps per iteration)" in text
+    assert "iterations 2..2 folded" in text and "i goes 1 -> 1" in text
+
+
+def test_branch_change_breaks_the_run():
+    steps = _steps(BRANCH)
+    runs = find_runs(_keys(steps), 3)
+    assert [(period, repeats) for _, period, repeats in runs] == [(3, 5), (3, 4)]
+    # The iteration that takes the other branch sits between the two runs, shown in full.
+    first_end = runs[0][0] + runs[0][1] * runs[0][2]
+    assert [step["line_number"] for step in steps[first_end:runs[1][0]]] == [2, 3, 4]
+    lines = compact_steps(steps, 1, _format)
+    assert sum(line.startswith("\n=== Steps") for line in lines) == 2
+    assert "\n".join(_format(steps[first_end + 2])) in lines
+
+
+@pytest.mark.parametrize("level", [1, 2, 3])
+def test_trace_without_loops_is_unchanged(level):
+    steps = _steps(STRAIGHT)
+    assert find_runs(_keys(steps), 2) == []
+    assert compact_steps(steps, level, _format) == compact_steps(steps, 0, _format)
+
+
+def test_level_3_truncates_long_lines():
+    long_line = lambda step: ["x" * (LINE_LIMIT + 50)]
+    lines = compact_steps(_steps(STRAIGHT), 3, long_line)
+    assert all(len(line) == LINE_LIMIT and line.endswith("...") for line in lines)
+    assert compact_steps(_steps(STRAIGHT), 2, long_line)[0] == "x" * (LINE_LIMIT + 50)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+import explainer
+from llm_runtime import LLMBackend
+from tracer import ExecutionTracer
+
+SOURCE = """a = 1
+b = a + 1
+c = b * 2
+d = c - 1
+"""
+
+
+class ScriptedBackend(LLMBackend):
+    # Answers each generate() with the next scripted reply text and records the prompts.
+
+    def __init__(self, *replies: str):
+        super().__init__("scripted")
+        self.replies = list(replies)
+        self.prompts: list[str] = []
+
+    async def generate(self, prompt, temperature=0.3, max_output_tokens=4096, response_schema=None):
+        self.prompts.append(prompt)
+        return {"text": self.replies.pop(0), "finish_reason": "MAX_TOKENS", "usage": {}}
+
+
+@pytest.fixture(scope="module")
+def trace():
+    return ExecutionTracer(SOURCE).run()
+
+
+def _entry(step: dict) -> dict:
+    return {"step": step["step"], "line": step["line_number"], "explanation": f"explains {step['step']}"}
+
+
+def _reply(steps: list[dict], summary: str = "sums", concepts=("assignment",)) -> str:
+    return json.dumps({
+        "summary": summary, "step_explanations": [_entry(step) for step in steps], "key_concepts": list(concepts),
+    })
+
+
+def _explain(client: ScriptedBackend, trace: dict) -> dict:
+    return asyncio.run(explainer._explain_steps(client, trace, "beginner"))
+
+
+def test_parse_reply_keeps_complete_entries_of_a_broken_reply(trace):
+    steps = trace["steps"]
+    text = _reply(steps[:2])[:-len('], "key_concepts": ["assignment"]}')] + ', {"step": 3, "li'
+    parser = explainer._parse_reply(text + "\x00 garbage")
+    assert not parser.finished
+    assert parser.result == {"summary": "sums", "step_explanations": [_entry(s) for s in steps[:2]]}
+
+
+def test_reply_cut_mid_string_asks_again_for_every_step(trace):
+    steps = trace["steps"]
+    cut = '{"summary": "sums", "step_explanations": [{"step": 1, "line": 0, "explanation": "the progr'
+    client = ScriptedBackend(cut, _reply(steps, summary="ignored"))
+    result = _explain(client, trace)
+
+    assert result["summary"] == "sums"
+    assert result["step_explanations"] == [_entry(step) for step in steps]
+    assert f"the remaining steps {steps[0]['step']}-{steps[-1]['step']} of its execution trace" in client.prompts[1]
+    assert "missing_steps" not in result
+
+
+def test_reply_cut_mid_array_continues_after_the_last_complete_step(trace):
+    steps = trace["steps"]
+    cut = _reply(steps[:2])[:-len('], "key_concepts": ["assignment"]}')] + ', {"step": 3, "line"'
+    client = ScriptedBackend(cut, _reply(steps[2:], concepts=("arithmetic",)))
+    result = _explain(client, trace)
+
+    assert [entry["step"] for entry in result["step_explanations"]] == [step["step"] for step in steps]
+    assert result["key_concepts"] == ["arithmetic"]
+    continuation = client.prompts[1]
+    assert f"the remaining steps {steps[2]['step']}-{steps[-1]['step']}" in continuation
+    assert f"--- Step {steps[1]['step']} " not in continuation
+    assert f"--- Step {steps[2]['step']} " in continuation
+
+
+def test_reply_cut_after_the_last_step_needs_no_continuation(trace):
+    cut = _reply(trace["steps"])[:-len(', "key_concepts": ["assignment"]}')] + ', "key_con'
+    client = ScriptedBackend(cut)
+    result = _explain(client, trace)
+
+    assert len(client.prompts) == 1
+    assert len(result["step_explanations"]) == len(trace["steps"])
+    assert result["key_concepts"] == [] and "missing_steps" not in result
+
+
+def test_steps_still_unexplained_after_the_continuations_are_listed(trace, monkeypatch):
+    monkeypatch.setattr(explainer, "MAX_CONTINUATIONS", 1)
+    steps = trace["steps"]
+    cut = _reply(steps[:1])[:-len('], "key_concepts": ["assignment"]}')] + ', {"st'
+    more = _reply(steps[1:3])[:-len('], "key_concepts": ["assignment"]}')] + ', {"st'
+    client = ScriptedBackend(cut, more)
+    result = _explain(client, trace)
+
+    assert len(client.prompts) == 2
+    assert [entry["step"] for entry in result["step_explanations"]] == [step["step"] for step in steps[:3]]
+    assert result["missing_steps"] == [[steps[3]["step"], steps[-1]["step"]]]
+
+
+def test_reply_with_nothing_usable_raises(trace):
+    with pytest.raises(RuntimeError, match="Failed to parse"):
+        _explain(ScriptedBackend("not json"), trace)
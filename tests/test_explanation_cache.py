@@ -0,0 +1,119 @@
+import pytest
+
+import explanation_cache
+from explanation_cache import ExplanationCache, explanation_key
+
+TRACE = {"source": "x = 1", "steps": [{"step": 1, "variables": {"x": {"type": "int", "value": 1}}}]}
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(explanation_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return ExplanationCache(str(tmp_path / "cache.sqlite3"), ttl=100, max_bytes=10_000)
+
+
+def _explanation(text: str = "summary", depth: str = "beginner") -> dict:
+    return {"summary": text, "step_explanations": [], "depth": depth, "model": "m"}
+
+
+def test_key_depends_on_trace_depth_model_and_prompt_version():
+    key = explanation_key(TRACE, "beginner", "m", 1)
+    assert key == explanation_key(dict(reversed(TRACE.items())), "beginner", "m", 1)
+    assert key != explanation_key(dict(TRACE, source="x = 2"), "beginner", "m", 1)
+    assert key != explanation_key(TRACE, "advanced", "m", 1)
+    assert key != explanation_key(TRACE, "beginner", "other", 1)
+    assert key != explanation_key(TRACE, "beginner", "m", 2)
+
+
+def test_key_ignores_profile_timings():
+    first = dict(TRACE, profile={"wall_ms": 1.5, "lines": []})
+    second = dict(TRACE, profile={"wall_ms": 2.25, "lines": []})
+    assert explanation_key(first, "advanced", "m", 1) == explanation_key(second, "advanced", "m", 1)
+    assert "profile" in first
+
+
+def test_round_trip_and_counters(cache):
+    assert cache.get("k") is None
+    cache.put("k", _explanation())
+    assert cache.get("k") == _explanation()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["by_depth"] == {"beginner": 1}
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.put("k", _explanation())
+    clock.now += 100
+    assert cache.get("k") is not None
+    clock.now += 1
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_reads_do_not_extend_ttl(cache, clock):
+    cache.put("k", _explanation())
+    clock.now += 60
+    cache.get("k")
+    clock.now += 60
+    assert cache.get("k") is None
+
+
+def test_put_replaces_existing_entry(cache):
+    cache.put("k", _explanation("old"))
+    cache.put("k", _explanation("new"))
+    assert cache.get("k")["summary"] == "new"
+    assert cache.stats()["entries"] == 1
+
+
+def test_evicts_least_recently_accessed_over_budget(tmp_path, clock):
+    size = len('{"summary":"' + "x" * 400 + '","step_explanations":[],"depth":"beginner","model":"m"}')
+    cache = ExplanationCache(str(tmp_path / "cache.sqlite3"), ttl=1000, max_bytes=2 * size)
+    cache.put("a", _explanation("x" * 400))
+    clock.now += 1
+    cache.put("b", _explanation("x" * 400))
+    clock.now += 1
+    cache.get("a")  # "b" is now the least recently accessed
+    clock.now += 1
+    cache.put("c", _explanation("x" * 400))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] <= 2 * size
+
+
+def test_put_drops_expired_rows(cache, clock):
+    cache.put("old", _explanation())
+    clock.now += 101
+    cache.put("new", _explanation())
+    assert cache.stats()["entries"] == 1
+
+
+def test_purge(cache, clock):
+    cache.put("old", _explanation())
+    clock.now += 101
+    # Expired rows are only removed on put or read; purge finds them first.
+    assert cache.purge(expired_only=True) == 1
+    cache.put("a", _explanation())
+    cache.put("b", _explanation())
+    assert cache.purge() == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_are_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    ExplanationCache(path).put("k", _explanation())
+    assert ExplanationCache(path).get("k") == _explanation()
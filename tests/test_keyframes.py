@@ -0,0 +1,83 @@
+import pytest
+
+from keyframes import KeyframeCache, KeyframeTrace
+from tracer import ExecutionTracer
+
+SOURCE = """def square(n):
+    result = n * n
+    return result
+
+values = []
+for i in range(12):
+    values.append(square(i))
+    del_me = i
+    del del_me
+total = sum(values)
+"""
+
+
+@pytest.fixture(scope="module")
+def trace():
+    return ExecutionTracer(SOURCE).run()
+
+
+@pytest.mark.parametrize("interval", [1, 3, 7, 1000])
+def test_round_trip_rebuilds_every_step(trace, interval):
+    frames = KeyframeTrace.from_trace(trace, interval)
+    assert frames.to_trace() == trace
+
+
+def test_keyframes_are_placed_every_interval(trace):
+    frames = KeyframeTrace.from_trace(trace, 10)
+    assert set(range(0, len(trace["steps"]), 10)) <= set(frames.keyframes)
+    assert all("variables" not in step for step in frames.steps)
+
+
+@pytest.mark.parametrize("start, stop", [(0, 1), (9, 11), (10, 20), (11, 12), (25, 40)])
+def test_windows_match_the_full_trace(trace, start, stop):
+    frames = KeyframeTrace.from_trace(trace, 10)
+    assert frames.window(start, stop) == trace["steps"][start:stop]
+
+
+def test_window_bounds_are_clamped(trace):
+    frames = KeyframeTrace.from_trace(trace, 10)
+    count = len(trace["steps"])
+    assert frames.window(-5, 2) == trace["steps"][:2]
+    assert frames.window(count - 1, count + 50) == trace["steps"][-1:]
+    assert frames.window(5, 5) == []
+    assert frames.window(count, count + 1) == []
+
+
+def test_state_at(trace):
+    frames = KeyframeTrace.from_trace(trace, 4)
+    for position in (0, 3, 4, len(trace["steps"]) - 1):
+        assert frames.state_at(position) == trace["steps"][position]["variables"]
+    with pytest.raises(IndexError):
+        frames.state_at(len(trace["steps"]))
+
+
+def test_sampled_traces_replay_across_elided_steps():
+    # The step after an elision is diffed against the last kept step, so no resync is needed.
+    source = "acc = []\nfor i in range(40):\n    acc.append(i)\n    last = i\ndone = len(acc)\n"
+    sampled = ExecutionTracer(source, sampling=True).run()
+    frames = KeyframeTrace.from_trace(sampled, 1000)
+    assert len(frames.keyframes) == 1
+    assert frames.to_trace() == sampled
+    position = next(i for i, step in enumerate(sampled["steps"]) if "elided" in step)
+    assert frames.state_at(position) == sampled["steps"][position]["variables"]
+
+
+def test_only_inline_traces_are_accepted(trace):
+    with pytest.raises(ValueError):
+        KeyframeTrace.from_trace(dict(trace, format="heap"))
+
+
+def test_cache_evicts_least_recently_used(trace):
+    cache = KeyframeCache(max_entries=2)
+    frames = KeyframeTrace.from_trace(trace)
+    cache.put("a", frames)
+    cache.put("b", frames)
+    assert cache.get("a") is frames
+    cache.put("c", frames)
+    assert cache.get("b") is None
+    assert cache.get("a") is frames and cache.get("c") is frames
@@ -0,0 +1,46 @@
+from line_index import build_line_index, loop_spans
+from tracer import ExecutionTracer
+
+SOURCE = '''def f(x, y):
+    if (x > 1 and
+            y < 2):
+        z = 1
+    for i in range(
+            3):
+        pass
+    return (x +
+            y)
+if f(2, 1): y = 1
+'''
+
+
+def test_every_header_line_of_a_multi_line_statement_maps_to_it():
+    index = build_line_index(SOURCE)
+    assert index[2] is index[3]
+    assert index[2] == {
+        "kind": "conditional", "expression": "if (x > 1 and y < 2):", "function": "f", "start": 2, "end": 4,
+    }
+    assert index[5]["expression"] == "for i in range( 3):" and index[6] is index[5]
+    assert index[8]["kind"] == "return_statement" and index[9] is index[8]
+    # Body lines are not part of the header.
+    assert 4 not in index and 7 not in index
+
+
+def test_one_line_compound_statement_is_reported_once_at_module_level():
+    info = build_line_index(SOURCE)[10]
+    assert (info["kind"], info["expression"], info["function"]) == ("conditional", "if f(2, 1): y = 1", None)
+
+
+def test_loop_spans_and_syntax_errors():
+    assert loop_spans(build_line_index(SOURCE)) == {5: 7}
+    assert build_line_index("if x\n    pass") == {}
+
+
+def test_tracer_reports_the_whole_multi_line_condition():
+    steps = ExecutionTracer(SOURCE).run()["steps"]
+    conditions = {
+        step["control_flow"]["expression"]
+        for step in steps
+        if step.get("control_flow", {}).get("type") == "conditional"
+    }
+    assert conditions == {"if (x > 1 and y < 2):", "if f(2, 1): y = 1"}
@@ -0,0 +1,70 @@
+import time
+
+from line_profile import LineProfiler
+from tracer import ExecutionTracer
+
+SOURCE = """def work(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+results = []
+for k in range(20):
+    results.append(work(50))
+"""
+
+
+def test_profile_only_runs_record_no_steps():
+    trace = ExecutionTracer(SOURCE, profile=True).run()
+    assert trace["steps"] == []
+    hits = {row["line"]: row["hits"] for row in trace["profile"]["lines"]}
+    assert hits[4] == 20 * 50 and hits[9] == 20
+
+
+def test_with_profile_keeps_the_steps_of_a_plain_trace():
+    plain = ExecutionTracer(SOURCE).run()
+    profiled = ExecutionTracer(SOURCE, with_profile=True).run()
+    assert profiled["steps"] == plain["steps"]
+    assert (profiled["step_count"], profiled["truncated"]) == (plain["step_count"], plain["truncated"])
+    assert "profile" not in plain
+
+
+def test_with_profile_covers_only_the_traced_steps():
+    trace = ExecutionTracer(SOURCE, with_profile=True, budget=40).run()
+    lines = [step["line_number"] for step in trace["steps"] if step["event"] == "line"]
+    hits = {row["line"]: row["hits"] for row in trace["profile"]["lines"]}
+    assert sum(hits.values()) == len(lines)
+    assert hits == {line: lines.count(line) for line in set(lines)}
+
+
+class _Frame:
+    def __init__(self, lineno: int):
+        self.f_lineno = lineno
+        self.f_code = _Frame.__init__.__code__
+
+
+def test_paused_work_is_not_charged_to_the_running_line():
+    profiler = LineProfiler()
+    frame = _Frame(1)
+    profiler.start()
+    profiler.event(frame, "line")
+    profiler.pause()
+    time.sleep(0.05)
+    kept = [bytearray(100_000)]
+    profiler.resume()
+    profiler.stop()
+    row = profiler.table()["lines"][0]
+    assert row["hits"] == 1
+    assert row["wall_ms"] < 25 and profiler.table()["wall_ms"] < 25
+    assert row["alloc_bytes"] < 50_000
+    assert kept
+
+
+def test_stop_is_idempotent():
+    profiler = LineProfiler()
+    profiler.start()
+    profiler.stop()
+    wall = profiler.wall
+    profiler.stop()
+    assert profiler.wall == wall
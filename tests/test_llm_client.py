@@ -0,0 +1,254 @@
+import asyncio
+import json
+
+import pytest
+
+import llm_client
+from llm_client import GeminiClient, LLMError
+
+REPLY = {
+    "candidates": [{"content": {"parts": [{"text": "hello "}, {"text": "world"}]}, "finishReason": "STOP"}],
+    "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 2},
+}
+
+
+def _chunked(body: bytes, sizes=(7, 1, 30), extension: bool = False) -> bytes:
+    out, pos, i = b"", 0, 0
+    while pos < len(body):
+        piece = body[pos:pos + sizes[i % len(sizes)]]
+        out += f"{len(piece):x}{';ext=1' if extension else ''}\r\n".encode() + piece + b"\r\n"
+        pos += len(piece)
+        i += 1
+    return out + b"0\r\nX-Trailer: yes\r\n\r\n"
+
+
+def _response(body: bytes, chunked: bool = True, status: str = "200 OK", extra: str = "") -> bytes:
+    framing = "Transfer-Encoding: chunked" if chunked else f"Content-Length: {len(body)}"
+    head = f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{framing}\r\n{extra}\r\n"
+    return head.encode() + (_chunked(body) if chunked else body)
+
+
+class ScriptedServer:
+    # Answers each request with the next scripted reply: raw bytes to send, optionally
+    # followed by closing the connection (or stalling, to exercise timeouts).
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests: list[bytes] = []
+        self.connections = 0
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while self.replies:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(next(
+                    line.split(b":")[1] for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")
+                ))
+                self.requests.append(head + await reader.readexactly(length))
+                data, action = self.replies.pop(0)
+                writer.write(data)
+                await writer.drain()
+                if action == "close":
+                    break
+                if action == "stall":
+                    await asyncio.sleep(3600)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+@pytest.mark.parametrize("chunked", [True, False])
+def test_generate_reads_chunked_and_sized_bodies(chunked):
+    async def main():
+        server = ScriptedServer([(_response(json.dumps(REPLY).encode(), chunked), None)])
+        async with server as base:
+            return await GeminiClient("secret", "m", base).generate("prompt")
+
+    assert _run(main()) == {"text": "hello world", "finish_reason": "STOP", "usage": REPLY["usageMetadata"]}
+
+
+def test_chunk_extensions_are_ignored():
+    body = json.dumps(REPLY).encode()
+    reply = _response(b"", chunked=False).replace(b"Content-Length: 0", b"Transfer-Encoding: chunked")
+    reply += _chunked(body, extension=True)
+
+    async def main():
+        async with ScriptedServer([(reply, None)]) as base:
+            return await GeminiClient("secret", "m", base).generate("prompt")
+
+    assert _run(main())["text"] == "hello world"
+
+
+def test_keep_alive_connection_is_reused():
+    async def main():
+        body = json.dumps(REPLY).encode()
+        server = ScriptedServer([(_response(body), None), (_response(body, chunked=False), None), (_response(body), None)])
+        async with server as base:
+            client = GeminiClient("secret", "m", base)
+            for _ in range(3):
+                await client.generate("prompt")
+            return server.connections
+
+    assert _run(main()) == 1
+
+
+def test_api_key_is_sent_as_header_not_in_url():
+    async def main():
+        server = ScriptedServer([(_response(json.dumps(REPLY).encode()), None)])
+        async with server as base:
+            await GeminiClient("secret-key", "m", base).generate("prompt")
+        return server.requests[0]
+
+    request = _run(main())
+    request_line, _, rest = request.partition(b"\r\n")
+    assert b"secret-key" not in request_line
+    assert b"x-goog-api-key: secret-key\r\n" in rest.lower()
+
+
+def test_eof_inside_chunked_body_fails_and_discards_the_connection():
+    truncated = _response(json.dumps(REPLY).encode())[:-40]
+
+    async def main():
+        body = json.dumps(REPLY).encode()
+        server = ScriptedServer([(truncated, "close")])
+        async with server as base:
+            client = GeminiClient("secret", "m", base)
+            with pytest.raises(LLMError) as error:
+                await client.generate("prompt")
+            assert error.value.retryable
+            server.replies.append((_response(body), None))
+            await client.generate("prompt")
+            return server.connections
+
+    assert _run(main()) == 2
+
+
+def test_eof_before_terminating_chunk_is_not_a_complete_reply():
+    body = json.dumps(REPLY).encode()
+    # Every data chunk arrives, then the connection drops before the zero-size chunk.
+    truncated = _response(body).rsplit(b"0\r\n", 1)[0]
+
+    async def main():
+        async with ScriptedServer([(truncated, "close")]) as base:
+            with pytest.raises(LLMError):
+                await GeminiClient("secret", "m", base).generate("prompt")
+
+    _run(main())
+
+
+def test_dropped_idle_connection_is_retried_once_on_a_fresh_one():
+    async def main():
+        body = json.dumps(REPLY).encode()
+        server = ScriptedServer([(_response(body), "close"), (_response(body), None)])
+        async with server as base:
+            client = GeminiClient("secret", "m", base)
+            await client.generate("prompt")
+            await asyncio.sleep(0.05)  # let the close reach the client
+            result = await client.generate("prompt")
+            return result["text"], server.connections
+
+    assert _run(main()) == ("hello world", 2)
+
+
+def test_error_status_carries_retry_after():
+    error_body = json.dumps({"error": {"message": "slow down"}}).encode()
+
+    async def main():
+        async with ScriptedServer([(_response(error_body, status="429 Too Many", extra="Retry-After: 7\r\n"), None)]) as base:
+            with pytest.raises(LLMError) as error:
+                await GeminiClient("secret", "m", base).generate("prompt")
+            return error.value
+
+    error = _run(main())
+    assert (error.status, error.retry_after, error.retryable) == (429, 7.0, True)
+    assert "slow down" in str(error)
+
+
+def _sse(*payloads) -> bytes:
+    return b"".join(b"data: " + json.dumps(p).encode() + b"\r\n\r\n" for p in payloads)
+
+
+def test_stream_yields_each_event():
+    first = {"candidates": [{"content": {"parts": [{"text": "hel"}]}}]}
+    second = {"candidates": [{"content": {"parts": [{"text": "lo"}]}, "finishReason": "STOP"}]}
+
+    async def main():
+        server = ScriptedServer([(_response(_sse(first, second)), None), (_response(json.dumps(REPLY).encode()), None)])
+        async with server as base:
+            client = GeminiClient("secret", "m", base)
+            chunks = [chunk async for chunk in client.stream("prompt")]
+            # The connection goes back to the pool once the stream ends.
+            await client.generate("prompt")
+            return chunks, server.requests[0], server.connections
+
+    chunks, request, connections = _run(main())
+    assert [c["text"] for c in chunks] == ["hel", "lo"]
+    assert chunks[-1]["finish_reason"] == "STOP"
+    assert request.startswith(b"POST /v1beta/models/m:streamGenerateContent?alt=sse HTTP/1.1")
+    assert connections == 1
+
+
+def test_stalled_stream_times_out(monkeypatch):
+    monkeypatch.setattr(llm_client, "STREAM_READ_TIMEOUT", 0.2)
+    first = {"candidates": [{"content": {"parts": [{"text": "hel"}]}}]}
+    head = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+    event = _sse(first)
+    partial = head + f"{len(event):x}\r\n".encode() + event + b"\r\n"
+
+    async def main():
+        server = ScriptedServer([(partial, "stall")])
+        async with server as base:
+            client = GeminiClient("secret", "m", base)
+            received = []
+            with pytest.raises(LLMError):
+                async for chunk in client.stream("prompt"):
+                    received.append(chunk["text"])
+            # The stalled connection is dropped, not reused.
+            server.replies.append((_response(json.dumps(REPLY).encode()), None))
+            await client.generate("prompt")
+            return received, server.connections
+
+    assert _run(main()) == (["hel"], 2)
+
+
+def test_stream_waiting_for_its_head_times_out(monkeypatch):
+    monkeypatch.setattr(llm_client, "STREAM_READ_TIMEOUT", 0.2)
+
+    async def main():
+        async with ScriptedServer([(b"", "stall")]) as base:
+            with pytest.raises(LLMError):
+                async for _ in GeminiClient("secret", "m", base).stream("prompt"):
+                    pass
+
+    _run(main())
+
+
+def test_concurrent_calls_are_coalesced():
+    async def main():
+        client = GeminiClient("secret", "m", "http://127.0.0.1:1")
+        calls = 0
+
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return calls
+
+        results = await asyncio.gather(*(client.coalesce("key", factory) for _ in range(5)))
+        return results, calls, client.coalesced, client._inflight
+
+    assert _run(main()) == ([1] * 5, 1, 4, {})
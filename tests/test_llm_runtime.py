@@ -0,0 +1,45 @@
+import asyncio
+import subprocess
+import sys
+
+from llm_runtime import LLMBackend, iterate_sync, run_sync
+
+
+def test_explainer_does_not_load_a_provider():
+    code = "import sys, explainer; print(sorted({'llm_client', 'local_backend'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_coalesce_shares_one_call_per_key():
+    backend = LLMBackend("m")
+    calls = []
+
+    async def call(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        return await asyncio.gather(
+            backend.coalesce("a", lambda: call(1)),
+            backend.coalesce("a", lambda: call(2)),
+            backend.coalesce("b", lambda: call(3)),
+        )
+
+    assert asyncio.run(main()) == [1, 1, 3]
+    assert calls == [1, 3] and backend.coalesced == 1
+    assert backend._inflight == {}
+
+
+def test_sync_bridges_run_on_the_shared_loop():
+    async def numbers():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield i
+
+    async def double(x):
+        return x * 2
+
+    assert list(iterate_sync(numbers())) == [0, 1, 2]
+    assert run_sync(double(21)) == 42
@@ -0,0 +1,39 @@
+import asyncio
+
+from llm_scheduler import LLMScheduler
+
+
+def _slow_call(calls: list, delay: float = 0.05):
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"text": "ok", "usage": {}}
+    return call
+
+
+def test_hedge_sent_when_both_buckets_have_room():
+    scheduler = LLMScheduler(rpm=100, tpm=10_000, hedge_after=0.01)
+    calls = []
+    assert asyncio.run(scheduler._hedged(_slow_call(calls), 100)) == {"text": "ok", "usage": {}}
+    assert len(calls) == 2 and scheduler.hedges == 1
+
+
+def test_hedge_without_tokens_gives_the_request_back():
+    scheduler = LLMScheduler(rpm=100, tpm=1_000, hedge_after=0.01)
+    scheduler.tokens.level = 10
+    requests = scheduler.requests.level
+    calls = []
+    asyncio.run(scheduler._hedged(_slow_call(calls), 500))
+    assert len(calls) == 1 and scheduler.hedges == 0
+    assert scheduler.requests.level >= requests
+    assert scheduler.tokens.level < 500
+
+
+def test_hedge_without_requests_takes_no_tokens():
+    scheduler = LLMScheduler(rpm=100, tpm=1_000_000, hedge_after=0.01)
+    scheduler.requests.level = 0
+    tokens = scheduler.tokens.level
+    calls = []
+    asyncio.run(scheduler._hedged(_slow_call(calls), 500))
+    assert len(calls) == 1
+    assert scheduler.tokens.level >= tokens - 1
@@ -0,0 +1,101 @@
+import time
+
+from loop_sampling import Elision, LoopSampler
+from sandbox import DEFAULT_TIMEOUT, execute_sandboxed
+from tracer import ExecutionTracer
+
+
+def _run_loop(iterations, keep=2, lines_of=lambda i: (2, 3)):
+    # The (iteration, line) pairs a LoopSampler traces, and the iterations it skips entirely.
+    loop = LoopSampler(frame=None, header=1, end=3, keep=keep)
+    traced, skipped = [], 0
+    for i in range(iterations):
+        skipped += loop.next_iteration()
+        for line in (1, *lines_of(i)):
+            loop.add_line(line)
+            if loop.tracing:
+                loop.traced = True
+                traced.append((i, line))
+    skipped += loop.finish()
+    return traced, skipped
+
+
+def test_short_loops_are_traced_in_full():
+    traced, skipped = _run_loop(2)
+    assert traced == [(i, line) for i in range(2) for line in (1, 2, 3)]
+    assert skipped == 0
+
+
+def test_iterations_after_the_first_are_skipped_without_rendering():
+    traced, skipped = _run_loop(10)
+    assert {i for i, _ in traced} == {0, 1}
+    assert skipped == 8
+
+
+def test_iteration_taking_a_different_branch_is_traced_from_the_branch_on():
+    traced, skipped = _run_loop(10, lines_of=lambda i: (2, 4) if i == 5 else (2, 3))
+    # Line 4 is new in iteration 5, and line 3 is new again in 6 after 5 skipped it.
+    assert [(i, line) for i, line in traced if i >= 2] == [(5, 4), (6, 3)]
+    assert skipped == 6
+
+
+def test_elided_heap_deltas_move_to_the_next_kept_step():
+    elision = Elision()
+    elision.add_step({"step": 3, "heap": {"h1": {"v": 1}, "h2": {"v": 2}}})
+    elision.add_step({"step": 4, "heap": {"h1": {"v": 5}}})
+    kept = {"step": 5, "heap": {"h2": {"v": 9}}}
+    elision.attach(kept)
+    assert kept["heap"] == {"h1": {"v": 5}, "h2": {"v": 9}}
+    assert (kept["elided"]["from_step"], kept["elided"]["to_step"], kept["elided"]["steps"]) == (3, 4, 2)
+
+
+def test_nested_elisions_merge_into_one_record():
+    inner = Elision()
+    inner.add_step({"step": 10})
+    inner.add_iteration(4)
+    carrier = {"step": 11}
+    inner.attach(carrier)
+
+    outer = Elision()
+    outer.add_step({"step": 8})
+    outer.add_step(carrier)
+    outer.add_iteration(2)
+    kept = {"step": 12}
+    outer.attach(kept)
+    assert kept["elided"] == {
+        "from_step": 8,
+        "to_step": 11,
+        "steps": 3,
+        "loops": [{"line": 2, "iterations": 1}, {"line": 4, "iterations": 1}],
+    }
+
+
+def test_sampled_trace_accounts_for_every_step():
+    source = "total = 0\nfor i in range(50):\n    total += i\nresult = total\n"
+    full = ExecutionTracer(source).run()
+    sampled = ExecutionTracer(source, sampling=True).run()
+    assert len(sampled["steps"]) < len(full["steps"])
+    elided = sum(s["elided"]["steps"] for s in sampled["steps"] if "elided" in s)
+    assert len(sampled["steps"]) + elided == sampled["step_count"] == full["step_count"]
+    assert sampled["steps"][-1]["variables"] == full["steps"][-1]["variables"]
+
+
+def test_sampled_trace_is_diffed_against_the_last_kept_step():
+    source = "acc = []\nfor i in range(40):\n    acc.append(i)\ndone = len(acc)\n"
+    steps = ExecutionTracer(source, sampling=True).run()["steps"]
+    position = next(i for i, step in enumerate(steps) if "elided" in step)
+    after = steps[position]
+    assert after["elided"]["loops"] == [{"line": 2, "iterations": 39}]
+    assert after["changes"]["updated"]["i"] == {"from": steps[position - 1]["variables"]["i"], "to": after["variables"]["i"]}
+    assert len(after["variables"]["acc"]["value"]) == 40
+
+
+def test_long_branchless_loop_runs_to_the_end_within_the_time_limit():
+    # Skipped iterations are not rendered, so their cost does not grow with the locals.
+    source = "data = list(range(300))\ntotal = 0\nfor i in range(50000):\n    total += data[i % 300]\nresult = total\n"
+    started = time.perf_counter()
+    trace = execute_sandboxed(source, tracer_options={"sampling": True})
+    assert time.perf_counter() - started < DEFAULT_TIMEOUT / 2
+    assert trace["completed"] and trace["error"] is None
+    assert len(trace["steps"]) < 20
+    assert trace["steps"][-1]["variables"]["result"]["value"] == sum(i % 300 for i in range(50000))
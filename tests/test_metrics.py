@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+import app as app_module
+import metrics
+from trace_store import TraceStore
+
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="[^"]*",?)*\})? -?[0-9.e+-]+$')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "trace_store", TraceStore(str(tmp_path)))
+    return app_module.app.test_client()
+
+
+def _timings(header: str) -> dict[str, str]:
+    return dict(entry.split(";", 1) for entry in header.split(", "))
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    histogram = metrics.Histogram("demo_seconds", "Demo.", ("endpoint",), (0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(("a",), value)
+    assert histogram.render() == [
+        "# HELP demo_seconds Demo.",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{endpoint="a",le="0.1"} 1',
+        'demo_seconds_bucket{endpoint="a",le="1"} 3',
+        'demo_seconds_bucket{endpoint="a",le="+Inf"} 4',
+        'demo_seconds_sum{endpoint="a"} 4.05',
+        'demo_seconds_count{endpoint="a"} 4',
+    ]
+
+
+def test_server_timing_lists_phases_counters_and_total():
+    recorder = metrics.RequestMetrics()
+    recorder.add_time("parse", 0.0015)
+    recorder.add_time("parse", 0.001)
+    recorder.merge({"phases": {"execute": 0.002}, "counters": {"steps": 3}})
+    timings = _timings(recorder.server_timing())
+    assert timings["parse"] == "dur=2.50" and timings["execute"] == "dur=2.00"
+    assert timings["steps"] == 'desc="3"'
+    assert list(timings)[-1] == "total"
+
+
+def test_phases_outside_a_request_are_not_recorded(monkeypatch):
+    monkeypatch.setattr(metrics, "_current", metrics.ContextVar("request_metrics", default=None))
+    with metrics.phase("idle"):
+        metrics.count("ignored")
+    assert metrics.current() is None
+
+
+def test_trace_response_reports_its_phases(client):
+    response = client.post("/api/trace", json={"code": "x = 1\ny = x + 1", "cache": False})
+    timings = _timings(response.headers["Server-Timing"])
+    # Phases timed in the sandbox worker are merged into the request's.
+    for phase in ("admission", "compile", "trace", "store", "jsonify", "total"):
+        assert timings[phase].startswith("dur=")
+    assert timings["steps"] == 'desc="4"'
+    assert int(timings["response_bytes"][6:-1]) > 0
+
+
+def test_metrics_endpoint_serves_prometheus_text(client):
+    client.post("/api/trace", json={"code": "x = 1"})
+    stream = client.post("/api/trace/stream", json={"code": "x = 1"})
+    stream.get_data()
+    stream.close()
+
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain" and "version=0.0.4" in response.content_type
+    lines = response.get_data(as_text=True).splitlines()
+    assert "# TYPE code_explainer_request_seconds histogram" in lines
+    for line in lines:
+        assert line.startswith("# ") or SAMPLE.match(line), line
+    # Streamed responses are recorded once their body has been sent.
+    assert any(line.startswith('code_explainer_request_seconds_count{endpoint="api_trace_stream"}') for line in lines)
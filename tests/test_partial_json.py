@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from partial_json import ExplanationStreamParser
+
+REPLY = {
+    "summary": "Sorts a list with \"bubble\" sort {in place} \\ done é",
+    "step_explanations": [
+        {"step": 1, "line": 1, "explanation": "Defines bubble_sort, braces } and ] in text."},
+        {"step": 2, "line": 10, "explanation": "Calls it: arr[j] > arr[j + 1]"},
+    ],
+    "key_concepts": ["loops", "swapping"],
+    "count": 12345,
+    "ratio": -1.5e3,
+    "done": True,
+}
+
+
+def _feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def _expected_events(reply):
+    events = []
+    for key, value in reply.items():
+        if key in ExplanationStreamParser.STREAMED_ARRAYS:
+            events.extend((key, item) for item in value)
+        else:
+            events.append((key, value))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_any_chunking_gives_the_same_events(size):
+    text = json.dumps(REPLY, indent=2)
+    parser = ExplanationStreamParser()
+    events = _feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)])
+    assert events == _expected_events(REPLY)
+    assert parser.result == REPLY
+    assert parser.finished
+
+
+def test_unicode_escape_split_across_chunks():
+    parser = ExplanationStreamParser()
+    assert parser.feed('{"summary": "caf\\u00') == []
+    assert parser.feed('e9"}') == [("summary", "café")]
+
+
+def test_number_at_end_of_buffer_waits_for_more_text():
+    parser = ExplanationStreamParser()
+    assert parser.feed('{"count": 12') == []
+    assert parser.feed("34") == []
+    assert parser.feed("}") == [("count", 1234)]
+
+
+def test_entries_are_reported_as_each_one_closes():
+    parser = ExplanationStreamParser()
+    parser.feed('{"summary": "s", "step_explanations": [{"step": 1, "explanation": "a"}')
+    assert parser.feed(", {\"step\": 2, ") == []
+    assert parser.feed('"explanation": "b"}') == [("step_explanations", {"step": 2, "explanation": "b"})]
+    assert not parser.finished
+
+
+def test_leading_code_fence_is_skipped():
+    parser = ExplanationStreamParser()
+    events = _feed_all(parser, ["```json\n", '{"summary": "s", "step_explanations": []}', "\n```"])
+    assert events == [("summary", "s")]
+    assert parser.result == {"summary": "s", "step_explanations": []}
+    assert parser.finished
+
+
+def test_streamed_field_that_is_not_an_array_is_reported_whole():
+    parser = ExplanationStreamParser()
+    assert parser.feed('{"step_explanations": null}') == [("step_explanations", None)]
+
+
+def test_truncated_reply_keeps_completed_fields():
+    text = json.dumps(REPLY)
+    cut = text.index('"Calls it')
+    parser = ExplanationStreamParser()
+    parser.feed(text[:cut])
+    assert not parser.finished
+    assert parser.result == {"summary": REPLY["summary"], "step_explanations": REPLY["step_explanations"][:1]}
+
+
+def test_missing_colon_is_an_error():
+    with pytest.raises(ValueError):
+        ExplanationStreamParser().feed('{"summary" "s"}')
+
+
+def test_text_after_the_object_is_ignored():
+    parser = ExplanationStreamParser()
+    parser.feed('{"summary": "s"} trailing {"summary": "t"}')
+    assert parser.result == {"summary": "s"}
@@ -0,0 +1,187 @@
+import pytest
+
+from tracer import (
+    RENDER_MAX_DEPTH,
+    ExecutionTracer,
+    RenderBudget,
+    HeapRenderer,
+    SnapshotRenderer,
+    _safe_repr,
+    expand_heap_trace,
+    resolve_handle,
+)
+
+DEEP = "deep = [[[[[[[[1]]]]]]]]\ntext = 'x' * 3000\nn = 0\n"
+
+MUTATIONS = """def push(xs, v):
+    xs.append(v)
+    return len(xs)
+
+a = [1, [2]]
+b = a
+b[1].append(3)
+d = {"self": None}
+d["self"] = d
+a.append(d)
+del b
+for i in range(30):
+    n = push(a, [i])
+    if i == 20:
+        a[0] = "changed"
+"""
+
+
+def _find_handles(rendering, found=None) -> list[dict]:
+    found = [] if found is None else found
+    if isinstance(rendering, dict):
+        if "handle" in rendering:
+            found.append(rendering)
+        for value in rendering.values():
+            _find_handles(value, found)
+    elif isinstance(rendering, list):
+        for value in rendering:
+            _find_handles(value, found)
+    return found
+
+
+def test_container_below_the_depth_cap_becomes_a_handle():
+    rendering = _safe_repr([[1, [2]]], RenderBudget(max_depth=1), ("v",))
+    assert rendering == {
+        "type": "list", "value": [{"type": "list", "value": "<2 items>", "handle": ["v", 0], "length": 2}],
+    }
+
+
+def test_string_past_the_limit_is_cut_with_its_length():
+    assert _safe_repr("abcdef", RenderBudget(max_string=3), ("s",)) == {
+        "type": "str", "value": "abc", "handle": ["s"], "length": 6,
+    }
+
+
+def test_container_keeps_what_fits_the_node_budget():
+    rendering = _safe_repr(list(range(10)), RenderBudget(nodes=4), ("v",))
+    assert [item["value"] for item in rendering["value"]] == [0, 1, 2]
+    assert (rendering["length"], rendering["handle"]) == (10, ["v"])
+
+
+def test_budget_is_shared_by_a_step_and_never_goes_negative():
+    budget = RenderBudget(nodes=2, size=100)
+    assert budget.take(40) and budget.take(40)
+    assert not budget.take(1)
+    assert (budget.nodes, budget.bytes) == (0, 20)
+
+
+def test_handles_resolve_to_the_values_they_cut_off():
+    value = {"a": [1, [2, 3]]}
+    rendering = _safe_repr(value, RenderBudget(max_depth=2), ("v",))
+    (handle,) = _find_handles(rendering)
+    assert handle["handle"] == ["v", "a", 1]
+    assert resolve_handle({"v": value}, None, handle["handle"]) == [2, 3]
+    with pytest.raises(LookupError):
+        resolve_handle({"v": value}, None, ["v", "b"])
+
+
+@pytest.mark.parametrize("name", ["deep", "text"])
+def test_traced_values_past_the_limits_carry_handles(name):
+    variables = ExecutionTracer(DEEP).run()["steps"][-1]["variables"]
+    (handle,) = _find_handles(variables[name])
+    if name == "deep":
+        assert handle["handle"] == ["deep"] + [0] * RENDER_MAX_DEPTH
+    else:
+        assert handle["handle"] == ["text"] and handle["length"] == 3000
+
+
+def test_heap_expander_keeps_handles_of_cut_off_values():
+    inline = ExecutionTracer(DEEP).run()
+    heap = ExecutionTracer(DEEP, trace_format="heap").run()
+    assert expand_heap_trace(heap)["steps"] == inline["steps"]
+
+
+class Counter:
+    def __init__(self):
+        self.n = 0
+
+    def __repr__(self):
+        return f"Counter({self.n})"
+
+
+def test_unchanged_values_share_their_rendering_across_steps():
+    renderer = SnapshotRenderer()
+    value = [1, [2, 3], "x"]
+    first = renderer.snapshot({"v": value})["v"]
+    assert renderer.snapshot({"v": value})["v"] is first
+    assert first == _safe_repr(value, path=("v",))
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda v: v[1].append(4),
+    lambda v: v[1].__setitem__(0, 9),
+    lambda v: v.__setitem__(2, "y"),
+])
+def test_mutation_after_a_cache_hit_is_rendered_afresh(mutate):
+    renderer = SnapshotRenderer()
+    value = [1, [2, 3], "x"]
+    renderer.snapshot({"v": value})
+    before = renderer.snapshot({"v": value})["v"]
+    frozen = _safe_repr(value, path=("v",))
+
+    mutate(value)
+    after = renderer.snapshot({"v": value})["v"]
+    assert after == _safe_repr(value, path=("v",))
+    # Earlier renderings are shared with earlier steps, so they are never changed in place.
+    assert before == frozen and after != before
+
+
+def test_objects_are_rendered_by_their_current_repr():
+    renderer = SnapshotRenderer()
+    counter = Counter()
+    renderer.snapshot({"c": [counter]})
+    counter.n = 1
+    assert renderer.snapshot({"c": [counter]})["c"]["value"][0]["value"] == "Counter(1)"
+
+
+def test_cycles_render_as_a_marker():
+    value = [1]
+    value.append(value)
+    rendering = SnapshotRenderer().snapshot({"v": value})["v"]
+    assert rendering["value"][1] == {"type": "list", "value": "<cycle>"}
+
+
+def test_aliases_share_one_heap_entry():
+    renderer = HeapRenderer()
+    value = [1]
+    snapshot = renderer.snapshot({"x": value, "y": value})
+    assert snapshot["x"] == snapshot["y"] == {"ref": "1"}
+    assert renderer.take_changes() == {"1": {"type": "list", "value": [{"type": "int", "value": 1}], "version": 1}}
+
+
+def test_only_changed_objects_are_listed_with_a_new_version():
+    renderer = HeapRenderer()
+    inner = [0]
+    outer = [inner]
+    renderer.snapshot({"outer": outer})
+    renderer.take_changes()
+    assert renderer.snapshot({"outer": outer}) == {"outer": {"ref": "1"}} and renderer.take_changes() == {}
+
+    inner.append(1)
+    renderer.snapshot({"outer": outer})
+    changes = renderer.take_changes()
+    assert list(changes) == ["2"] and changes["2"]["version"] == 2
+
+
+def test_cycles_are_references_to_the_same_entry():
+    renderer = HeapRenderer()
+    value = {"name": "node"}
+    value["self"] = value
+    assert renderer.snapshot({"v": value}) == {"v": {"ref": "1"}}
+    assert renderer.take_changes()["1"]["value"]["self"] == {"ref": "1"}
+
+
+@pytest.mark.parametrize("options", [{}, {"sampling": True}, {"budget": 25}])
+def test_expanded_heap_trace_equals_the_inline_trace(options):
+    inline = ExecutionTracer(MUTATIONS, **options).run()
+    heap = ExecutionTracer(MUTATIONS, trace_format="heap", **options).run()
+    assert expand_heap_trace(heap) == inline
+    # In-place mutations keep the ref, but the expanded changes still report them.
+    mutated = next(step for step in inline["steps"] if step["source_line"].strip() == "b[1].append(3)")
+    after = inline["steps"][inline["steps"].index(mutated) + 1]
+    assert set(after["changes"]["updated"]) == {"a", "b"}
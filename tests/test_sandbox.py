@@ -0,0 +1,36 @@
+from collections import OrderedDict
+
+import pytest
+
+import sandbox
+from sandbox import compile_source
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(sandbox, "_compile_cache", OrderedDict())
+
+
+def test_compiled_source_is_reused():
+    first = compile_source("x = 1\nfor i in range(2):\n    x += i")
+    assert compile_source("x = 1\nfor i in range(2):\n    x += i") is first
+    compiled, error, line_index = first
+    assert compiled is not None and error is None
+    assert line_index[2]["kind"] == "loop"
+
+
+def test_syntax_errors_are_cached_without_a_line_index():
+    entry = compile_source("if x\n    pass")
+    compiled, error, line_index = entry
+    assert compiled is None and error["type"] == "SyntaxError" and line_index == {}
+    assert compile_source("if x\n    pass") is entry
+
+
+def test_least_recently_used_source_is_evicted(monkeypatch):
+    monkeypatch.setattr(sandbox, "COMPILE_CACHE_SIZE", 2)
+    a, b = compile_source("a = 1"), compile_source("b = 1")
+    assert compile_source("a = 1") is a
+    compile_source("c = 1")
+    assert compile_source("a = 1") is a
+    assert compile_source("b = 1") is not b
+    assert len(sandbox._compile_cache) == 2
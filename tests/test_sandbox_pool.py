@@ -0,0 +1,138 @@
+import os
+import pickle
+import signal
+import time
+
+import pytest
+
+from json_codec import dumps
+from sandbox import TIMEOUT_ERROR_TYPES
+from sandbox_pool import SandboxPool, SandboxPoolBusy, _read_message, execute_batch
+from trace_cache import TraceCache
+
+
+def test_worker_messages_are_json():
+    step = {"step": 1, "variables": {"big": {"type": "int", "value": 2 ** 100}}}
+    assert _read_message(dumps(["step", step]).encode()) == ("step", step)
+
+
+@pytest.mark.parametrize("message", [
+    ["exec", {}],
+    ["step"],
+    ["step", [1, 2]],
+    ["metrics", {"phases": {"trace": "slow"}}],
+    ["done", {"steps": None}],
+])
+def test_malformed_worker_messages_are_rejected(message):
+    with pytest.raises(ValueError):
+        _read_message(dumps(message).encode())
+
+
+def test_pickles_are_never_loaded():
+    with pytest.raises(ValueError):
+        _read_message(pickle.dumps(("done", {"steps": []})))
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**options):
+        pool = SandboxPool(**dict({"size": 1, "max_queued": 0}, **options))
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_worker_killed_mid_trace_is_replaced(make_pool):
+    pool = make_pool()
+    worker = pool._idle.queue[0]
+    messages = pool.stream("while True:\n    x = 1\n", timeout=10)
+    assert next(messages)[0] == "step"
+    os.kill(worker.process.pid, signal.SIGKILL)
+    kind, result = list(messages)[-1]
+    assert kind == "done" and result["error"]["type"] == "ResourceLimitExceeded"
+    assert pool.respawns == 1
+    assert pool.run("y = 2")["completed"]
+
+
+def test_worker_is_recycled_after_max_tasks(make_pool):
+    pool = make_pool(max_tasks=2)
+    first = pool._idle.queue[0].process.pid
+    pool.run("a = 1")
+    pool.run("a = 2")
+    assert pool.recycled == 1
+    assert pool._idle.queue[0].process.pid != first
+    assert pool.run("a = 3")["completed"]
+
+
+def test_busy_when_the_queue_is_full(make_pool):
+    pool = make_pool()
+    messages = pool.stream("for i in range(3):\n    x = i\n")
+    try:
+        with pytest.raises(SandboxPoolBusy):
+            pool.run("y = 1")
+    finally:
+        messages.close()
+    assert pool.run("y = 1")["completed"]
+
+
+def test_memory_limit_is_reported(make_pool):
+    pool = make_pool(memory_limit=64 * 1024 * 1024)
+    result = pool.run("x = [0] * (64 * 1024 * 1024)\n")
+    assert result["error"]["type"] in ("MemoryError", "ResourceLimitExceeded")
+    assert pool.run("y = 1")["completed"]
+
+
+def test_slow_stream_consumer_does_not_run_into_the_time_limit(make_pool):
+    pool = make_pool()
+    # Far more output than a pipe buffer holds, produced well within the limit.
+    messages = pool.stream("data = 'x' * 2000\nfor i in range(150):\n    data = data + str(i)\n", timeout=1)
+    assert next(messages)[0] == "step"
+    time.sleep(2.5)
+    kind, result = list(messages)[-1]
+    assert kind == "done" and result["error"] is None
+    assert pool.respawns == 0
+
+
+def test_closing_a_stream_early_stops_the_run(make_pool):
+    pool = make_pool()
+    messages = pool.stream("while True:\n    x = 1\n", timeout=10)
+    started = time.monotonic()
+    messages.close()
+    assert time.monotonic() - started < 2
+    assert pool.respawns == 1
+    assert pool.run("y = 1")["completed"]
+
+
+MIXED_BATCH = ["x = 1", "x = 1 / 0", "while True:\n    pass", "x = 1", "y = 2"]
+
+
+def _check_mixed(results: list[dict]) -> None:
+    ok, error, timeout, duplicate, other = results
+    assert ok["completed"] and ok["steps"][-1]["variables"]["x"]["value"] == 1
+    assert error["error"]["type"] == "ZeroDivisionError"
+    assert timeout["error"]["type"] in TIMEOUT_ERROR_TYPES
+    assert duplicate is ok
+    assert other["steps"][-1]["variables"]["y"]["value"] == 2
+
+
+def test_batch_yields_every_index_once_with_its_own_result(make_pool):
+    pool = make_pool(size=2)
+    pairs = list(execute_batch(MIXED_BATCH, timeout=1, pool=pool))
+    assert sorted(index for index, _ in pairs) == list(range(len(MIXED_BATCH)))
+    results = dict(pairs)
+    _check_mixed([results[index] for index in range(len(MIXED_BATCH))])
+    # The endless loop finishes last; the quick items are not held back behind it.
+    assert pairs[-1][0] == 2
+
+
+def test_batch_caches_results_but_not_timeouts(make_pool):
+    pool = make_pool(size=2)
+    cache = TraceCache()
+    list(execute_batch(MIXED_BATCH, timeout=1, pool=pool, cache=cache))
+    assert cache.lookup("x = 1", 1) is not None and cache.lookup("y = 2", 1) is not None
+    assert cache.lookup("while True:\n    pass", 1) is None
@@ -0,0 +1,119 @@
+import pytest
+
+from sandbox import TRANSIENT_ERROR_TYPES
+from trace_cache import TraceCache, cache_key
+from tracer import ExecutionTracer
+
+SOURCE = "x = 1\ny = x + 1\n"
+
+
+def _trace(source, timeout=None, tracer_options=None):
+    return ExecutionTracer(source, **(tracer_options or {})).run()
+
+
+class _CountingRun:
+    def __init__(self, run=_trace):
+        self.run = run
+        self.calls = 0
+
+    def __call__(self, source, timeout, tracer_options):
+        self.calls += 1
+        return self.run(source, timeout, tracer_options)
+
+
+def test_key_ignores_comments_and_intra_line_whitespace():
+    assert cache_key(SOURCE) == cache_key("x=1   # one\ny = x+1  \n")
+
+
+def test_key_keeps_line_numbers():
+    assert cache_key(SOURCE) != cache_key("\nx = 1\ny = x + 1\n")
+
+
+def test_key_distinguishes_code_limits_and_options():
+    assert cache_key(SOURCE) != cache_key("x = 1\ny = x + 2\n")
+    assert cache_key(SOURCE, timeout=1) != cache_key(SOURCE, timeout=2)
+    assert cache_key(SOURCE) != cache_key(SOURCE, tracer_options={"sampling": True})
+
+
+@pytest.mark.parametrize("source", [
+    "import random\nx = random.random()\n",
+    "from random import randint\nx = randint(1, 6)\n",
+    "import random.sub\n",
+])
+def test_nondeterministic_programs_have_no_key(source):
+    assert cache_key(source) is None
+
+
+def test_unparsable_source_is_keyed_verbatim():
+    assert cache_key("x = (") == cache_key("x = (")
+    assert cache_key("x = (") != cache_key("x  = (")
+
+
+def test_hit_is_rebased_onto_the_submitted_source():
+    cache = TraceCache()
+    run = _CountingRun()
+    first = cache.get_or_run("for i in range(2):  # loop\n    pass\n", run)
+    second = cache.get_or_run("for i in range(2):\n    pass  # body\n", run)
+
+    assert run.calls == 1
+    assert [s["step"] for s in second["steps"]] == [s["step"] for s in first["steps"]]
+    assert second["source"] == "for i in range(2):\n    pass  # body\n"
+    lines = {s["line_number"]: s["source_line"] for s in second["steps"]}
+    assert lines[1] == "for i in range(2):"
+    assert lines[2] == "    pass  # body"
+    loop_steps = [s for s in second["steps"] if s.get("control_flow", {}).get("type") == "loop"]
+    assert loop_steps and all(s["control_flow"]["expression"] == "for i in range(2):" for s in loop_steps)
+
+
+def test_hit_on_identical_source_returns_stored_trace():
+    cache = TraceCache()
+    first = cache.get_or_run(SOURCE, _trace)
+    assert cache.get_or_run(SOURCE, _trace) is first
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("error_type", sorted(TRANSIENT_ERROR_TYPES))
+def test_timeouts_and_worker_failures_are_not_cached(error_type):
+    run = _CountingRun(lambda s, t, o: {"source": s, "steps": [], "error": {"type": error_type}})
+    cache = TraceCache()
+    cache.get_or_run(SOURCE, run)
+    cache.get_or_run(SOURCE, run)
+    assert run.calls == 2
+
+
+def test_bypass_runs_every_time():
+    run = _CountingRun()
+    cache = TraceCache()
+    cache.get_or_run(SOURCE, run, use_cache=False)
+    cache.get_or_run(SOURCE, run, use_cache=False)
+    assert run.calls == 2
+    assert cache.stats()["bypassed"] == 2
+
+
+def test_evicts_least_recently_used_within_byte_budget():
+    entry = {"steps": ["x" * 100]}
+    cache = TraceCache(max_bytes=250)
+    cache.put("a", entry)
+    cache.put("b", entry)
+    assert cache.get("a") is entry  # "b" is now the least recently used
+    cache.put("c", entry)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is entry and cache.get("c") is entry
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 250
+
+
+def test_replacing_an_entry_does_not_double_count_it():
+    cache = TraceCache()
+    cache.put("a", {"steps": [1]})
+    size = cache.stats()["bytes"]
+    cache.put("a", {"steps": [1]})
+    assert cache.stats()["bytes"] == size
+
+
+def test_entries_larger_than_the_budget_are_not_stored():
+    cache = TraceCache(max_bytes=10)
+    cache.put("a", {"steps": ["x" * 100]})
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
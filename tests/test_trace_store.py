@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import trace_store
+from trace_store import TraceStore, is_trace_id
+from tracer import ExecutionTracer
+
+SOURCE = "values = []\nfor i in range(80):\n    values.append(i * i)\ntotal = sum(values)\n"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TraceStore(str(tmp_path))
+
+
+@pytest.fixture(scope="module")
+def trace():
+    return ExecutionTracer(SOURCE).run()
+
+
+def test_round_trip_and_windows(store, trace):
+    trace_id = store.put(trace)
+    assert is_trace_id(trace_id)
+    assert store.load(trace_id) == trace
+    window = store.window(trace_id, 55, 70)
+    assert window["steps"] == trace["steps"][55:70]
+    assert window["total"] == len(trace["steps"])
+
+
+def test_ids_are_content_addressed(store, trace):
+    assert store.put(trace) == store.put(dict(trace))
+    assert store.put(dict(trace, steps=trace["steps"][:-1])) != store.put(trace)
+    assert len(os.listdir(store.directory)) == 2
+
+
+def test_streamed_writer_matches_put(store, trace):
+    with store.writer() as writer:
+        for step in trace["steps"]:
+            writer.add(step)
+        trace_id = writer.finish(dict(trace, steps=[]))
+    assert trace_id == store.put(trace)
+
+
+def test_unfinished_writer_leaves_no_file(store, trace):
+    with store.writer() as writer:
+        writer.add(trace["steps"][0])
+    assert os.listdir(store.directory) == []
+
+
+def test_known_source_key_skips_the_write(store, trace, monkeypatch):
+    trace_id = store.put(trace, key="program")
+    monkeypatch.setattr(trace_store.TraceWriter, "add", lambda self, step: pytest.fail("trace written again"))
+    assert store.put(trace, key="program") == trace_id
+
+
+def test_known_source_key_of_an_evicted_trace_is_written_again(store, trace):
+    trace_id = store.put(trace, key="program")
+    os.remove(store._path(trace_id))
+    assert store.put(trace, key="program") == trace_id
+    assert store.exists(trace_id)
+
+
+def test_load_of_an_evicted_trace_is_a_miss(store, trace):
+    trace_id = store.put(trace)
+    os.remove(store._path(trace_id))
+    assert store.load(trace_id) is None
+    assert store.window(trace_id, 0, 10) is None
+    assert not store.exists(trace_id)
+
+
+def test_least_recently_used_traces_are_evicted(tmp_path, trace):
+    store = TraceStore(str(tmp_path))
+    first = store.put(trace)
+    size = os.path.getsize(store._path(first))
+    store.max_bytes = int(size * 2.5)
+    second = store.put(dict(trace, steps=trace["steps"][:-1]))
+    os.utime(store._path(first), (0, 0))
+    os.utime(store._path(second), (1, 1))
+    store.load(first)
+    store.put(dict(trace, steps=trace["steps"][:-2]))
+    assert store.exists(first) and not store.exists(second)
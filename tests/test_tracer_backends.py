@@ -0,0 +1,101 @@
+import sys
+
+import pytest
+
+from tracer import ExecutionTracer
+
+needs_monitoring = pytest.mark.skipif(not hasattr(sys, "monitoring"), reason="sys.monitoring needs Python 3.12+")
+
+PROGRAMS = {
+    "recursion": """def fact(n):
+    if n <= 1:
+        return 1
+    return n * fact(n - 1)
+
+result = fact(4)
+""",
+    "exceptions": """def check(x):
+    if x < 0:
+        raise ValueError("negative")
+    return x
+
+total = 0
+for v in (1, -1, 2):
+    try:
+        total += check(v)
+    except ValueError as e:
+        message = str(e)
+""",
+    "generator": """def count(n):
+    i = 0
+    while i < n:
+        yield i
+        i += 1
+
+items = []
+for value in count(3):
+    items.append(value)
+""",
+    "single_line_loop": """i = 0
+while i < 4: i += 1
+done = True
+""",
+    "uncaught": """def boom():
+    return 1 / 0
+
+boom()
+""",
+}
+
+
+def _run(source: str, backend: str, **options) -> dict:
+    return ExecutionTracer(source, backend=backend, **options).run()
+
+
+@needs_monitoring
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_backends_produce_identical_traces(name):
+    source = PROGRAMS[name]
+    monitored = _run(source, "monitoring")
+    traced = _run(source, "settrace")
+    assert monitored["steps"] == traced["steps"]
+    assert (monitored["step_count"], monitored["error"]) == (traced["step_count"], traced["error"])
+
+
+@needs_monitoring
+@pytest.mark.parametrize("options", [{"budget": 7}, {"budget": 10, "sampling": True}])
+def test_backends_agree_on_budgets_and_sampling(options):
+    source = "total = 0\nfor i in range(30):\n    total += i\n"
+    monitored = _run(source, "monitoring", **options)
+    traced = _run(source, "settrace", **options)
+    assert monitored["steps"] == traced["steps"]
+    assert monitored["truncated"] == traced["truncated"]
+
+
+@needs_monitoring
+def test_falls_back_to_settrace_when_the_monitoring_slot_is_taken():
+    tool = sys.monitoring.DEBUGGER_ID
+    sys.monitoring.use_tool_id(tool, "another debugger")
+    try:
+        trace = _run(PROGRAMS["recursion"], "monitoring")
+    finally:
+        sys.monitoring.free_tool_id(tool)
+    assert trace["steps"] == _run(PROGRAMS["recursion"], "settrace")["steps"]
+
+
+@needs_monitoring
+def test_monitoring_is_released_after_a_run():
+    _run(PROGRAMS["exceptions"], "monitoring")
+    assert sys.monitoring.get_tool(sys.monitoring.DEBUGGER_ID) is None
+
+
+def test_auto_picks_monitoring_only_where_available():
+    expected = "monitoring" if hasattr(sys, "monitoring") else "settrace"
+    assert ExecutionTracer("x = 1", backend="auto").backend == expected
+    assert ExecutionTracer("x = 1", backend="monitoring").backend == expected
+    assert ExecutionTracer("x = 1", backend="settrace").backend == "settrace"
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        ExecutionTracer("x = 1", backend="ptrace")
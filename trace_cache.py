@@ -0,0 +1,157 @@
+import ast
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+from line_index import build_line_index
+from sandbox import ALLOWED_MODULES, DEFAULT_TIMEOUT, TRANSIENT_ERROR_TYPES
+from tracer import ExecutionTracer
+
+DEFAULT_MAX_BYTES = int(os.environ.get("TRACE_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Traces of programs using these modules differ from run to run, so they are never cached.
+NONDETERMINISTIC_MODULES = frozenset({"random"})
+
+
+def _imported_modules(tree: ast.AST) -> set[str]:
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+
+def cache_key(source: str, timeout: int = DEFAULT_TIMEOUT, tracer_options: dict | None = None) -> str | None:
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        normalized = "raw:" + source
+    else:
+        if _imported_modules(tree) & NONDETERMINISTIC_MODULES:
+            return None
+        # Comments and intra-line whitespace vanish from the AST dump; statement
+        # line numbers are kept so cached steps still point at the right lines.
+        line_numbers = [node.lineno for node in ast.walk(tree) if hasattr(node, "lineno")]
+        normalized = ast.dump(tree) + repr(line_numbers)
+
+    limits = (ExecutionTracer.MAX_STEPS, timeout, sorted(ALLOWED_MODULES))
+    payload = json.dumps([normalized, limits, tracer_options or {}], sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _rebase_trace(trace: dict, source: str) -> dict:
+    if trace.get("source") == source:
+        return trace
+
+    source_lines = source.splitlines()
+    line_index = build_line_index(source)
+
+    def line_text(lineno: int) -> str:
+        if 1 <= lineno <= len(source_lines):
+            return source_lines[lineno - 1].rstrip()
+        return ""
+
+    steps = []
+    for step in trace["steps"]:
+        step = dict(step)
+        step["source_line"] = line_text(step["line_number"])
+        cf = step.get("control_flow")
+        info = line_index.get(step["line_number"])
+        if cf and "expression" in cf and info is not None:
+            step["control_flow"] = dict(cf, expression=info["expression"])
+        steps.append(step)
+
+    return dict(trace, source=source, source_lines=source_lines, steps=steps)
+
+
+class TraceCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, trace: dict) -> None:
+        size = len(json.dumps(trace, separators=(",", ":"), default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (trace, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def lookup(self, source: str, timeout: int = DEFAULT_TIMEOUT, tracer_options: dict | None = None) -> dict | None:
+        key = cache_key(source, timeout, tracer_options)
+        if key is None:
+            return None
+        trace = self.get(key)
+        return _rebase_trace(trace, source) if trace is not None else None
+
+    def get_or_run(
+        self,
+        source: str,
+        run,
+        timeout: int = DEFAULT_TIMEOUT,
+        tracer_options: dict | None = None,
+        use_cache: bool = True,
+    ) -> dict:
+        key = cache_key(source, timeout, tracer_options) if use_cache else None
+        if key is None:
+            with self._lock:
+                self.bypassed += 1
+            return run(source, timeout, tracer_options)
+
+        trace = self.get(key)
+        if trace is not None:
+            metrics.count("trace_cache_hit")
+            return _rebase_trace(trace, source)
+
+        metrics.count("trace_cache_miss")
+        trace = run(source, timeout, tracer_options)
+        error = trace.get("error") or {}
+        if error.get("type") not in TRANSIENT_ERROR_TYPES:
+            self.put(key, trace)
+        return trace
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+import metrics
+from keyframes import KEYFRAME_INTERVAL, KeyframeBuilder, KeyframeTrace
+from tracer import HeapExpander
+
+DEFAULT_DIR = os.environ.get("TRACE_STORE_DIR", "trace_store")
+DEFAULT_MAX_BYTES = int(os.environ.get("TRACE_STORE_BYTES", 512 * 1024 * 1024))
+# Stored IDs remembered per source key, so cache hits are neither hashed nor written again.
+KNOWN_ID_ENTRIES = int(os.environ.get("TRACE_STORE_KNOWN_IDS", 4096))
+
+_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_TRAILER = struct.Struct("<QQ")
+_OFFSET = struct.Struct("<Q")
+
+# File layout, all written once, front to back while the trace runs:
+#   n step lines   [step without "variables", keyframe or null]
+#   header line    {"summary": trace minus steps, "count": n, "keyframes": [positions]}
+#   offset index   n + 1 little-endian u64 file offsets of the step lines and the header
+#   trailer        u64 index offset, u64 n
+# A window is read by seeking to the nearest keyframe at or before its start, via the index,
+# and replaying deltas from there. The trace ID is a hash of the step and header lines.
+
+
+def is_trace_id(value) -> bool:
+    return isinstance(value, str) and bool(_ID_PATTERN.match(value))
+
+
+class TraceWriter:
+    # Writes one trace as its steps arrive, so a streamed trace is never held in memory.
+    # finish() moves the file into place under its ID, or drops it when the same trace is
+    # already stored. Without finish(), closing the writer discards the partial file.
+
+    def __init__(self, store: "TraceStore", heap: bool = False, key: str | None = None):
+        self.store = store
+        self.key = key
+        self.trace_id = store._known_id(key)
+        self.expander = HeapExpander() if heap else None
+        self.builder = KeyframeBuilder(KEYFRAME_INTERVAL)
+        self.digest = hashlib.sha256()
+        self.offsets: list[int] = []
+        self.keyframes: list[int] = []
+        self.file = None
+        self.tmp_path: str | None = None
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _write(self, line: bytes) -> None:
+        if self.file is None:
+            os.makedirs(self.store.directory, exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(dir=self.store.directory, suffix=".tmp")
+            self.file = os.fdopen(fd, "wb")
+        self.offsets.append(self.file.tell())
+        self.digest.update(line)
+        self.file.write(line)
+
+    def add(self, step: dict) -> None:
+        if self.trace_id is not None:
+            return
+        if self.expander is not None:
+            step = self.expander.step(step)
+        step, keyframe = self.builder.add(step)
+        if keyframe is not None:
+            self.keyframes.append(len(self.offsets))
+        self._write(json.dumps([step, keyframe], separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def finish(self, summary: dict) -> str:
+        if self.trace_id is not None:
+            return self.trace_id
+
+        with metrics.phase("store"):
+            count = len(self.offsets)
+            summary = {k: v for k, v in summary.items() if k not in ("steps", "format")}
+            header = {"summary": summary, "count": count, "keyframes": self.keyframes}
+            self._write(json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n")
+            f = self.file
+            index_offset = f.tell()
+            f.write(struct.pack(f"<{len(self.offsets)}Q", *self.offsets))
+            f.write(_TRAILER.pack(index_offset, count))
+            size = f.tell()
+            f.close()
+            self.file = None
+
+            trace_id = self.digest.hexdigest()[:32]
+            path = self.store._path(trace_id)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                os.replace(self.tmp_path, path)
+                metrics.count("trace_store_bytes", size)
+                self.store._account(size)
+            else:
+                os.remove(self.tmp_path)
+            self.tmp_path = None
+        self.trace_id = trace_id
+        self.store._remember(self.key, trace_id)
+        return trace_id
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.tmp_path is not None:
+            os.remove(self.tmp_path)
+            self.tmp_path = None
+
+
+class TraceStore:
+    def __init__(self, directory: str = DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes: int | None = None
+        self._known: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, trace_id: str) -> str:
+        return os.path.join(self.directory, trace_id + ".trace")
+
+    def _known_id(self, key: str | None) -> str | None:
+        # `key` names the program and options a trace came from, for traces that are the
+        # same on every run (see app._source_key). A known ID counts as a use of its file.
+        if key is None:
+            return None
+        with self._lock:
+            trace_id = self._known.get(key)
+            if trace_id is None:
+                return None
+            self._known.move_to_end(key)
+        try:
+            os.utime(self._path(trace_id))
+        except FileNotFoundError:
+            return None
+        return trace_id
+
+    def _remember(self, key: str | None, trace_id: str) -> None:
+        if key is None:
+            return
+        with self._lock:
+            self._known[key] = trace_id
+            self._known.move_to_end(key)
+            while len(self._known) > KNOWN_ID_ENTRIES:
+                self._known.popitem(last=False)
+
+    def writer(self, heap: bool = False, key: str | None = None) -> TraceWriter:
+        return TraceWriter(self, heap, key)
+
+    def put(self, trace: dict, key: str | None = None) -> str:
+        # Stored traces are content-addressed, so tracing the same program again reuses the file.
+        with self.writer(trace.get("format") == "heap", key) as writer:
+            if writer.trace_id is not None:
+                return writer.trace_id
+            with metrics.phase("store"):
+                for step in trace["steps"]:
+                    writer.add(step)
+            return writer.finish(trace)
+
+    def _read(self, trace_id: str, start: int, stop: int | None) -> dict | None:
+        path = self._path(trace_id)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            f.seek(-_TRAILER.size, os.SEEK_END)
+            index_offset, count = _TRAILER.unpack(f.read(_TRAILER.size))
+            f.seek(index_offset + count * _OFFSET.size)
+            (header_offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+            f.seek(header_offset)
+            header = json.loads(f.read(index_offset - header_offset))
+            stop = count if stop is None else min(stop, count)
+            start = max(start, 0)
+            result = dict(header["summary"], total=count)
+            if start >= stop:
+                result["steps"] = []
+                return result
+
+            positions = header["keyframes"]
+            first = positions[bisect_right(positions, start) - 1]
+            f.seek(index_offset + first * _OFFSET.size)
+            offsets = struct.unpack(f"<{stop - first + 1}Q", f.read((stop - first + 1) * _OFFSET.size))
+            f.seek(offsets[0])
+            records = [json.loads(line) for line in f.read(offsets[-1] - offsets[0]).splitlines()]
+
+        keyframes = {i: keyframe for i, (_, keyframe) in enumerate(records) if keyframe is not None}
+        window = KeyframeTrace(header["summary"], [step for step, _ in records], keyframes)
+        result["steps"] = window.window(start - first, stop - first)
+        return result
+
+    def exists(self, trace_id: str) -> bool:
+        return os.path.exists(self._path(trace_id))
+
+    def window(self, trace_id: str, start: int, stop: int) -> dict | None:
+        with metrics.phase("store"):
+            return self._read(trace_id, start, stop)
+
+    def load(self, trace_id: str) -> dict | None:
+        # Touched before reading, since eviction can remove the file at any point.
+        try:
+            os.utime(self._path(trace_id))
+        except FileNotFoundError:
+            return None
+        with metrics.phase("store"):
+            trace = self._read(trace_id, 0, None)
+        if trace is not None:
+            del trace["total"]
+        return trace
+
+    def _account(self, size: int) -> None:
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._bytes += size
+            if self._bytes <= self.max_bytes:
+                return
+            # Drop the least recently written or read traces until 90% of the budget is free.
+            for entry in sorted(self._entries(), key=lambda e: e.stat().st_mtime):
+                if self._bytes <= self.max_bytes * 0.9:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                self._bytes -= size
+
+    def _entries(self) -> list[os.DirEntry]:
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".trace")]
+        except FileNotFoundError:
+            return []
@@ -1,37 +1,170 @@
+import os
 import sys
-import copy
+import time
 import types
+from itertools import islice
 from typing import Any
 
+import metrics
+from line_index import build_line_index, loop_spans
+from line_profile import LineProfiler
+from loop_sampling import Elision, LoopSampler
 
-def _safe_repr(value: Any) -> dict:
-    if value is None:
-        return {"type": "NoneType", "value": None}
-    if isinstance(value, bool):
-        return {"type": "bool", "value": value}
+# "auto" uses sys.monitoring (PEP 669) when available (3.12+) and falls back to sys.settrace.
+TRACER_BACKENDS = ("auto", "settrace", "monitoring")
+TRACER_BACKEND = os.environ.get("TRACER_BACKEND", "auto")
+_monitoring = getattr(sys, "monitoring", None)
+
+# Rendering limits for one step, shared by all of its variables, so a snapshot stays small
+# whatever the program builds. A subtree past a limit is cut off and marked with a handle:
+# its path from the variable (names, list indices, dict keys as rendered), which
+# /api/trace/expand renders on demand by re-running the program to that step.
+RENDER_MAX_DEPTH = int(os.environ.get("RENDER_MAX_DEPTH", 6))
+RENDER_MAX_NODES = int(os.environ.get("RENDER_MAX_NODES", 2000))
+RENDER_MAX_BYTES = int(os.environ.get("RENDER_MAX_BYTES", 64 * 1024))
+RENDER_MAX_STRING = int(os.environ.get("RENDER_MAX_STRING", 1000))
+# Items rendered per container.
+MAX_ITEMS = 50
+# Handle root for the value a function returns.
+RETURN_HANDLE = "<return>"
+
+_CONTAINER_TYPES = (list, tuple, dict, set)
+# Rough JSON size of a rendered node ({"type": ..., "value": ...}).
+_NODE_BYTES = 24
+# Scalars that always render whole.
+_SMALL_TYPES = (type(None), bool, float)
+_SMALL_INT = 10 ** 18
+# Longer ints are never rendered whole: int-to-str conversion stops at 4300 digits.
+_MAX_INT_DIGITS = 4000
+
+
+class RenderBudget:
+    __slots__ = ("nodes", "bytes", "max_depth", "max_string")
+
+    def __init__(
+        self,
+        nodes: int = RENDER_MAX_NODES,
+        size: int = RENDER_MAX_BYTES,
+        max_depth: int = RENDER_MAX_DEPTH,
+        max_string: int = RENDER_MAX_STRING,
+    ):
+        self.nodes = nodes
+        self.bytes = size
+        self.max_depth = max_depth
+        self.max_string = max_string
+
+    def take(self, size: int) -> bool:
+        if self.nodes <= 0 or self.bytes < size:
+            return False
+        self.nodes -= 1
+        self.bytes -= size
+        return True
+
+
+def _handle(value: Any, path: tuple, shown: Any, length: int | None = None) -> dict:
+    rendering = {"type": type(value).__name__, "value": shown, "handle": list(path)}
+    if length is not None:
+        rendering["length"] = length
+    return rendering
+
+
+def _render_text(value: Any, text: str, budget: RenderBudget, path: tuple) -> dict:
+    # Strings and reprs: cut to the string limit or the bytes left, keeping a handle.
+    limit = min(budget.max_string, budget.bytes - _NODE_BYTES)
+    if len(text) <= limit and budget.take(len(text) + _NODE_BYTES):
+        return {"type": type(value).__name__, "value": text}
+    shown = text[:max(limit, 0)]
+    budget.take(len(shown) + _NODE_BYTES)
+    return _handle(value, path, shown, len(text))
+
+
+def _render_leaf(value: Any, budget: RenderBudget, path: tuple) -> dict:
+    # Fast path for the values nearly every step is made of.
+    value_type = type(value)
+    if value_type in _SMALL_TYPES or (value_type is int and -_SMALL_INT < value < _SMALL_INT):
+        if budget.take(_NODE_BYTES):
+            return {"type": value_type.__name__, "value": value}
+        return _handle(value, path, "…")
+    if isinstance(value, (bool, float)):
+        return {"type": value_type.__name__, "value": value} if budget.take(_NODE_BYTES) else _handle(value, path, "…")
     if isinstance(value, int):
-        return {"type": "int", "value": value}
-    if isinstance(value, float):
-        return {"type": "float", "value": value}
+        digits = value.bit_length() * 30103 // 100000 + 1
+        if digits <= min(budget.max_string, _MAX_INT_DIGITS) and budget.take(digits + _NODE_BYTES):
+            return {"type": "int", "value": value}
+        return _handle(value, path, f"<int of about {digits} digits>")
     if isinstance(value, str):
-        return {"type": "str", "value": value}
-    if isinstance(value, (list, tuple)):
-        type_name = type(value).__name__
-        return {
-            "type": type_name,
-            "value": [_safe_repr(item) for item in value[:50]]
-        }
-    if isinstance(value, dict):
-        safe_dict = {}
-        for k, v in list(value.items())[:50]:
-            safe_dict[str(k)] = _safe_repr(v)
-        return {"type": "dict", "value": safe_dict}
-    if isinstance(value, set):
-        return {"type": "set", "value": [_safe_repr(item) for item in list(value)[:50]]}
+        return _render_text(value, value, budget, path)
+    if budget.nodes <= 0:
+        return _handle(value, path, "…")
     try:
-        return {"type": type(value).__name__, "value": repr(value)}
+        text = repr(value)
     except Exception:
-        return {"type": type(value).__name__, "value": "<unrepresentable>"}
+        text = "<unrepresentable>"
+    return _render_text(value, text, budget, path)
+
+
+def _children(value: Any) -> list[tuple[Any, Any]]:
+    # (path element, item) for the items a container renders.
+    if isinstance(value, dict):
+        return [(str(k), v) for k, v in islice(value.items(), MAX_ITEMS)]
+    items = islice(value, MAX_ITEMS) if isinstance(value, set) else value[:MAX_ITEMS]
+    return list(enumerate(items))
+
+
+def _collapsed(value: Any, depth: int, budget: RenderBudget, path: tuple) -> dict | None:
+    # A container below the depth cap, or with no budget left, is replaced by its handle.
+    if (depth >= budget.max_depth and value) or not budget.take(_NODE_BYTES):
+        return _handle(value, path, f"<{len(value)} items>", len(value))
+    return None
+
+
+def _container(value: Any, rendered: list[tuple[Any, dict]], path: tuple) -> dict:
+    if isinstance(value, dict):
+        rendering = {"type": "dict", "value": {k: r for k, r in rendered}}
+    else:
+        rendering = {"type": type(value).__name__, "value": [r for _, r in rendered]}
+    if len(rendered) < min(len(value), MAX_ITEMS):
+        # The budget ran out part-way: keep what was rendered and a handle for the rest.
+        rendering["length"] = len(value)
+        rendering["handle"] = list(path)
+    return rendering
+
+
+def _safe_repr(value: Any, budget: RenderBudget | None = None, path: tuple = (), depth: int = 0) -> dict:
+    if budget is None:
+        budget = RenderBudget()
+    if not isinstance(value, _CONTAINER_TYPES):
+        return _render_leaf(value, budget, path)
+    collapsed = _collapsed(value, depth, budget, path)
+    if collapsed is not None:
+        return collapsed
+    rendered = []
+    for key, item in _children(value):
+        if budget.nodes <= 0:
+            break
+        rendered.append((key, _safe_repr(item, budget, path + (key,), depth + 1)))
+    return _container(value, rendered, path)
+
+
+def resolve_handle(local_vars: dict, return_value: Any, handle: list) -> Any:
+    # The value a handle points at; LookupError when it does not exist at this step.
+    # Set items are addressed by iteration order, which only repeats across runs for
+    # elements with deterministic hashes.
+    root = handle[0]
+    if root == RETURN_HANDLE:
+        value = return_value
+    elif root in local_vars and _is_traceable_var(root, local_vars[root]):
+        value = local_vars[root]
+    else:
+        raise LookupError(root)
+    for key in handle[1:]:
+        if not isinstance(value, _CONTAINER_TYPES):
+            raise LookupError(key)
+        children = dict(_children(value))
+        if key not in children:
+            raise LookupError(key)
+        value = children[key]
+    return value
 
 
 def _is_traceable_var(name: str, value: Any) -> bool:
@@ -43,20 +176,233 @@ def _is_traceable_var(name: str, value: Any) -> bool:
 
 
 def _snapshot_locals(local_vars: dict) -> dict:
+    budget = RenderBudget()
     return {
-        name: _safe_repr(value)
+        name: _safe_repr(value, budget, (name,))
         for name, value in local_vars.items()
         if _is_traceable_var(name, value)
     }
 
 
+_SCALAR_TYPES = (type(None), bool, int, float, str)
+
+
+class SnapshotRenderer:
+    # Memoizes _safe_repr output per live object. A container is re-rendered only when
+    # its fingerprint (type, length and child fingerprints) changes; otherwise the
+    # previous rendering is returned as-is, so unchanged subtrees are shared between
+    # steps. Renderings are never mutated after creation, which makes sharing safe.
+    # Whatever was cut off by the step's budget carries its path in the fingerprint, since
+    # the handle in its rendering depends on where the value was reached from.
+
+    def __init__(self):
+        # id(obj) -> (obj, fingerprint, rendering); holding obj keeps its id from being reused.
+        self._memo: dict[int, tuple[Any, Any, dict]] = {}
+        self._active: set[int] = set()
+        self.budget = RenderBudget()
+
+    def render(self, value: Any, path: tuple = (RETURN_HANDLE,)) -> dict:
+        return self._render(value, path, 0)[1]
+
+    def _render(self, value: Any, path: tuple, depth: int) -> tuple[Any, dict]:
+        value_type = type(value)
+        if not isinstance(value, _CONTAINER_TYPES):
+            rendering = _render_leaf(value, self.budget, path)
+            if "handle" in rendering:
+                return ("handle", path, rendering["value"], rendering.get("length")), rendering
+            if value_type in _SCALAR_TYPES:
+                return (value_type, value), rendering
+            # Arbitrary objects may change their repr without any visible fingerprint.
+            return object(), rendering
+
+        key = id(value)
+        if key in self._active:
+            return ("cycle", key), {"type": value_type.__name__, "value": "<cycle>"}
+        collapsed = _collapsed(value, depth, self.budget, path)
+        if collapsed is not None:
+            return ("handle", path, value_type, len(value)), collapsed
+
+        budget = self.budget
+        self._active.add(key)
+        try:
+            rendered_items = []
+            for child, item in _children(value):
+                if budget.nodes <= 0:
+                    break
+                item_type = type(item)
+                if item_type in _SMALL_TYPES or (item_type is int and -_SMALL_INT < item < _SMALL_INT):
+                    # Inline the leaf fast path: most items are small scalars.
+                    if budget.take(_NODE_BYTES):
+                        rendered_items.append((child, ((item_type, item), {"type": item_type.__name__, "value": item})))
+                        continue
+                rendered_items.append((child, self._render(item, path + (child,), depth + 1)))
+        finally:
+            self._active.discard(key)
+        fingerprint = (value_type, len(value), tuple((child, fp) for child, (fp, _) in rendered_items))
+        if len(rendered_items) < min(len(value), MAX_ITEMS):
+            fingerprint += (path,)
+
+        cached = self._memo.get(key)
+        if cached is not None and cached[0] is value and cached[1] == fingerprint:
+            return fingerprint, cached[2]
+
+        rendering = _container(value, [(child, r) for child, (_, r) in rendered_items], path)
+        self._memo[key] = (value, fingerprint, rendering)
+        return fingerprint, rendering
+
+    def snapshot(self, local_vars: dict) -> dict:
+        # A fresh budget per step; a return value rendered after the snapshot shares it.
+        self.budget = RenderBudget()
+        return {
+            name: self.render(value, (name,))
+            for name, value in local_vars.items()
+            if _is_traceable_var(name, value)
+        }
+
+
+class HeapRenderer:
+    # Renders locals against a heap table: containers and other objects are stored
+    # once under a stable heap id and referenced as {"ref": id}; scalars stay inline.
+    # Each snapshot collects only the heap objects whose shallow rendering changed,
+    # so aliasing and cycles are represented exactly and memory tracks mutations.
+    # Containers cut off by the step's budget stay inline as handles instead of refs.
+
+    def __init__(self):
+        # id(obj) -> (obj, heap id, version, shallow rendering)
+        self._objects: dict[int, tuple[Any, str, int, dict]] = {}
+        self._changed: dict[str, dict] = {}
+        # id(obj) -> heap id of the objects already rendered in this snapshot.
+        self._visited: dict[int, str] = {}
+        self._next_id = 1
+        self.budget = RenderBudget()
+
+    def render(self, value: Any, path: tuple = (RETURN_HANDLE,)) -> dict:
+        self._visited = {}
+        return self._render(value, path, 0)
+
+    def _render(self, value: Any, path: tuple, depth: int) -> dict:
+        if type(value) in _SCALAR_TYPES:
+            return _render_leaf(value, self.budget, path)
+
+        key = id(value)
+        if key in self._visited:
+            return {"ref": self._visited[key]}
+        entry = self._objects.get(key)
+        if entry is not None and entry[0] is not value:
+            entry = None
+        if isinstance(value, _CONTAINER_TYPES):
+            collapsed = _collapsed(value, depth, self.budget, path)
+            if collapsed is not None:
+                return collapsed
+        if entry is not None:
+            heap_id = entry[1]
+        else:
+            heap_id = str(self._next_id)
+            self._next_id += 1
+        self._visited[key] = heap_id
+
+        if isinstance(value, _CONTAINER_TYPES):
+            budget = self.budget
+            rendered = []
+            for child, item in _children(value):
+                if budget.nodes <= 0:
+                    break
+                item_type = type(item)
+                if item_type in _SMALL_TYPES or (item_type is int and -_SMALL_INT < item < _SMALL_INT):
+                    if budget.take(_NODE_BYTES):
+                        rendered.append((child, {"type": item_type.__name__, "value": item}))
+                        continue
+                rendered.append((child, self._render(item, path + (child,), depth + 1)))
+            shallow = _container(value, rendered, path)
+        else:
+            shallow = _render_leaf(value, self.budget, path)
+
+        if entry is None or entry[3] != shallow:
+            version = entry[2] + 1 if entry is not None else 1
+            self._objects[key] = (value, heap_id, version, shallow)
+            self._changed[heap_id] = dict(shallow, version=version)
+        return {"ref": heap_id}
+
+    def snapshot(self, local_vars: dict) -> dict:
+        self._visited = {}
+        self.budget = RenderBudget()
+        return {
+            name: self._render(value, (name,), 0)
+            for name, value in local_vars.items()
+            if _is_traceable_var(name, value)
+        }
+
+    def take_changes(self) -> dict:
+        changed, self._changed = self._changed, {}
+        return changed
+
+
+class HeapExpander:
+    # Turns heap-format steps back into inline ones, one at a time, keeping the heap table
+    # built from the steps seen so far. Changes are diffed again on the expanded values, per
+    # frame as ExecutionTracer does: a mutated object keeps its ref, so the heap step's own
+    # changes miss it.
+
+    def __init__(self):
+        self.heap: dict[str, dict] = {}
+        # Expanded locals of the last step in each active frame.
+        self._frames: list[dict] = []
+
+    def resolve(self, value: Any, active: frozenset = frozenset()) -> Any:
+        if not isinstance(value, dict):
+            return value
+        if "ref" in value:
+            heap_id = value["ref"]
+            obj = self.heap.get(heap_id)
+            if obj is None or heap_id in active:
+                return {"type": obj["type"] if obj else "object", "value": "<cycle>"}
+            inner = active | {heap_id}
+            contents = obj["value"]
+            if isinstance(contents, list):
+                contents = [self.resolve(item, inner) for item in contents]
+            elif isinstance(contents, dict):
+                contents = {k: self.resolve(v, inner) for k, v in contents.items()}
+            # Keep "length" and "handle" of values cut off by the rendering budget.
+            return {**{k: v for k, v in obj.items() if k != "version"}, "value": contents}
+        return value
+
+    def step(self, step: dict) -> dict:
+        resolve = self.resolve
+        self.heap.update(step.get("heap", {}))
+        step = {k: v for k, v in step.items() if k != "heap"}
+        if step["event"] == "call":
+            self._frames.append({})
+        variables = {name: resolve(v) for name, v in step["variables"].items()}
+        step["variables"] = variables
+        step["changes"] = _diff_variables(self._frames[-1] if self._frames else {}, variables)
+        cf = step.get("control_flow")
+        if cf and "return_value" in cf:
+            step["control_flow"] = dict(cf, return_value=resolve(cf["return_value"]))
+        if step["event"] == "return":
+            if self._frames:
+                self._frames.pop()
+        elif self._frames:
+            self._frames[-1] = variables
+        return step
+
+
+def expand_heap_trace(trace: dict) -> dict:
+    if trace.get("format") != "heap":
+        return trace
+
+    expander = HeapExpander()
+    expanded = {k: v for k, v in trace.items() if k != "format"}
+    expanded["steps"] = [expander.step(step) for step in trace["steps"]]
+    return expanded
+
+
 def _diff_variables(prev: dict, curr: dict) -> dict:
     changes = {"created": {}, "updated": {}, "deleted": {}}
 
     for name, val in curr.items():
         if name not in prev:
             changes["created"][name] = val
-        elif prev[name] != val:
+        elif prev[name] is not val and prev[name] != val:
             changes["updated"][name] = {"from": prev[name], "to": val}
 
     for name in prev:
@@ -68,13 +414,79 @@ def _diff_variables(prev: dict, curr: dict) -> dict:
 
 class ExecutionTracer:
     MAX_STEPS = 500
+    MAX_BUDGET = 5000
+    # Iterations traced at the start of each loop in sampling mode.
+    SAMPLE_ITERATIONS = 2
+
+    TRACE_FORMATS = ("inline", "heap")
 
-    def __init__(self, source_code: str):
+    def __init__(
+        self,
+        source_code: str,
+        trace_format: str = "inline",
+        on_step=None,
+        keep_steps: bool = True,
+        backend: str | None = None,
+        budget: int | None = None,
+        sampling: bool = False,
+        line_index: dict[int, dict] | None = None,
+        profile: bool = False,
+        inspect: tuple[int, list] | None = None,
+        with_profile: bool = False,
+    ):
+        if trace_format not in self.TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format: {trace_format}")
+        backend = backend or TRACER_BACKEND
+        if backend not in TRACER_BACKENDS:
+            raise ValueError(f"Unknown tracer backend: {backend}")
+        self.backend = "monitoring" if backend != "settrace" and _monitoring is not None else "settrace"
         self.source_code = source_code
         self.source_lines = source_code.splitlines()
         self.steps: list[dict] = []
-        self.prev_snapshot: dict = {}
+        self.step_count = 0
+        # Streaming consumers receive each step as it is produced and may turn off keep_steps
+        # so the tracer holds no history.
+        self.on_step = on_step
+        self.keep_steps = keep_steps
+        self.trace_format = trace_format
+        self.renderer = HeapRenderer() if trace_format == "heap" else SnapshotRenderer()
+        # Previous snapshot of each active frame, innermost last, so a caller's
+        # next step is diffed against its own state rather than the callee's.
+        self.snapshot_stack: list[dict] = []
         self.call_stack: list[str] = []
+        # Without sampling, tracing stops at the budget. With it, the program runs to the
+        # end: loops are sampled, and past the budget steps are only counted. Counted steps
+        # are not rendered; they are recorded as an Elision on the next kept step.
+        self.budget = min(budget or self.MAX_STEPS, self.MAX_BUDGET)
+        # Profiling records no steps at all, only per-line costs, and also runs to the end.
+        # with_profile records steps as usual and profiles the same run up to the budget.
+        self.profiler = LineProfiler() if profile or with_profile else None
+        self.profile_only = profile
+        self.sampling = sampling and not profile
+        self.bounded = not (sampling or profile)
+        # Inspecting runs to the given step and renders only the value a handle points at,
+        # with a fresh budget; the steps before it are only counted, so sampled traces'
+        # step numbers past MAX_BUDGET can be reached too.
+        self.inspect = inspect
+        self.inspected: dict | None = None
+        if inspect is not None:
+            self.budget = inspect[0]
+            self.profiler = None
+            self.profile_only = False
+            self.sampling = False
+            self.bounded = True
+        self.kept = 0
+        self.loops: list[LoopSampler] = []
+        self.line_index = build_line_index(source_code) if line_index is None else line_index
+        self.loop_spans = loop_spans(self.line_index) if sampling else {}
+        self.exhausted = False
+        self.tail = Elision()
+        self.module_code = None
+        self._on_event = self._record_profiled if self.profiler is not None and not profile else self._record
+        # Snapshot/diff time is only measured when the request is being instrumented.
+        self.timed = metrics.current() is not None
+        self.snapshot_seconds = 0.0
+        self.diff_seconds = 0.0
 
     def _get_source_line(self, lineno: int) -> str:
         if 1 <= lineno <= len(self.source_lines):
@@ -82,18 +494,52 @@ class ExecutionTracer:
         return ""
 
     def _trace_callback(self, frame, event, arg):
-        if len(self.steps) >= self.MAX_STEPS:
+        if self.bounded and self.step_count >= self.budget:
             return None
 
         if frame.f_code.co_filename != "<user_code>":
             return self._trace_callback
 
+        self._on_event(frame, event, arg)
+        return self._trace_callback
+
+    def _record(self, frame, event: str, arg) -> None:
+        if self.inspect is not None:
+            self._inspect_step(frame, event, arg)
+            return
+        if self.profile_only:
+            self.step_count += 1
+            self.profiler.event(frame, event)
+            return
+
         lineno = frame.f_lineno
-        curr_snapshot = _snapshot_locals(frame.f_locals)
-        var_changes = _diff_variables(self.prev_snapshot, curr_snapshot)
+        if self.sampling:
+            if self.exhausted and self.loops:
+                self._finish_loops(self.loops)
+            if self.exhausted and not (event == "return" and frame.f_code is self.module_code):
+                self._count_only(frame, event)
+                return
+            self._track_loops(frame, event, lineno)
+            if not self._tracing():
+                self._count_only(frame, event)
+                return
+
+        if event == "call":
+            self.snapshot_stack.append({})
+        prev_snapshot = self.snapshot_stack[-1] if self.snapshot_stack else {}
+        if self.timed:
+            started = time.perf_counter()
+            curr_snapshot = self.renderer.snapshot(frame.f_locals)
+            snapshotted = time.perf_counter()
+            var_changes = _diff_variables(prev_snapshot, curr_snapshot)
+            self.snapshot_seconds += snapshotted - started
+            self.diff_seconds += time.perf_counter() - snapshotted
+        else:
+            curr_snapshot = self.renderer.snapshot(frame.f_locals)
+            var_changes = _diff_variables(prev_snapshot, curr_snapshot)
 
         step = {
-            "step": len(self.steps) + 1,
+            "step": self.step_count + 1,
             "event": event,
             "line_number": lineno,
             "source_line": self._get_source_line(lineno),
@@ -114,7 +560,7 @@ class ExecutionTracer:
             step["control_flow"] = {
                 "type": "function_return",
                 "function": func_name,
-                "return_value": _safe_repr(arg),
+                "return_value": self.renderer.render(arg),
             }
             if self.call_stack:
                 self.call_stack.pop()
@@ -126,17 +572,221 @@ class ExecutionTracer:
                 "exception_message": str(exc_value),
             }
         elif event == "line":
-            source = step["source_line"].strip()
-            if source.startswith(("if ", "elif ")):
-                step["control_flow"] = {"type": "conditional", "expression": source}
-            elif source.startswith(("for ", "while ")):
-                step["control_flow"] = {"type": "loop", "expression": source}
-            elif source.startswith("return"):
-                step["control_flow"] = {"type": "return_statement", "expression": source}
-
-        self.steps.append(step)
-        self.prev_snapshot = copy.deepcopy(curr_snapshot)
-        return self._trace_callback
+            info = self.line_index.get(lineno)
+            if info is not None:
+                step["control_flow"] = {"type": info["kind"], "expression": info["expression"]}
+
+        if self.trace_format == "heap":
+            step["heap"] = self.renderer.take_changes()
+
+        self.step_count += 1
+        for loop in self.loops:
+            loop.traced = True
+        if self.exhausted:
+            self._store(step)
+        else:
+            self.emit(step)
+        if event == "return":
+            if self.snapshot_stack:
+                self.snapshot_stack.pop()
+        elif self.snapshot_stack:
+            self.snapshot_stack[-1] = curr_snapshot
+
+    def _record_profiled(self, frame, event: str, arg) -> None:
+        # The step's snapshot and diff are left out of the line costs, and profiling ends
+        # with the last step the budget allows, so the profile covers exactly the trace.
+        profiler = self.profiler
+        profiler.event(frame, event)
+        profiler.pause()
+        self._record(frame, event, arg)
+        profiler.resume()
+        if self.bounded and self.step_count >= self.budget:
+            profiler.stop()
+
+    def _inspect_step(self, frame, event: str, arg) -> None:
+        self.step_count += 1
+        step, handle = self.inspect
+        if self.step_count != step or (handle[0] == RETURN_HANDLE and event != "return"):
+            return
+        try:
+            value = resolve_handle(frame.f_locals, arg, handle)
+        except LookupError:
+            return
+        # An expanded string or repr may use the whole byte budget, not just the per-value cap.
+        self.inspected = _safe_repr(value, RenderBudget(max_string=RENDER_MAX_BYTES), tuple(handle))
+
+    def emit(self, step: dict) -> None:
+        if self.exhausted:
+            self.tail.add_step(step)
+            return
+        self._store(step)
+        if self.sampling and self.kept >= self.budget:
+            self.exhausted = True
+
+    def _store(self, step: dict) -> None:
+        if self.tail.steps:
+            self.tail.attach(step)
+            self.tail = Elision()
+        self.kept += 1
+        if self.keep_steps:
+            self.steps.append(step)
+        if self.on_step is not None:
+            self.on_step(step)
+
+    def _count_only(self, frame, event: str) -> None:
+        self.step_count += 1
+        self.tail.count(self.step_count)
+        if event == "call":
+            self.snapshot_stack.append({})
+            self.call_stack.append(frame.f_code.co_name)
+        elif event == "return":
+            if self.snapshot_stack:
+                self.snapshot_stack.pop()
+            if self.call_stack:
+                self.call_stack.pop()
+
+    def _tracing(self) -> bool:
+        for loop in self.loops:
+            if not loop.tracing:
+                return False
+        return True
+
+    def _finish_loops(self, loops: list[LoopSampler]) -> None:
+        while loops:
+            self._end_loop(loops.pop())
+
+    def _end_loop(self, loop: LoopSampler) -> None:
+        if loop.finish():
+            self.tail.add_iteration(loop.header)
+
+    def _track_loops(self, frame, event: str, lineno: int) -> None:
+        loops = self.loops
+        if event == "return":
+            # Leaving the frame (or yielding from it) ends its loops.
+            ending = []
+            while loops and loops[-1].frame is frame:
+                ending.insert(0, loops.pop())
+            self._finish_loops(ending)
+            return
+        if event != "line":
+            return
+
+        while loops and loops[-1].frame is frame and not loops[-1].contains(lineno):
+            self._end_loop(loops.pop())
+        if loops and loops[-1].frame is frame and loops[-1].header == lineno:
+            if loops[-1].next_iteration():
+                self.tail.add_iteration(lineno)
+        elif lineno in self.loop_spans:
+            loop = LoopSampler(frame, lineno, self.loop_spans[lineno], self.SAMPLE_ITERATIONS)
+            loop.next_iteration()
+            loops.append(loop)
+
+        for loop in reversed(loops):
+            if loop.frame is not frame:
+                break
+            loop.add_line(lineno)
+
+    # sys.monitoring callbacks run directly on top of the monitored frame, hence _getframe(1).
+    # Local events are only enabled on user code objects, so no filename check is needed.
+
+    def _monitor(self, frame, event: str, arg):
+        if self.bounded and self.step_count >= self.budget:
+            return _monitoring.DISABLE
+        self._on_event(frame, event, arg)
+        return None
+
+    def _monitor_start(self, code, offset):
+        return self._monitor(sys._getframe(1), "call", None)
+
+    def _monitor_return(self, code, offset, value):
+        return self._monitor(sys._getframe(1), "return", value)
+
+    # RAISE and PY_UNWIND can only be enabled globally (and cannot be DISABLEd), so these
+    # two filter on the user code objects themselves.
+
+    def _monitor_unwind(self, code, offset, exc):
+        if code in self._user_codes:
+            self._monitor(sys._getframe(1), "return", None)
+
+    def _monitor_raise(self, code, offset, exc):
+        if code in self._user_codes:
+            self._monitor(sys._getframe(1), "exception", (type(exc), exc, exc.__traceback__))
+
+    def _monitor_line(self, code, line):
+        return self._monitor(sys._getframe(1), "line", None)
+
+    def _monitor_jump(self, code, source, destination):
+        # LINE only fires when the line changes; settrace also reports a backward jump that
+        # stays on one line (a single-line loop), so mirror that here.
+        if destination > source:
+            return _monitoring.DISABLE
+        lines = self._line_tables.get(code)
+        if lines is None:
+            lines = self._line_tables[code] = list(code.co_lines())
+        source_line = destination_line = None
+        for start, end, line in lines:
+            if start <= source < end:
+                source_line = line
+            if start <= destination < end:
+                destination_line = line
+        if source_line != destination_line:
+            return _monitoring.DISABLE
+        return self._monitor(sys._getframe(1), "line", None)
+
+    def _exec_monitored(self, compiled, exec_globals: dict) -> bool:
+        tool = _monitoring.DEBUGGER_ID
+        try:
+            _monitoring.use_tool_id(tool, "ai-code-explainer")
+        except ValueError:
+            # Another tool (or a concurrent tracer in this process) holds the slot.
+            return False
+
+        events = _monitoring.events
+        local_callbacks = {
+            events.PY_START: self._monitor_start,
+            events.PY_RESUME: self._monitor_start,
+            events.PY_RETURN: self._monitor_return,
+            events.PY_YIELD: self._monitor_return,
+            events.LINE: self._monitor_line,
+            events.JUMP: self._monitor_jump,
+        }
+        global_callbacks = {
+            events.PY_UNWIND: self._monitor_unwind,
+            events.RAISE: self._monitor_raise,
+        }
+        callbacks = {**local_callbacks, **global_callbacks}
+        for event, callback in callbacks.items():
+            _monitoring.register_callback(tool, event, callback)
+
+        codes = [compiled]
+        for code in codes:
+            codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+        self._user_codes = set(codes)
+        self._line_tables = {}
+        local_mask = sum(local_callbacks)
+        try:
+            for code in codes:
+                _monitoring.set_local_events(tool, code, local_mask)
+            _monitoring.set_events(tool, sum(global_callbacks))
+            exec(compiled, exec_globals)
+        finally:
+            _monitoring.set_events(tool, 0)
+            for code in codes:
+                _monitoring.set_local_events(tool, code, 0)
+            for event in callbacks:
+                _monitoring.register_callback(tool, event, None)
+            _monitoring.free_tool_id(tool)
+            # Locations silenced with DISABLE stay silenced until restarted.
+            _monitoring.restart_events()
+        return True
+
+    def _exec_settrace(self, compiled, exec_globals: dict) -> None:
+        old_trace = sys.gettrace()
+        try:
+            sys.settrace(self._trace_callback)
+            exec(compiled, exec_globals)
+        finally:
+            sys.settrace(old_trace)
 
     def run(self, exec_globals: dict | None = None, compiled_code=None) -> dict:
         if compiled_code is not None:
@@ -149,23 +799,42 @@ class ExecutionTracer:
 
         error = None
         completed = True
+        self.module_code = compiled
 
-        old_trace = sys.gettrace()
+        if self.profiler is not None:
+            self.profiler.start()
         try:
-            sys.settrace(self._trace_callback)
-            exec(compiled, exec_globals)
+            if self.backend != "monitoring" or not self._exec_monitored(compiled, exec_globals):
+                self._exec_settrace(compiled, exec_globals)
         except Exception as e:
             error = {"type": type(e).__name__, "message": str(e)}
             completed = False
         finally:
-            sys.settrace(old_trace)
+            if self.profiler is not None:
+                self.profiler.stop()
+        # Tracing can stop with loops still buffered, e.g. when the time limit hits.
+        self._finish_loops(self.loops)
 
-        return {
+        if self.timed:
+            metrics.add_time("snapshot", self.snapshot_seconds)
+            metrics.add_time("diff", self.diff_seconds)
+            metrics.count("steps", self.step_count)
+
+        result = {
             "source": self.source_code,
             "source_lines": self.source_lines,
             "steps": self.steps,
-            "step_count": len(self.steps),
+            "step_count": self.step_count,
             "completed": completed,
             "error": error,
-            "truncated": len(self.steps) >= self.MAX_STEPS,
+            "truncated": self.bounded and self.step_count >= self.budget,
         }
+        if self.profiler is not None:
+            result["profile"] = self.profiler.table()
+        if self.sampling:
+            result["elided_steps"] = self.step_count - self.kept
+        if self.inspect is not None:
+            result["inspected"] = self.inspected
+        if self.trace_format != "inline":
+            result["format"] = self.trace_format
+        return result